@@ -1,7 +1,9 @@
-from random import randint, randrange
-from color import gradient_wheel, random_color
-from math import sqrt, sin, pi
-from time import time
+from randoms import random, randint, randrange
+from color import random_color, is_packed, unpack_hsv
+from pixel import BLACK
+from math import sqrt, sin, pi, ceil
+import clock
+import numpy as np
 
 #
 # Constants
@@ -18,12 +20,12 @@ MIN_DIM = 64
 #
 def one_in(chance):
     """Random chance. True if 1 in Number"""
-    return randint(1, chance) == 1
+    return random() * chance < 1
 
 
 def plus_or_minus():
     """Return either 1 or -1"""
-    return (randint(0,1) * 2) - 1
+    return 1 if random() < 0.5 else -1
 
 
 def up_or_down(value, amount, min, max):
@@ -33,7 +35,7 @@ def up_or_down(value, amount, min, max):
 
 
 def get_true_or_false():
-    return randint(0, 1) == 1
+    return random() < 0.5
 
 
 def inc(value, increase, min, max):
@@ -88,7 +90,8 @@ def byte_clamp(value, wrap=False):
     if wrap:
         return int(value) % 255
     else:
-        return max([ min([int(value), 255]), 0])
+        value = int(value)
+        return 255 if value > 255 else (0 if value < 0 else value)
 
 
 #
@@ -107,21 +110,35 @@ def calc_packet(x, max_x, fract_x=0.8, smooth=True):
     return int(255 * fract)
 
 
+def calc_packets(x, max_x, fract_x=0.8, smooth=True):
+    """calc_packet() of a whole array of x. Returns an int array of 0-255"""
+    assert 0.0 <= fract_x <= 1.0, "{} must be between 0-1".format(fract_x)
+    x = np.asarray(x, dtype=np.float64)
+    min_x = max_x * fract_x
+    if min_x == max_x:
+        return np.where(x > max_x, 255, 0)  # as calc_packet: x <= min_x is 0 first
+    fract = np.clip((x - min_x) / (max_x - min_x), 0.0, 1.0)
+    if smooth:
+        fract = np.sin(fract * pi * 0.5)
+    return (255 * fract).astype(np.int64)
+
+
 def smooth_interpolation(x):
     """Smooth a 0.0-1.0 interpolation by a sine wave"""
     assert 0.0 <= x <= 1.0, "{} must be between 0-1".format(x)
     return sin(x * pi * 0.5)
 
 
-def get_bpm_circle(bpm):
-    """Return a float 0.0-1.0 circle"""
+def get_bpm_circle(bpm, now=None):
+    """Return a float 0.0-1.0 circle. now defaults to the show clock's time"""
     whole_beat_time = 60.0 / bpm
-    return (time() % whole_beat_time) / whole_beat_time
+    now = clock.time() if now is None else now
+    return (now % whole_beat_time) / whole_beat_time
 
 
-def get_bpm_wave(bpm):
+def get_bpm_wave(bpm, now=None):
     """Return an oscillating 0.0-1.0 wave"""
-    return sin(pi * get_bpm_circle(bpm))
+    return sin(pi * get_bpm_circle(bpm, now))
 
 
 def oscillate(min_x, max_x, bpm):
@@ -151,6 +168,116 @@ def min_dim(value):
     return int((value * (255 - MIN_DIM) / 255) + MIN_DIM)
 
 
+def min_dims(values):
+    """min_dim() of an int array of 0-255 values"""
+    return (values * (255 - MIN_DIM)) // 255 + MIN_DIM
+
+
+#
+# Lookup tables of the frequency functions
+#
+TABLE_RESOLUTION = 1024  # steps of the 0.0-1.0 fraction
+
+
+def packet_error(resolution=TABLE_RESOLUTION):
+    """Most a table packet can differ from calc_packet(): 1 for resolution >= 402"""
+    return int(ceil(255 * pi / 2 / resolution))
+
+
+def smooth_error(resolution=TABLE_RESOLUTION):
+    """Most a table smooth can differ from smooth_interpolation()"""
+    return pi / 2 / resolution
+
+
+PACKET_ERROR = packet_error()  # lut_packet(s) are never further than this from calc_packet(s)
+SMOOTH_ERROR = smooth_error()  # lut_smooth(s) from smooth_interpolation()
+MIN_DIM_ERROR = 0  # lut_min_dim(s) are exact
+
+
+class ShapeTables(object):
+    """
+    calc_packet(), smooth_interpolation() and min_dim() read from tables
+
+    The fraction of the way from min_x to max_x is rounded down to one of
+    resolution steps, so the tables never give more than the functions, and
+    at most (see packet_error and smooth_error):
+        packet(): ceil(255 * pi / 2 / resolution) below calc_packet(),
+                  1 for resolution >= 402 (unsmoothed: ceil(255 / resolution))
+        smooth(): pi / 2 / resolution below smooth_interpolation()
+        min_dim(): exact, for ints 0-255
+    error() measures these against the functions.
+    """
+    def __init__(self, resolution=TABLE_RESOLUTION):
+        self.resolution = resolution
+        fract = np.arange(resolution + 1) / float(resolution)
+        self.smooth_array = np.sin(fract * pi * 0.5)
+        self.packet_arrays = {True: (255 * self.smooth_array).astype(np.int64),
+                              False: (255 * fract).astype(np.int64)}
+        self.min_dim_array = min_dims(np.arange(256))
+
+        # Lists for the scalar lookups: indexing a list beats indexing an array
+        self.smooth_list = self.smooth_array.tolist()
+        self.packet_lists = dict((smooth, table.tolist()) for (smooth, table) in self.packet_arrays.items())
+        self.min_dim_list = self.min_dim_array.tolist()
+
+    def packet(self, x, max_x, fract_x=0.8, smooth=True):
+        """calc_packet() from the table"""
+        min_x = max_x * fract_x
+        if x <= min_x:
+            return 0
+        if x >= max_x:
+            return 255
+        return self.packet_lists[smooth][int(self.resolution * (x - min_x) / (max_x - min_x))]
+
+    def packets(self, x, max_x, fract_x=0.8, smooth=True):
+        """calc_packets() from the table: an int array of 0-255"""
+        x = np.asarray(x, dtype=np.float64)
+        min_x = max_x * fract_x
+        if min_x == max_x:
+            return np.where(x > max_x, 255, 0)  # as calc_packet: x <= min_x is 0 first
+        steps = np.clip(self.resolution * (x - min_x) / (max_x - min_x), 0, self.resolution)
+        return self.packet_arrays[smooth][steps.astype(np.intp)]
+
+    def smooth(self, x):
+        """smooth_interpolation() of a 0.0-1.0 x from the table"""
+        return self.smooth_list[int(self.resolution * x)]
+
+    def smooths(self, x):
+        """smooth() of an array of 0.0-1.0 x"""
+        return self.smooth_array[(np.asarray(x) * self.resolution).astype(np.intp)]
+
+    def min_dim(self, value):
+        """min_dim() of an int 0-255 from the table"""
+        return self.min_dim_list[value]
+
+    def min_dims(self, values):
+        """min_dim() of an int array of 0-255 values from the table"""
+        return self.min_dim_array[values]
+
+    def error(self, samples=100001):
+        """Largest difference between each table and its function, over samples x from 0.0 to 1.0"""
+        x = np.linspace(0.0, 1.0, samples)
+        values = np.arange(256)
+        errors = {'smooth': float(np.max(np.abs(np.sin(x * pi * 0.5) - self.smooths(x)))),
+                  'min_dim': int(np.max(np.abs(min_dims(values) - self.min_dims(values))))}
+        for fract_x in (0.1, 0.5, 0.6, 0.8):
+            for smooth in (True, False):
+                exact = np.array([calc_packet(value, 1.0, fract_x, smooth) for value in x.tolist()])
+                name = 'packet' if smooth else 'linear_packet'
+                error = int(np.max(np.abs(exact - self.packets(x, 1.0, fract_x, smooth))))
+                errors[name] = max(errors.get(name, 0), error)
+        return errors
+
+
+_tables = ShapeTables()
+lut_packet = _tables.packet
+lut_packets = _tables.packets
+lut_smooth = _tables.smooth
+lut_smooths = _tables.smooths
+lut_min_dim = _tables.min_dim
+lut_min_dims = _tables.min_dims
+
+
 #
 # Distance Functions
 #
@@ -165,97 +292,123 @@ def distance(coord1, coord2):
 # Fader class and its collection: the Faders class
 #
 class Faders(object):
+    """
+    Fading pixels, kept as parallel arrays: pixel id, hue, saturation,
+    intensity, growing flag and rate. cycle_faders() draws and fades them
+    all with array operations and drops the dead ones at once.
+
+    Faders on the same pixel: the brightest is drawn, the later one on a tie.
+    """
     def __init__(self, treemodel):
         self.tree = treemodel
-        self.fader_array = []
-
-    def __del__(self):
-        del self.fader_array
+        self.ids = np.zeros(0, dtype=np.intp)
+        self.hues = np.zeros(0, dtype=np.int64)
+        self.sats = np.zeros(0, dtype=np.int64)
+        self.intense = np.zeros(0)
+        self.growing = np.zeros(0, dtype=bool)
+        self.change = np.zeros(0)
+        self.added = []  # (id, hue, sat, intense, growing, change) since the last cycle
 
     def add_fader(self, color, pos, intense=1.0, growing=False, change=0.25):
-        new_fader = Fader(self.tree, color, pos, intense, growing, change)
-        self.fader_array.append(new_fader)
+        pixel = self.tree.get_pixel(pos)
+        if pixel is None:
+            print("Can't find coord {}".format(pos))
+            return
+        if is_packed(color):
+            color = unpack_hsv(color)
+        self.added.append((pixel.id, color[0], color[1], intense, growing, change))
+
+    def _merge_added(self):
+        if not self.added:
+            return
+        ids, hues, sats, intense, growing, change = zip(*self.added)
+        self.added = []
+        self.ids = np.concatenate([self.ids, np.array(ids, dtype=np.intp)])
+        self.hues = np.concatenate([self.hues, np.array(hues, dtype=np.int64)])
+        self.sats = np.concatenate([self.sats, np.array(sats, dtype=np.int64)])
+        self.intense = np.concatenate([self.intense, np.array(intense, dtype=np.float64)])
+        self.growing = np.concatenate([self.growing, np.array(growing, dtype=bool)])
+        self.change = np.concatenate([self.change, np.array(change, dtype=np.float64)])
+
+    def _keep(self, alive):
+        self.ids = self.ids[alive]
+        self.hues = self.hues[alive]
+        self.sats = self.sats[alive]
+        self.intense = self.intense[alive]
+        self.growing = self.growing[alive]
+        self.change = self.change[alive]
 
     def cycle_faders(self, refresh=True):
+        """Draw the live faders, fade them, and black out and drop the dead ones"""
         if refresh:
             self.tree.black_all_cells()
-
-        # Draw, update, and kill all the faders
-        for f in self.fader_array:
-            if f.is_alive():
-                f.draw_fader()
-                f.fade_fader()
-            else:
-                f.black_cell()
-                self.fader_array.remove(f)
+        self._merge_added()
+
+        alive = self.intense > 0
+        if not alive.all():
+            dead = np.setdiff1d(self.ids[~alive], self.ids[alive])
+            self.tree.set_ids(dead, np.tile(BLACK, (len(dead), 1)))
+            self._keep(alive)
+
+        # Draw: v as gradient_wheel() gives it. Sorted by id, value and age,
+        # the last row of each id is its brightest (then latest) fader
+        values = (np.clip(self.intense, 0.0, 1.0) * 255).astype(np.int64)
+        order = np.lexsort((np.arange(len(values)), values, self.ids))
+        last = len(order) - 1 - np.unique(self.ids[order][::-1], return_index=True)[1]
+        drawn = order[last]
+        self.tree.set_ids(self.ids[drawn],
+                          np.stack([self.hues[drawn], self.sats[drawn], values[drawn]], axis=1))
+
+        # Fade
+        grow = self.growing.copy()
+        self.intense[grow] += self.change[grow]
+        full = grow & (self.intense > 1.0)
+        self.intense[full] = 1.0
+        self.growing[full] = False
+        self.intense[~grow] = np.maximum(self.intense[~grow] - self.change[~grow], 0.0)
 
     def num_faders(self):
-        return len(self.fader_array)
+        return len(self.ids) + len(self.added)
 
     def fade_all(self):
-        for f in self.fader_array:
-            f.black_cell()
-            self.fader_array.remove(f)  # Look for a delete object method
-
-
-class Fader(object):
-    def __init__(self, treemodel, color, pos, intense=1.0, growing=False, change=0.25):
-        self.tree = treemodel
-        self.pos = pos
-        self.color = color
-        self.intense = intense
-        self.growing = growing
-        self.decrease = change
-
-    def draw_fader(self):
-        self.tree.set_cell(self.pos, gradient_wheel(self.color, self.intense))
-
-    def fade_fader(self):
-        if self.growing:
-            self.intense += self.decrease
-            if self.intense > 1.0:
-                self.intense = 1.0
-                self.growing = False
-        else:
-            self.intense -= self.decrease
-            if self.intense < 0:
-                self.intense = 0
-
-    def is_alive(self):
-        return self.intense > 0
-
-    def black_cell(self):
-        self.tree.black_cell(self.pos)
+        """Black out every fader's pixel and drop them all"""
+        self._merge_added()
+        ids = np.unique(self.ids)
+        self.tree.set_ids(ids, np.tile(BLACK, (len(ids), 1)))
+        self._keep(np.zeros(len(self.ids), dtype=bool))
 
 
 class Branch(object):
+    """A walker that moves one pixel at a time along the tree's topology, by pixel id"""
     def __init__(self, treemodel, color, tree_speed, start_center=True):
         self.tree = treemodel
+        self.topology = treemodel.topology_lists
         self.color = color  # (h,s,v)
         self.tree_speed = tree_speed
-        self.coord = self.pick_center() if start_center else self.pick_edge()
+        self.id = self.pick_center() if start_center else self.pick_edge()
         self.moving_outward = start_center
 
     def pick_center(self):
         """Pick one of the trunks and start there"""
-        return [randint(0, self.tree.num_trunks - 1), 0]
+        return self.topology.segment_start[self.topology.trunks[randint(0, self.tree.num_trunks - 1)]]
 
     def pick_edge(self):
         """Pick the edge of a branch"""
-        coord = [randint(0, self.tree.num_trunks - 1)] + \
-                [randint(0, self.tree.num_branches - 1) for _ in range(self.tree.num_generations)] + \
-                [self.tree.get_generation_length(self.tree.num_generations) - 1]
-        return coord
+        segment = self.topology.trunks[randint(0, self.tree.num_trunks - 1)]
+        for _ in range(self.tree.num_generations):
+            segment = self.topology.segment_children[segment][randint(0, self.tree.num_branches - 1)]
+        return self.topology.segment_start[segment] + self.topology.segment_length[segment] - 1
 
     def get_coord(self):
         """Get the branch coord"""
-        return tuple(self.coord)
+        return self.tree.pixels[self.id].coord
+
+    def get_id(self):
+        return self.id
 
     def draw_branch_pixel(self):
         """Draw the single branch pixel"""
-        pixel = self.tree.get_pixel(tuple(self.coord))
-        assert pixel , "Cannot find a pixel at {}".format(self.coord)
-        pixel.set_color(self.color)
+        self.tree.pixels[self.id].set_color(self.color)
 
     def move_tree(self):
         if self.moving_outward:
@@ -264,45 +417,32 @@ class Branch(object):
             return self.move_tree_inward()
 
     def move_tree_outward(self):
-        end_coord = self.get_end_coord()
-        end_coord += 1
-        if end_coord < self.tree.get_generation_length(self.get_generation()) - 1:
-            self.set_end_coord(end_coord)
+        """Step along the branch, stopping short of its last pixel, then onto a random child branch"""
+        segment = self.topology.segment[self.id]
+        if self.id + 1 < self.topology.segment_start[segment] + self.topology.segment_length[segment] - 1:
+            self.id += 1
             return True
-        else:
-            generation = self.get_generation()
-            generation += 1
-            if generation < self.tree.num_generations + 1:
-                self.set_end_coord(randint(0, self.tree.num_branches - 1))
-                self.coord.append(0)
-                return True
-            return False
+        if self.topology.segment_gen[segment] < self.tree.num_generations:
+            child = self.topology.segment_children[segment][randint(0, self.tree.num_branches - 1)]
+            self.id = self.topology.segment_start[child]
+            return True
+        return False
 
     def move_tree_inward(self):
-        end_coord = self.get_end_coord()
-        end_coord -= 1
-        if end_coord > 0:
-            self.set_end_coord(end_coord)
+        """Step back along the branch, stopping short of its first pixel, then onto the parent's last pixel"""
+        segment = self.topology.segment[self.id]
+        if self.id - 1 > self.topology.segment_start[segment]:
+            self.id -= 1
             return True
-        else:
-            generation = self.get_generation()
-            generation -= 1
-            if generation >= 0:
-                self.coord = self.coord[:-1]  # Lop off furthest branch
-                self.set_end_coord(self.tree.get_generation_length(self.get_generation()) - 1)
-                return True
-            return False
+        parent = self.topology.segment_parent[segment]
+        if parent >= 0:
+            self.id = self.topology.segment_start[parent] + self.topology.segment_length[parent] - 1
+            return True
+        return False
 
     def switch_direction(self):
         self.moving_outward = not self.moving_outward
         self.color = random_color()
 
-    def get_end_coord(self):
-        return self.coord[len(self.coord) - 1]
-
-    def set_end_coord(self, value):
-        self.coord[len(self.coord) - 1] = value
-
     def get_generation(self):
-        return len(self.coord) - 2
-
+        return self.topology.segment_gen[self.topology.segment[self.id]]
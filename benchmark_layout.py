@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+Render and encode cost as the layout grows from one tree to ~100k pixels
+
+For each layout (standard trees on a grid, see geometry.grid_layout):
+    grow      build the geometry and a Tree on it
+    pixel     one frame drawn with pixel.set_color(), as the generator shows do
+    render    one frame computed from the geometry columns and stored with
+              Tree.set_frame(), as render() shows do
+    ascii     diff + assemble an ascii frame
+    binary    diff + assemble a binary frame (ids are 16 bits: n/a past 65536 pixels)
+
+The frame is a radar sweep, so most pixels change every frame: the worst case.
+Nothing is sent; models assemble the frame and drop it.
+"""
+import time
+import numpy as np
+from math import pi
+from geometry import grow_geometry, grid_layout
+from HelperFunctions import calc_packets, calc_packet, min_dim, min_dims
+from model import protocol
+from model.simulator import SimulatorModel
+from tree import Tree
+
+TWO_PI = 2 * pi
+
+
+class OfflineModel(SimulatorModel):
+    """SimulatorModel that assembles frames, counts their bytes and drops them"""
+    def __init__(self, protocol=protocol.ASCII):
+        self.bytes = 0
+        super(OfflineModel, self).__init__('localhost', 0, protocol=protocol)
+
+    def connect(self):
+        pass
+
+    def flush(self):
+        if self.is_binary():
+            self.assemble_binary_frame()
+        self.keyframe = False
+        self.bytes += len(self.buffer.take())
+
+
+def sweep(tree, frame, hsv):
+    """Radar-like frame from the geometry columns"""
+    angle = TWO_PI * (frame % 36) / 36.0
+    value = calc_packets(TWO_PI - np.abs(angle - tree.columns.theta), TWO_PI, fract_x=0.5)
+    hsv[:] = (frame % 255, 255, 0)
+    hsv[:, 2] = min_dims(value)
+    return hsv
+
+
+def sweep_pixels(tree, frame):
+    """The same frame, one pixel at a time"""
+    angle = TWO_PI * (frame % 36) / 36.0
+    for pixel in tree.all_pixels():
+        value = calc_packet(TWO_PI - abs(angle - pixel.theta), TWO_PI, fract_x=0.5)
+        pixel.set_color((frame % 255, 255, min_dim(value)))
+
+
+def timed(function, repeats):
+    """Average milliseconds per call"""
+    start = time.time()
+    for i in range(repeats):
+        function(i)
+    return 1000 * (time.time() - start) / repeats
+
+
+def benchmark(num_trees, frames):
+    start = time.time()
+    geometry = grow_geometry(trees=grid_layout(num_trees))
+    tree = Tree(None, geometry)
+    grow = 1000 * (time.time() - start)
+    hsv = np.zeros((tree.num_pixels, 3))
+
+    results = {'trees': num_trees, 'pixels': tree.num_pixels, 'grow': grow}
+    results['pixel'] = timed(lambda i: sweep_pixels(tree, i), max(1, frames // 10))
+    results['render'] = timed(lambda i: tree.set_frame(sweep(tree, i, hsv)), frames)
+
+    for name in (protocol.ASCII, protocol.BINARY):
+        if name != protocol.ASCII and tree.num_pixels > protocol.MAX_ID + 1:
+            results[name] = results[name + '_bytes'] = None
+            continue
+        tree.model = OfflineModel(name)
+
+        def encode(i):
+            tree.set_frame(sweep(tree, i, hsv))
+            tree.go()
+            tree.flush()
+        render = timed(lambda i: tree.set_frame(sweep(tree, i, hsv)), frames)
+        results[name] = timed(encode, frames) - render
+        results[name + '_bytes'] = tree.model.bytes / float(frames)
+    return results
+
+
+def show(value, form='{:9.2f}'):
+    return '{:>9}'.format('n/a') if value is None else form.format(value)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Tree layout render and encode benchmark')
+    parser.add_argument('--max-trees', type=int, default=83, help='largest layout (default 83 = 100,596 pixels)')
+    parser.add_argument('--frames', type=int, default=20, help='frames timed per measurement (default 20)')
+    args = parser.parse_args()
+
+    sizes = sorted(set([n for n in (1, 2, 4, 8, 16, 32, 54, 64) if n < args.max_trees] + [args.max_trees]))
+    print ("{:>6} {:>8} {:>9} {:>9} {:>9} {:>9} {:>9} {:>10}   (ms per frame, grow in ms)".format(
+        'trees', 'pixels', 'grow', 'pixel', 'render', 'ascii', 'binary', 'bin bytes'))
+    for num_trees in sizes:
+        r = benchmark(num_trees, args.frames)
+        print ("{:>6} {:>8} {} {} {} {} {} {}".format(r['trees'], r['pixels'], show(r['grow']), show(r['pixel']),
+                                                     show(r['render']), show(r['ascii']), show(r['binary']),
+                                                     show(r['binary_bytes'], '{:10.0f}')))
@@ -0,0 +1,90 @@
+"""
+Show clocks
+
+Shows and their helpers read the time from clock.time() and the runners
+wait with clock.sleep(), so the clock can be swapped:
+
+    RealClock       wall-clock time (the default)
+    ScaledClock     runs speed times faster (or slower) than real time
+    VirtualClock    stands still until sleep() moves it: no waiting at all,
+                    so a show renders at CPU speed and the same frames every run
+
+Each thread has its own clock (see use()), so the channels of dual_go.py
+can run on different clocks.
+"""
+import threading
+import time as _time
+
+
+class RealClock(object):
+    """Wall-clock time"""
+    def time(self):
+        return _time.time()
+
+    def sleep(self, seconds):
+        _time.sleep(seconds)
+
+
+class ScaledClock(object):
+    """Time that runs speed times as fast as real time, from start (default now)"""
+    def __init__(self, speed=1.0, start=None):
+        assert speed > 0, "speed {} must be above 0".format(speed)
+        self.speed = speed
+        self.real_start = _time.time()
+        self.start = self.real_start if start is None else start
+
+    def time(self):
+        return self.start + (_time.time() - self.real_start) * self.speed
+
+    def sleep(self, seconds):
+        _time.sleep(seconds / self.speed)
+
+
+class VirtualClock(object):
+    """Time that only moves when told to: sleep() returns at once, one delay later"""
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += max(0.0, seconds)
+
+    def set(self, now):
+        self.now = now
+
+
+REAL = RealClock()
+_local = threading.local()
+
+
+def current():
+    """The clock of this thread"""
+    return getattr(_local, 'clock', REAL)
+
+
+def use(clock=None):
+    """Make clock (default real time) the clock of this thread. Returns the previous one"""
+    previous = current()
+    _local.clock = clock or REAL
+    return previous
+
+
+def time():
+    """Seconds on this thread's clock"""
+    return current().time()
+
+
+def sleep(seconds):
+    """Wait seconds on this thread's clock"""
+    current().sleep(seconds)
+
+
+def make_clock(speed=1.0):
+    """Real clock for speed 1, scaled clock for other speeds, virtual clock for speed 0"""
+    if speed == 1:
+        return REAL
+    if speed <= 0:
+        return VirtualClock(_time.time())
+    return ScaledClock(speed)
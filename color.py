@@ -1,5 +1,7 @@
 import colorsys
-from random import random, randint
+import numbers
+from randoms import random, randint
+import numpy as np
 
 """
 Color
@@ -14,6 +16,16 @@ JULY 2019
 Consider rewriting this API to use less memory
 Remove unused functions
 Try to keep the surrounding API
+
+Colors can also be packed into one 24-bit int, 0xHHSSVV, or a uint32 array
+of them for a whole frame. Packing wraps the hue and clamps s and v once;
+Pixel, Tree and the models take packed colors as they are, and
+random_color, random_color_range and gradient_wheel hand them back packed.
+
+hsv_to_rgb_array / rgb_to_hsv_array convert whole (n, 3) frames with the
+same arithmetic as colorsys, so they give the same bytes as hsv_to_rgb /
+rgb_to_hsv. Fully saturated colors (nearly all of them) come from
+SATURATED_RGB, a (hue, value) table.
 """
 
 
@@ -37,6 +49,33 @@ def _byte_to_float_triple(triple):
     return _byte_to_float(triple[0]), _byte_to_float(triple[1]), _byte_to_float(triple[2])
 
 
+def pack_hsv(hsv):
+    """Pack an hsv[0-255] triple into a 24-bit int. Hue wraps at 255, s and v clamp to 0-255"""
+    s, v = int(hsv[1]), int(hsv[2])
+    s = 255 if s > 255 else (0 if s < 0 else s)
+    v = 255 if v > 255 else (0 if v < 0 else v)
+    return ((int(hsv[0]) % 255) << 16) | (s << 8) | v
+
+
+def unpack_hsv(packed):
+    """Unpack a 24-bit int into an hsv[0-255] triple"""
+    return (packed >> 16) & 0xff, (packed >> 8) & 0xff, packed & 0xff
+
+
+def pack_hsv_array(hsv):
+    """Pack an (n, 3) hsv array into n uint32s, wrapping and clamping like pack_hsv"""
+    hsv = np.trunc(hsv).astype(np.int64)
+    h = hsv[:, 0] % 255
+    sv = np.clip(hsv[:, 1:], 0, 255)
+    return ((h << 16) | (sv[:, 0] << 8) | sv[:, 1]).astype(np.uint32)
+
+
+def unpack_hsv_array(packed):
+    """Unpack n uint32s into an (n, 3) uint8 hsv array"""
+    packed = np.asarray(packed, dtype=np.uint32)
+    return np.stack([(packed >> 16) & 0xff, (packed >> 8) & 0xff, packed & 0xff], axis=1).astype(np.uint8)
+
+
 def rgb_to_hsv(rgb):
     """convert a rgb[0-255] tuple to hsv[0-255]"""
     _r, _g, _b = _byte_to_float_triple(rgb)
@@ -49,23 +88,93 @@ def hsv_to_rgb(hsv):
     return _float_to_byte_triple(colorsys.hsv_to_rgb(_h, _s, _v))
 
 
-def random_color(reds=False):
+# Which of (v, t, p, q) is r, g and b in each sixth of the hue circle, as in colorsys
+_SECTORS = np.array([[0, 1, 2], [3, 0, 2], [2, 0, 1], [2, 3, 0], [1, 2, 0], [0, 2, 3]])
+
+
+def _hsv_floats_to_rgb(h, s, v):
+    """colorsys.hsv_to_rgb of float arrays, as an (n, 3) float array"""
+    i = (h * 6.0).astype(np.int64)
+    f = (h * 6.0) - i
+    p = v * (1.0 - s)
+    q = v * (1.0 - s * f)
+    t = v * (1.0 - s * (1.0 - f))
+    rgb = np.take_along_axis(np.stack([v, t, p, q], axis=1), _SECTORS[i % 6], axis=1)
+    grey = s == 0.0
+    rgb[grey] = v[grey, None]
+    return rgb
+
+
+def _hsv_array_to_rgb(hsv):
+    hsv = np.asarray(hsv, dtype=np.int64) % 256 / 255.0
+    return (_hsv_floats_to_rgb(hsv[:, 0], hsv[:, 1], hsv[:, 2]) * 255).astype(np.int64) % 256
+
+
+SATURATED_RGB = _hsv_array_to_rgb(np.stack([np.repeat(np.arange(256), 256),
+                                            np.full(256 * 256, 255),
+                                            np.tile(np.arange(256), 256)], axis=1)
+                                  ).astype(np.uint8).reshape(256, 256, 3)  # [hue, value] -> rgb at s = 255
+_SATURATED_ROWS = SATURATED_RGB.reshape(-1, 3)  # [hue * 256 + value]
+
+
+def hsv_to_rgb_array(hsv):
+    """hsv_to_rgb() of an (n, 3) hsv[0-255] array. Returns an (n, 3) uint8 rgb array"""
+    hsv = np.asarray(hsv)
+    if hsv.dtype != np.uint8:
+        hsv = (hsv.astype(np.int64) % 256).astype(np.uint8)
+    rows = (hsv[:, 0].astype(np.intp) << 8) | hsv[:, 2]
+    saturated = hsv[:, 1] == 255
+    rgb = np.take(_SATURATED_ROWS, rows, axis=0)
+    if not saturated.all():
+        rgb[~saturated] = _hsv_array_to_rgb(hsv[~saturated])
+    return rgb
+
+
+def rgb_to_hsv_array(rgb):
+    """rgb_to_hsv() of an (n, 3) rgb[0-255] array. Returns an (n, 3) uint8 hsv array"""
+    rgb = np.asarray(rgb, dtype=np.int64) % 256 / 255.0
+    r, g, b = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+    maxc = rgb.max(axis=1)
+    minc = rgb.min(axis=1)
+    rangec = maxc - minc
+    grey = rangec == 0.0
+    rangec[grey] = 1.0  # h and s are 0 for greys; avoid dividing by 0
+    s = np.where(grey, 0.0, rangec / np.where(maxc == 0.0, 1.0, maxc))
+    rc = (maxc - r) / rangec
+    gc = (maxc - g) / rangec
+    bc = (maxc - b) / rangec
+    h = np.where(r == maxc, bc - gc, np.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+    h = np.where(grey, 0.0, (h / 6.0) % 1.0)
+    return (np.stack([h, s, maxc], axis=1) * 255).astype(np.int64).astype(np.uint8)
+
+
+def is_packed(color):
+    """True for a packed 0xHHSSVV color, False for an hsv triple"""
+    return isinstance(color, numbers.Integral)
+
+
+def random_color(reds=False, packed=False):
     """return a random, saturated hsv color. reds are 192-32"""
     _hue = randint(192, 287) % 255 if reds else randint(0, 255)
-    return _hue, 255, 255
+    return pack_hsv((_hue, 255, 255)) if packed else (_hue, 255, 255)
 
 
 def random_color_range(hsv, shift_range=0.3):
     """Returns a random color around a given color within a particular range
-       Function is good for selecting blues, for example"""
+       Function is good for selecting blues, for example. Packed colors stay packed"""
+    packed = is_packed(hsv)
+    if packed:
+        hsv = unpack_hsv(hsv)
     _delta_h = (random() - 0.5) * min([0.5, shift_range]) * 2
     _new_h = _float_to_byte( _byte_to_float(hsv[0]) + _delta_h)
-    return _new_h, hsv[1], hsv[2]
+    return pack_hsv((_new_h, hsv[1], hsv[2])) if packed else (_new_h, hsv[1], hsv[2])
 
 
 def gradient_wheel(hsv, intensity):
-    """Dim an hsv color with v=intensity [0.0-1.0]"""
+    """Dim an hsv color with v=intensity [0.0-1.0]. Packed colors stay packed"""
     intensity = max([min([intensity, 1]), 0])
+    if is_packed(hsv):
+        return (hsv & 0xffff00) | _float_to_byte(intensity)
     return hsv[0], hsv[1], _float_to_byte(intensity)
 
 
@@ -6,6 +6,8 @@ import threading
 
 import tree
 import shows
+import clock
+import randoms
 
 #
 #  Dual Shows running that fade into each other
@@ -24,10 +26,13 @@ SPEED_MULT = 1  # Multiply every delay by this value. Higher = much slower shows
 
 
 class ShowRunner(threading.Thread):
-    def __init__(self, model, simulator, max_showtime=1000, channel=0):
+    def __init__(self, model, simulator, max_showtime=1000, channel=0, show_clock=None):
         super(ShowRunner, self).__init__(name="ShowRunner")
         self.model = model
         self.simulator = simulator
+        self.clock = show_clock or clock.REAL  # shows and delays run on this clock
+        self.random = randoms.RandomSource()  # reseeded for every show
+        self.seed = None
         self.running = True
         self.max_show_time = max_showtime
         self.show_runtime = 0
@@ -48,7 +53,7 @@ class ShowRunner(threading.Thread):
     def clear(self):
         self.model.clear()
 
-    def next_show(self, name=None):
+    def next_show(self, name=None, seed=None):
         s = None
         if name:
             if name in self.shows:
@@ -60,16 +65,25 @@ class ShowRunner(threading.Thread):
             print ("choosing random show")
             s = next(self.randseq)
 
+        if self.show:
+            print ("{} on channel {}: examined {examined} pixels, sent {sent} in {frames} frames, "
+                   "held back {suppressed} (max error {max_error})".format(
+                self.show.name, self.channel, **self.model.stats()))
+
         self.clear()
+        self.model.reset_stats()
         self.prev_show = self.show
+        self.seed = randoms.new_seed() if seed is None else seed
+        self.random.seed(self.seed)
+        randoms.use(self.random)
         self.show = s(self.model)
-        self.framegen = self.show.next_frame()
+        self.framegen = shows.frame_generator(self.show, self.model)
         self.show_params = hasattr(self.show, 'set_param')
         self.time_since_reset = 0
         if self.channel == 0:
             self.show_runtime = 0  # Don't reset other channels' clocks
 
-        print ("next show for channel {}: {}".format(self.channel, self.show.name))
+        print ("next show for channel {}: {} (seed {})".format(self.channel, self.show.name, self.seed))
 
     def get_next_frame(self):
         """return a delay or None"""
@@ -79,6 +93,8 @@ class ShowRunner(threading.Thread):
             return None
 
     def run(self):
+        clock.use(self.clock)
+        randoms.use(self.random)
         if not (self.show and self.framegen):
             self.next_show()
 
@@ -103,8 +119,9 @@ class ShowRunner(threading.Thread):
                     if intensity > 0:
                         self.model.go()
                         self.model.send_delay(adj_delay)
+                    self.model.flush()  # One write for the whole frame
 
-                time.sleep(adj_delay)  # The only delay!
+                self.clock.sleep(adj_delay)  # The only delay!
 
                 self.show_runtime += adj_delay
                 self.time_since_reset += adj_delay
@@ -136,8 +153,9 @@ class ShowRunner(threading.Thread):
 
 
 class TreeServer(object):
-    def __init__(self, tree_model, tree_simulator, args):
+    def __init__(self, tree_model, tree_simulator, args, show_clock=None):
         self.args = args
+        self.show_clock = show_clock
         self.tree_model = tree_model
         self.tree_simulator = tree_simulator
         self.runner = None
@@ -149,12 +167,13 @@ class TreeServer(object):
         self.runner = ShowRunner(self.tree_model,
                                  self.tree_simulator,
                                  args.max_time,
-                                 self.tree_simulator.get_channel())
+                                 self.tree_simulator.get_channel(),
+                                 self.show_clock)
 
         if args.shows:
             named_show = args.shows[0]
             print ("setting show: ".format(named_show))
-            self.runner.next_show(named_show)
+            self.runner.next_show(named_show, args.seed)
 
     def start(self):
         try:
@@ -169,6 +188,7 @@ class TreeServer(object):
             try:
                 self.running = False
                 self.runner.stop()
+                self.tree_simulator.stop_sender()
             except Exception as e:
                 print ("Exception stopping Trees! {}".format(e))
                 traceback.print_exc()
@@ -182,6 +202,23 @@ if __name__ == '__main__':
     parser.add_argument('--max-time', type=float, default=float(SHOW_TIME),
                         help='Maximum number of seconds a show will run (default {})'.format(SHOW_TIME))
     parser.add_argument('--list', action='store_true', help='List available shows')
+    parser.add_argument('--geometry-cache', metavar='DIR',
+                        help='Keep the tree geometry in a file here, shared by other processes (e.g. /dev/shm)')
+    parser.add_argument('--check-render', action='store_true',
+                        help='Compare the whole-frame and per-pixel output of shows that have both, '
+                             'and the lookup tables with the functions they replace')
+    parser.add_argument('--tolerance', type=int, nargs=3, metavar=('H', 'S', 'V'), default=(0, 0, 0),
+                        help="Hold back pixel changes this small until they add up (default 0 0 0: send all)")
+    parser.add_argument('--brightness', type=int, default=100, help='Master brightness in percent (default 100)')
+    parser.add_argument('--color-state', type=int, default=0, choices=range(7),
+                        help='Remap hues as the sketch: 0 all colors, 1 no red, 2 no green, 3 no blue, '
+                             '4 all red, 5 all green, 6 all blue (default 0)')
+    parser.add_argument('--curve', help="Brightness curve: 'antilog' or a gamma exponent (default none)")
+    parser.add_argument('--seed', type=int, help='Random seed of the named show, to replay it')
+    parser.add_argument('--time-scale', type=float, default=1.0, metavar='SPEED',
+                        help='Run shows SPEED times faster than real time, or 0: as fast as possible (default 1)')
+    parser.add_argument('--multiplex', action='store_true',
+                        help='Send every channel over one connection to the first port')
     parser.add_argument('shows', metavar='show_name', type=str, nargs='*',
                         help='name of show (or shows) to run')
 
@@ -192,19 +229,54 @@ if __name__ == '__main__':
         print (', '.join([s[0] for s in shows.load_shows()]))
         sys.exit(0)
 
+    if args.check_render:
+        check_tree = tree.load_tree(None)
+        failed = False
+        for (name, ctor) in shows.load_shows():
+            if hasattr(ctor, 'render') and hasattr(ctor, 'next_frame'):
+                difference = shows.check_render(ctor, check_tree)
+                failed |= difference > shows.RENDER_TOLERANCE
+                print ("{}: largest difference {} (allowed {})".format(name, difference, shows.RENDER_TOLERANCE))
+        from HelperFunctions import ShapeTables, PACKET_ERROR, SMOOTH_ERROR, MIN_DIM_ERROR
+        bounds = {'packet': PACKET_ERROR, 'linear_packet': PACKET_ERROR, 'smooth': SMOOTH_ERROR,
+                  'min_dim': MIN_DIM_ERROR}
+        for (name, error) in sorted(ShapeTables().error().items()):
+            failed |= error > bounds[name]
+            print ("lookup table {}: largest error {} (allowed {})".format(name, error, bounds[name]))
+        sys.exit(1 if failed else 0)
+
     sim_host = "localhost"
     sim_port = 4444  # base port number
 
-    print ("Using Tree Simulator at {}:{}-{}".format(sim_host, sim_port, sim_port + NUM_CHANNELS - 1))
-
+    from geometry import load_geometry
+    from output import OutputStage, parse_curve
     from model.simulator import SimulatorModel
+    from model.sender import COALESCE
+    from model.multiplex import MultiplexConnection
+
+    mux = None
+    if args.multiplex:
+        print ("Using Tree Simulator at {}:{} for all channels".format(sim_host, sim_port))
+        mux = MultiplexConnection(sim_host, sim_port, NUM_CHANNELS, policy=COALESCE)
+    else:
+        print ("Using Tree Simulator at {}:{}-{}".format(sim_host, sim_port, sim_port + NUM_CHANNELS - 1))
+
     # Get ready for DUAL channels
-    # Each channel (app) has its own ShowRunner and SimulatorModel
+    # Each channel (app) has its own ShowRunner and SimulatorModel, all sharing one tree geometry
+    geometry = load_geometry(cache_dir=args.geometry_cache)
+    show_clock = clock.make_clock(args.time_scale)  # one clock keeps the channels in step
+    output = OutputStage(args.color_state, args.brightness, parse_curve(args.curve))  # one look for all channels
     channels = []  # array of channel objects
     for i in range(NUM_CHANNELS):
-        model = SimulatorModel(sim_host, i, port=sim_port+i)
-        full_tree = tree.load_tree(model)
-        channels.append(TreeServer(full_tree, model, args))
+        if mux:
+            model = mux.channel_model(i)
+        else:
+            model = SimulatorModel(sim_host, i, port=sim_port+i, sender_policy=COALESCE)  # Never block on the sketch
+        full_tree = tree.load_tree(model, geometry)
+        full_tree.set_tolerance(*args.tolerance)
+        if not output.is_identity():
+            full_tree.use_output(output)
+        channels.append(TreeServer(full_tree, model, args, show_clock))
 
     try:
         for channel in channels:
@@ -224,3 +296,5 @@ if __name__ == '__main__':
     finally:
         for channel in channels:
             channel.stop()
+        if mux:
+            mux.stop()
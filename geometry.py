@@ -0,0 +1,414 @@
+"""
+Tree geometry: where every pixel is and how the pixels connect
+
+Growing the tree (recursion, trig, one record per pixel) depends only on the
+tree constants, so it is done once per process. The result is an immutable
+TreeGeometry of read-only arrays that any number of channel Trees share;
+each Tree keeps only its own frames.
+
+A geometry can be saved to a flat file and mapped back read-only. Put the
+file in shared memory (/dev/shm) and every process that opens it shares the
+same pages. load_geometry(cache_dir=...) does this, keyed by the constants.
+
+A geometry can hold several trees (trees=[(origin x, origin y, rotation), ...]),
+all of the same shape. Their trunks are numbered on from each other, so
+coordinates stay (trunk, branch, ..., i) and each tree's ids follow the last
+tree's. x and y are normalized around the center of all the tree origins by
+the largest whole distance of any pixel from it, which for the one standard
+tree gives the sculpture's original constants.
+
+File layout:
+    magic    4s  'TGEO'
+    version  I
+    length   I   of the json header that follows
+    header       {"constants": {...}, "arrays": [[name, dtype, shape, offset], ...]}
+    arrays       each one 8 byte aligned, offsets from the start of the file
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+from collections import namedtuple
+from math import sin, cos, atan, sqrt, pi
+import numpy as np
+
+MAGIC = b'TGEO'
+VERSION = 1
+PREFIX = struct.Struct('<4sII')
+ALIGN = 8
+
+GENERATION_LENGTHS = (56, 38, 28, 20)  # Pixels in a branch of each generation
+ORIGIN = (12250, 10007)  # Where the standard tree grows from
+
+# Per-pixel geometry as read-only arrays in Pixel.id order
+Columns = namedtuple('Columns', ['x', 'y', 'd', 'theta', 'fract', 'gen', 'number'])
+
+# How the pixels connect, as read-only integer arrays. -1 means none.
+# A segment is one straight line of pixels (a trunk or a branch), whose ids are consecutive.
+#   parent[id]                  next pixel towards the trunk base
+#   children[id, branch]        next pixels away from the trunk base
+#   siblings[id, branch]        pixel at the same place on each branch of the same fork
+#   segment[id]                 segment of the pixel
+#   segment_start[seg], segment_length[seg], segment_gen[seg], segment_parent[seg]
+#   segment_children[seg, branch]
+#   trunks[trunk]               segment of each trunk
+#   paths[leaf]                 pixel ids from a trunk base out to each branch tip
+Topology = namedtuple('Topology', ['parent', 'children', 'siblings', 'segment',
+                                   'segment_start', 'segment_length', 'segment_gen', 'segment_parent',
+                                   'segment_children', 'trunks', 'paths'])
+
+_geometries = {}  # { key: TreeGeometry } shared by every Tree in this process
+
+
+def read_only(values, dtype=np.int32):
+    """values as an array that can't be written to"""
+    array = np.array(values, dtype=dtype)
+    array.flags.writeable = False
+    return array
+
+
+def pixel_angle(x, y):
+    """Get the 0-2pi angle from the x,y coordinate. arctans are weird."""
+    if y == 0:
+        angle = 0 if x > 0 else pi
+    else:
+        angle = atan(x / y)
+
+    if y >= 0:
+        if x < 0:
+            angle += (2 * pi)
+    else:
+        angle += pi
+
+    return angle
+
+
+def tree_constants(num_trunks=3, max_generations=3, num_branches=2, pixel_size=100,
+                   generation_lengths=GENERATION_LENGTHS, trees=None, center=None, extent=None):
+    """
+    Everything the geometry depends on, as a dictionary
+        num_trunks          trunks per tree
+        generation_lengths  pixels in a branch of each generation 0 .. max_generations
+        trees               (origin x, origin y, rotation in radians) of each tree
+        center, extent      (x, y) normalization. None works them out from the pixels
+    """
+    if trees is None:
+        trees = [(ORIGIN[0], ORIGIN[1], 0.0)]
+    return {'num_trunks': num_trunks,
+            'max_generations': max_generations,
+            'num_branches': num_branches,
+            'pixel_size': pixel_size,
+            'generation_lengths': list(generation_lengths),
+            'trees': [list(tree) for tree in trees],
+            'center': list(center) if center else None,
+            'extent': list(extent) if extent else None}
+
+
+def geometry_key(constants):
+    """File name for the geometry of these constants"""
+    digest = hashlib.md5(json.dumps(constants, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    return "tree_geometry_v{}_{}x{}_{}".format(VERSION, len(constants['trees']), constants['num_trunks'], digest)
+
+
+def grid_layout(num_trees, spacing=25000, columns=None):
+    """trees for tree_constants: num_trees standard trees on a grid, spacing apart, alternately turned"""
+    columns = columns or int(np.ceil(np.sqrt(num_trees)))
+    return [(ORIGIN[0] + spacing * (i % columns), ORIGIN[1] + spacing * (i // columns), (i % 2) * pi / 3)
+            for i in range(num_trees)]
+
+
+class TreeGeometry(object):
+    """Pixel coordinates, geometry columns and topology of one tree layout. Never changes"""
+    def __init__(self, constants, coords, columns, topology):
+        self.constants = constants
+        self.coords = coords  # tuple of (trunk, branch, ..., i) coordinates in id order
+        self.columns = columns
+        self.topology = topology
+        self._topology_lists = None
+
+    def __repr__(self):
+        return "Tree Geometry: {} pixels in {} trees".format(self.num_pixels, self.num_trees)
+
+    @property
+    def num_pixels(self):
+        return len(self.coords)
+
+    @property
+    def num_trees(self):
+        return len(self.constants['trees'])
+
+    @property
+    def num_trunks(self):
+        """Trunks of all the trees"""
+        return self.constants['num_trunks'] * self.num_trees
+
+    def tree_ids(self, tree):
+        """The slice of pixel ids that belongs to one tree"""
+        per_tree = self.num_pixels // self.num_trees
+        return slice(tree * per_tree, (tree + 1) * per_tree)
+
+    @property
+    def generation_lengths(self):
+        return self.constants['generation_lengths']
+
+    @property
+    def topology_lists(self):
+        """The topology as plain lists, for walkers that step one pixel at a time"""
+        if self._topology_lists is None:
+            self._topology_lists = Topology(*[array.tolist() for array in self.topology])
+        return self._topology_lists
+
+    def save(self, path):
+        """Write the geometry file. Goes through a temporary file so readers never see half of it"""
+        coords = np.full((self.num_pixels, self.constants['max_generations'] + 2), -1, dtype=np.int16)
+        for (i, coord) in enumerate(self.coords):
+            coords[i, :len(coord)] = coord
+
+        arrays = [('coords', coords)]
+        arrays.extend(('columns.' + name, array) for (name, array) in zip(Columns._fields, self.columns))
+        arrays.extend(('topology.' + name, array) for (name, array) in zip(Topology._fields, self.topology))
+
+        # The header holds the offsets, which depend on the header's length: size it with dummies first
+        table = [[name, array.dtype.str, list(array.shape), 0] for (name, array) in arrays]
+        header = json.dumps({'constants': self.constants, 'arrays': table}).encode('utf-8')
+        offset = PREFIX.size + len(header) + 16 * len(table)  # room for the offsets' digits
+        for entry in table:
+            offset += -offset % ALIGN
+            entry[3] = offset
+            offset += np.dtype(entry[1]).itemsize * int(np.prod(entry[2]))
+        header = json.dumps({'constants': self.constants, 'arrays': table}).encode('utf-8')
+
+        folder = os.path.dirname(os.path.abspath(path))
+        handle, temp_path = tempfile.mkstemp(dir=folder, prefix='.tree_geometry')
+        with os.fdopen(handle, 'wb') as f:
+            f.write(PREFIX.pack(MAGIC, VERSION, len(header)))
+            f.write(header)
+            for ((name, array), entry) in zip(arrays, table):
+                f.write(b'\0' * (entry[3] - f.tell()))
+                f.write(np.ascontiguousarray(array).tobytes())
+        os.rename(temp_path, path)
+
+
+def open_geometry(path):
+    """Map a saved geometry read-only. Processes that open the same file share its memory"""
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, length = PREFIX.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("{} is not a version {} tree geometry".format(path, VERSION))
+    header = json.loads(data[PREFIX.size:PREFIX.size + length].decode('utf-8'))
+
+    arrays = {}
+    for (name, dtype, shape, offset) in header['arrays']:
+        count = int(np.prod(shape))
+        arrays[name] = np.frombuffer(data, dtype=dtype, count=count, offset=offset).reshape(shape)
+
+    coords = tuple(tuple(value for value in row if value >= 0) for row in arrays['coords'].tolist())
+    columns = Columns(*[arrays['columns.' + name] for name in Columns._fields])
+    topology = Topology(*[arrays['topology.' + name] for name in Topology._fields])
+    return TreeGeometry(header['constants'], coords, columns, topology)
+
+
+def load_geometry(cache_dir=None, **constants):
+    """
+    The geometry for these tree constants (see tree_constants), built at most once per process.
+    With a cache_dir, reuse the geometry file there or grow and save one.
+    cache_dir='/dev/shm' shares one copy between processes
+    """
+    constants = tree_constants(**constants)
+    key = geometry_key(constants)
+    if key not in _geometries:
+        geometry = None
+        if cache_dir:
+            path = os.path.join(cache_dir, key)
+            try:
+                geometry = open_geometry(path)
+            except (IOError, OSError, ValueError):
+                geometry = None
+        if geometry is None:
+            geometry = grow_geometry(**constants)
+            if cache_dir:
+                try:
+                    geometry.save(path)
+                except (IOError, OSError) as e:
+                    print ("Can't cache tree geometry in {}: {}".format(cache_dir, e))
+        _geometries[key] = geometry
+    return _geometries[key]
+
+
+def grow_geometry(**constants):
+    """Grow a tree with these constants (see tree_constants)"""
+    return TreeGrower(**constants).geometry()
+
+
+class TreeGrower(object):
+    """Turtle that walks the tree's trunks and branches, dropping a pixel every PIXEL_SIZE"""
+    def __init__(self, **constants):
+        self.constants = tree_constants(**constants)
+        self.NUMBER_TRUNKS = self.constants['num_trunks']
+        self.MAX_GENERATIONS = self.constants['max_generations']
+        self.NUMBER_BRANCHES = self.constants['num_branches']
+        self.PIXEL_SIZE = self.constants['pixel_size']  # For scaling the coordinate space
+        self.generation_lengths = tuple(self.constants['generation_lengths'])
+
+        # Turtle position
+        self.x = 0
+        self.y = 0
+        self.angle = 0  # in radians
+        self.records = []  # (coord, number, gen, fract, x, y) of each pixel, in id order
+
+    def geometry(self):
+        for (tree, (x, y, rotation)) in enumerate(self.constants['trees']):
+            self.x, self.y = x, y  # Initial starting coordinate
+            self.angle = rotation  # Initial start angle
+            self._grow_tree(first_trunk=tree * self.NUMBER_TRUNKS)
+
+        origins = np.array(self.constants['trees'], dtype=np.float64)[:, :2]
+        if self.constants['center'] is None:
+            self.constants['center'] = origins.mean(axis=0).tolist()
+        if self.constants['extent'] is None:
+            positions = np.array([record[4:6] for record in self.records])
+            distance = np.abs(positions - self.constants['center']).max(axis=0)
+            self.constants['extent'] = np.maximum(np.floor(distance), 1.0).tolist()
+
+        coords = tuple(record[0] for record in self.records)
+        return TreeGeometry(self.constants, coords, self._build_columns(), self._build_topology())
+
+    def _grow_tree(self, first_trunk=0):
+        """One-time function call to set up tree pixel coordinates"""
+        generation = 0
+        coord = []
+
+        # Rotate and draw each trunk
+        for trunk in range(first_trunk, first_trunk + self.NUMBER_TRUNKS):
+            self.angle += (2 * pi / self.NUMBER_TRUNKS)
+
+            old_x, old_y = self.x, self.y  # push matrix
+            old_angle = self.angle
+
+            self.draw_pixel_line(coord + [trunk], generation)
+            self.draw_branch(coord + [trunk], generation + 1)
+
+            self.x, self.y = old_x, old_y  # pop matrix
+            self.angle = old_angle
+
+    def draw_branch(self, coord, gen):
+        if gen > self.MAX_GENERATIONS:
+            return  # end recursion
+        self.angle += pi + ((2 * pi / self.NUMBER_BRANCHES + 1) / 2)  # Trial and error
+
+        for branch in range(self.NUMBER_BRANCHES):
+            old_x, old_y = self.x, self.y
+            old_angle = self.angle
+
+            self.draw_pixel_line(coord + [branch], gen)  # push matrix
+            self.draw_branch(coord + [branch], gen + 1)  # further recursion
+
+            self.x, self.y = old_x, old_y  # pop matrix
+            self.angle = old_angle
+
+            self.angle += (2 * pi / 3)
+
+    def draw_pixel_line(self, coord, gen):
+        """Draw a line of pixels, length determined by generation"""
+        gen_length = self.generation_lengths[gen]
+        for i in range(gen_length):
+            self.drop_pixel(coord=coord + [i], i=i, gen=gen, fraction=float(i)/gen_length)
+            self.move(self.PIXEL_SIZE)
+
+    def move(self, distance):
+        # Move (x,y) distance in the direction of angle
+        self.x += (distance * sin(self.angle))
+        self.y += (distance * cos(self.angle))
+
+    def drop_pixel(self, coord, i, gen, fraction):
+        """Record the current pixel's coordinate as (float x, float y)"""
+        self.records.append((tuple(coord), i, gen, fraction, self.x, self.y))
+
+    def _build_columns(self):
+        """Normalize each pixel's position and copy its attributes into read-only arrays in id order"""
+        center_x, center_y = self.constants['center']
+        extent_x, extent_y = self.constants['extent']
+        x, y, d, theta, fract, gen, number = [], [], [], [], [], [], []
+        for (coord, i, generation, fraction, pixel_x, pixel_y) in self.records:
+            pixel_x = (pixel_x - center_x) / extent_x  # -1.0 - 1.0 (one tree: min -12249, max 12157)
+            pixel_y = (pixel_y - center_y) / extent_y  # -1.0 - 1.0 (one tree: min -10007, max 11438)
+            x.append(pixel_x)
+            y.append(pixel_y)
+            d.append(sqrt((pixel_x * pixel_x) + (pixel_y * pixel_y)) / sqrt(2))  # 0.0 - 1.0
+            theta.append(pixel_angle(pixel_x, pixel_y))
+            fract.append(fraction)  # 0.0 - 1.0
+            gen.append(generation)
+            number.append(i)
+        return Columns(x=read_only(x, np.float64),
+                       y=read_only(y, np.float64),
+                       d=read_only(d, np.float64),
+                       theta=read_only(theta, np.float64),
+                       fract=read_only(fract, np.float64),
+                       gen=read_only(gen),
+                       number=read_only(number))
+
+    def _build_topology(self):
+        """Index segments by their coordinate prefix (trunk, branch, ...), then link the pixels"""
+        segments = {}  # { coord prefix: segment }
+        starts, lengths, gens, parents = [], [], [], []
+        segment = []
+        for (id, record) in enumerate(self.records):
+            prefix = record[0][:-1]
+            if prefix not in segments:
+                segments[prefix] = len(starts)
+                starts.append(id)
+                lengths.append(0)
+                gens.append(record[2])
+                parents.append(segments.get(prefix[:-1], -1))
+            lengths[segments[prefix]] += 1
+            segment.append(segments[prefix])
+
+        segment_children = [[-1] * self.NUMBER_BRANCHES for _ in starts]
+        for (prefix, seg) in segments.items():
+            if parents[seg] >= 0:
+                segment_children[parents[seg]][prefix[-1]] = seg
+
+        parent, children, siblings = [], [], []
+        for (id, record) in enumerate(self.records):
+            seg = segment[id]
+            number = record[1]
+            if number > 0:
+                parent.append(id - 1)
+            elif parents[seg] >= 0:
+                parent.append(starts[parents[seg]] + lengths[parents[seg]] - 1)
+            else:
+                parent.append(-1)
+
+            if number < lengths[seg] - 1:
+                children.append([id + 1] + [-1] * (self.NUMBER_BRANCHES - 1))
+            else:
+                children.append([starts[child] if child >= 0 else -1 for child in segment_children[seg]])
+
+            if parents[seg] >= 0:
+                siblings.append([starts[branch] + number for branch in segment_children[parents[seg]]])
+            else:
+                siblings.append([-1] * self.NUMBER_BRANCHES)
+
+        paths = []
+        for seg in range(len(starts)):
+            if segment_children[seg][0] < 0:  # a branch tip
+                path = []
+                while seg >= 0:
+                    path = list(range(starts[seg], starts[seg] + lengths[seg])) + path
+                    seg = parents[seg]
+                paths.append(path)
+
+        return Topology(parent=read_only(parent),
+                        children=read_only(children),
+                        siblings=read_only(siblings),
+                        segment=read_only(segment),
+                        segment_start=read_only(starts),
+                        segment_length=read_only(lengths),
+                        segment_gen=read_only(gens),
+                        segment_parent=read_only(parents),
+                        segment_children=read_only(segment_children),
+                        trunks=read_only([seg for seg in range(len(starts)) if parents[seg] < 0]),
+                        paths=read_only(paths))
@@ -2,15 +2,24 @@
 import sys
 import time
 import traceback
-import Queue
 import threading
 import signal
 
 import tree
 import shows
 import util
+import clock
+import randoms
 
-import cherrypy
+try:
+    import Queue as queue
+except ImportError:  # Python 3
+    import queue
+
+try:
+    string_types = basestring
+except NameError:  # Python 3
+    string_types = str
 
 SPEED_MULT = 1 # Multiply every delay by this value. Higher = much slower shows
 
@@ -34,11 +43,14 @@ low_interp = util.make_interpolater(0.0, 0.5, 10.0, 1.0)
 hi_interp  = util.make_interpolater(0.5, 1.0, 1.0, 0.1)
 
 class ShowRunner(threading.Thread):
-    def __init__(self, model, simulator, queue, max_showtime=1000):
+    def __init__(self, model, simulator, queue, max_showtime=1000, show_clock=None):
         super(ShowRunner, self).__init__(name="ShowRunner")
         self.model = model
         self.simulator = simulator
         self.queue = queue
+        self.clock = show_clock or clock.REAL  # shows and delays run on this clock
+        self.random = randoms.RandomSource()  # reseeded for every show
+        self.seed = None
 
         self.running = True
         self.max_show_time = max_showtime
@@ -80,7 +92,7 @@ class ShowRunner(threading.Thread):
                 if m:
                     msgs.append(m)
 
-        except Queue.Empty:
+        except queue.Empty:
             pass
 
         if msgs:
@@ -88,10 +100,10 @@ class ShowRunner(threading.Thread):
                 self.process_command(m)
 
     def process_command(self, msg):
-        if isinstance(msg,basestring):
+        if isinstance(msg, string_types):
             if msg == "shutdown":
                 self.running = False
-                print "ShowRunner shutting down"
+                print ("ShowRunner shutting down")
             elif msg == "clear":
                 self.clear()
                 time.sleep(0.2)
@@ -105,7 +117,7 @@ class ShowRunner(threading.Thread):
         elif isinstance(msg, tuple):
             # osc message
             # ('/1/command', [value])
-            print "OSC:", msg
+            print ("OSC: {}".format(msg))
 
             (addr,val) = msg
             addr = addr.split('/z')[0]
@@ -118,15 +130,15 @@ class ShowRunner(threading.Thread):
                     self.video = not self.video
                     self.send_OSC_cmd('video', 0)
                     if self.video:
-                        print "turning video on"
+                        print ("turning video on")
                     else:
-                        print "turning video off"                    
+                        print ("turning video off")
                 elif cmd == 'next':
                     if self.video:
-                        print "next video"
+                        print ("next video")
                         self.send_OSC_cmd('nextvideo', 0)
                     else:
-                        print "next show"
+                        print ("next show")
                         self.next_show()
                 elif cmd == 'previous':
                     if self.prev_show:
@@ -134,55 +146,72 @@ class ShowRunner(threading.Thread):
                 elif cmd == 'speed':
                     self.speed_x = speed_interpolation(val)
                     self.send_OSC_cmd('speed', int(val * 10)) # For video player
-                    print "setting speed_x to:", self.speed_x
+                    print ("setting speed_x to: {}".format(self.speed_x))
                 elif cmd == 'brightness':
-                    self.send_OSC_cmd('brightness', int(val))
                     self.brightness_x = val
-                    print "setting brightness to:", int(val)
+                    if self.model.output is not None:
+                        self.model.output.set_brightness(val)
+                    print ("setting brightness to: {}".format(int(val)))
+                    self.send_OSC_cmd('brightness', int(val))
                 pass
             elif ns == '2':
                 # show command - one of the 7 color buttons
+                if self.model.output is not None and cmd[4:].isdigit():
+                    self.model.output.set_color_state(int(cmd[4:]))
                 self.send_OSC_cmd('color', cmd[4:])
 
         else:
-            print "ignoring unknown msg:", str(msg)
+            print ("ignoring unknown msg: {}".format(msg))
 
     def send_OSC_cmd(self, cmd, value):
-        "Dump command to simulator.py"
-        self.simulator.relay_OSC_cmd(cmd, value)
+        "Dump command to simulator.py, if the simulator takes them"
+        relay = getattr(self.simulator, 'relay_OSC_cmd', None)
+        if relay:
+            relay(cmd, value)
 
     def clear(self):
         self.model.clear()
 
-    def next_show(self, name=None):
+    def next_show(self, name=None, seed=None):
         s = None
         if name:
             if name in self.shows:
                 s = self.shows[name]
             else:
-                print "unknown show:", name
+                print ("unknown show: {}".format(name))
 
         if not s:
-            print "choosing random show"
-            s = self.randseq.next()
+            print ("choosing random show")
+            s = next(self.randseq)
+
+        if self.show:
+            print ("%s: examined %d pixels, sent %d, held back %d" % (self.show.name, self.model.stats()['examined'],
+                                                                      self.model.stats()['sent'],
+                                                                      self.model.stats()['suppressed']))
 
         self.clear()
+        self.model.reset_stats()
         self.prev_show = self.show
 
+        self.seed = randoms.new_seed() if seed is None else seed
+        self.random.seed(self.seed)
+        randoms.use(self.random)
         self.show = s(self.model)
-        print "next show:" + self.show.name
-        self.framegen = self.show.next_frame()
+        print ("next show: %s (seed %d)" % (self.show.name, self.seed))
+        self.framegen = shows.frame_generator(self.show, self.model)
         self.show_params = hasattr(self.show, 'set_param')
         self.show_runtime = 0
 
     def get_next_frame(self):
         "return a delay or None"
         try:
-            return self.framegen.next()
+            return next(self.framegen)
         except StopIteration:
             return None
 
     def run(self):
+        clock.use(self.clock)
+        randoms.use(self.random)
         if not (self.show and self.framegen):
             self.next_show()
 
@@ -198,30 +227,31 @@ class ShowRunner(threading.Thread):
                     # Send all the next_frame data - don't change lights
                     self.model.go()
                     self.model.send_delay(adj_delay)
+                    self.model.flush()  # One write for the whole frame
 
-                    time.sleep(adj_delay)  # The only delay!
+                    self.clock.sleep(adj_delay)  # The only delay!
 
                     self.show_runtime += adj_delay
                     if self.show_runtime > self.max_show_time:
-                        print "max show time elapsed, changing shows"
+                        print ("max show time elapsed, changing shows")
                         self.next_show()
                 else:
-                    print "show is out of frames, waiting..."
+                    print ("show is out of frames, waiting...")
                     time.sleep(2)
                     self.next_show()
 
             except Exception:
-                print "unexpected exception in show loop!"
+                print ("unexpected exception in show loop!")
                 traceback.print_exc()
                 self.next_show()
 
 def osc_listener(q, port=5700):
     "Create the OSC Listener thread"
-    print "trying OSC"
+    print ("trying OSC")
     import osc_serve
 
     listen_address=('0.0.0.0', port)
-    print "Starting OSC Listener on %s:%d" % listen_address
+    print ("Starting OSC Listener on %s:%d" % listen_address)
     osc = osc_serve.create_server(listen_address, q)
     st = threading.Thread(name="OSC Listener", target=osc.serve_forever)
     st.daemon = True
@@ -233,7 +263,7 @@ class TreeServer(object):
         self.tree_model = tree_model
         self.tree_simulator = tree_simulator
 
-        self.queue = Queue.LifoQueue()
+        self.queue = queue.LifoQueue()
 
         self.osc_thread = None
 
@@ -246,20 +276,20 @@ class TreeServer(object):
         # OSC listener
         try:
             self.osc_thread = osc_listener(self.queue)
-        except Exception, e:
-            print "WARNING: Can't create OSC listener"
+        except Exception:
+            print ("WARNING: Can't create OSC listener")
 
         # Show runner
         self.runner = ShowRunner(self.tree_model, self.tree_simulator,
-            self.queue, args.max_time)
+            self.queue, args.max_time, clock.make_clock(args.time_scale))
 
         if args.shows:
-            print "setting show:", args.shows[0]
-            self.runner.next_show(args.shows[0])
+            print ("setting show: {}".format(args.shows[0]))
+            self.runner.next_show(args.shows[0], args.seed)
 
     def start(self):
         if self.running:
-            print "start() called, but tree is already running!"
+            print ("start() called, but tree is already running!")
             return
 
         try:
@@ -267,8 +297,8 @@ class TreeServer(object):
                 self.osc_thread.start()
             self.runner.start()
             self.running = True
-        except Exception, e:
-            print "Exception starting Trees!"
+        except Exception:
+            print ("Exception starting Trees!")
             traceback.print_exc()
 
     def stop(self):
@@ -280,22 +310,24 @@ class TreeServer(object):
                 self.queue.put("shutdown")
 
                 self.running = False
-            except Exception, e:
-                print "Exception stopping Trees!"
+            except Exception:
+                print ("Exception stopping Trees!")
                 traceback.print_exc()
 
     def go_headless(self, app):
-        print "Running without web interface"
+        print ("Running without web interface")
         try:
             while True:
                 time.sleep(999) # control-c breaks out of time.sleep
         except KeyboardInterrupt:
-            print "Exiting on keyboard interrupt"
+            print ("Exiting on keyboard interrupt")
             self.stop()
 
 
     def go_web(self, app):
         "Run with web interface"
+        import cherrypy
+
         port = 9991
         config = {
             'global': {
@@ -316,7 +348,6 @@ class TreeWeb(object):
         self.redirect_home_html = "<script>setTimeout(function(){window.location='/'},3000)</script>"
         pass
 
-    @cherrypy.expose
     def index(self):
         ret_html = "Shows:<br>"
         for i in self.show_names:
@@ -329,27 +360,29 @@ class TreeWeb(object):
         </form>
         """.format(int(self.runner.max_show_time))
         return ret_html
+    index.exposed = True  # cherrypy.expose, without importing cherrypy until go_web()
 
-    @cherrypy.expose
     def next_show(self, show_name=None):
         self.runner.queue.put("run_show:"+show_name)
         self.runner.queue.put("clear")
         ret_html = "<a href=/>HOME</a>"
         return ret_html + self.redirect_home_html
+    next_show.exposed = True
 
-    @cherrypy.expose
     def show_time(self, show_time=float(180)):
 
         self.runner.max_show_time = float(show_time)
         ret_html = "this show will run for %s seconds (including time it's already run)" % show_time
         return ret_html + self.redirect_home_html
+    show_time.exposed = True
 
-    @cherrypy.expose
     def kill(self):
+        import cherrypy
         cherrypy.engine.exit()
         self.app.stop()
         import sys
         sys.exit()
+    kill.exposed = True
 
 if __name__=='__main__':
     import argparse
@@ -362,25 +395,46 @@ if __name__=='__main__':
     # parser.add_argument('--simulator',dest='simulator',action='store_true')
 
     parser.add_argument('--list', action='store_true', help='List available shows')
+    parser.add_argument('--time-scale', type=float, default=1.0, metavar='SPEED',
+                        help='Run shows SPEED times faster than real time, or 0: as fast as possible (default 1)')
+    parser.add_argument('--seed', type=int, help='Random seed of the named show, to replay it')
+    parser.add_argument('--tolerance', type=int, nargs=3, metavar=('H', 'S', 'V'), default=(0, 0, 0),
+                        help="Hold back pixel changes this small until they add up (default 0 0 0: send all)")
+    parser.add_argument('--output-stage', action='store_true',
+                        help="Apply the brightness and color buttons here, for sketches that don't "
+                             "(TreeSimulatorDoubleTrunk_Dual; AndLighter and BetterColors adjust colors themselves)")
+    parser.add_argument('--brightness', type=int, default=100,
+                        help='Master brightness in percent (default 100), implies --output-stage')
+    parser.add_argument('--color-state', type=int, default=0, choices=range(7),
+                        help='Remap hues as the sketch: 0 all colors, 1 no red, 2 no green, 3 no blue, '
+                             '4 all red, 5 all green, 6 all blue (default 0), implies --output-stage')
+    parser.add_argument('--curve', help="Brightness curve: 'antilog' or a gamma exponent (default none), "
+                                        "implies --output-stage")
     parser.add_argument('shows', metavar='show_name', type=str, nargs='*',
                         help='name of show (or shows) to run')
 
     args = parser.parse_args()
 
     if args.list:
-        print "Available shows:"
-        print ', '.join([s[0] for s in shows.load_shows()])
+        print ("Available shows:")
+        print (', '.join([s[0] for s in shows.load_shows()]))
         sys.exit(0)
 
     sim_host = "localhost"
     sim_port = 4444
 
-    print "Using Tree Simulator at %s:%d" % (sim_host, sim_port)
+    print ("Using Tree Simulator at %s:%d" % (sim_host, sim_port))
 
     from model.simulator import SimulatorModel
+    from model.sender import COALESCE
+    from output import OutputStage, parse_curve
 
-    model = SimulatorModel(sim_host, 0, port=sim_port)
+    model = SimulatorModel(sim_host, 0, port=sim_port, sender_policy=COALESCE)  # Never block on the sketch
     full_trees = tree.load_tree(model)
+    full_trees.set_tolerance(*args.tolerance)
+    output = OutputStage(args.color_state, args.brightness, parse_curve(args.curve))
+    if args.output_stage or not output.is_identity():
+        full_trees.use_output(output)  # brightness and color buttons adjust it
 
     app = TreeServer(full_trees, model, args)
     try:
@@ -388,8 +442,8 @@ if __name__=='__main__':
         app.go_headless(app)
         #app.go_web(app)
 
-    except Exception, e:
-        print "Unhandled exception running Trees!"
+    except Exception:
+        print ("Unhandled exception running Trees!")
         traceback.print_exc()
     finally:
         app.stop()
@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+"""
+Headless stand-in for the Processing TreeSimulator*_Dual sketches
+
+Listens on the same ports (4444, 4445, ...) and speaks the same command
+grammar as processCommand / processPixelCommand:
+
+    every command starts with its channel digit, then
+        X          finish the morph cycle (push next frame to current)
+        D<int>     morph time in milliseconds
+        I<int>     channel intensity 0-255
+        i,h,s,v    set pixel i of the next frame
+
+It also reads the binary frames of model/protocol.py, told apart by their
+magic bytes. Like the sketch it keeps curr / next / morph buffers per
+channel, morphs on every draw() and blends the channels by intensity,
+so SimulatorModel and both runners can be load-tested and benchmarked
+with no display or JVM.
+"""
+import re
+import select
+import socket
+import sys
+import threading
+import time
+
+from model import protocol
+
+FRAME_RATE = 30  # draw() calls per second, as in the sketch
+BLACK = (0, 0, 0)
+
+pixel_pattern = re.compile(r"^\s*(\d+),(\d+),(\d+),(\d+)\s*$")
+
+
+def interp_color(c1, c2, fract):
+    """Brute-force hsv interpolation, as the sketch's interp_color"""
+    if c1 == c2 or fract <= 0:
+        return c1
+    if fract >= 1:
+        return c2
+    if c1[2] == 0:
+        return c2[0], c2[1], c2[2] * fract
+    if c2[2] == 0:
+        return c1[0], c1[1], c1[2] * (1.0 - fract)
+    return (interpolate_wrap(c1[0], c2[0], fract),
+            c1[1] + (c2[1] - c1[1]) * fract,
+            c1[2] + (c2[2] - c1[2]) * fract)
+
+
+def interpolate_wrap(a, b, fract):
+    """Interpolate hues the short way around the 0-255 color wheel"""
+    if a >= b:
+        dist_cw, dist_ccw = 256 + b - a, a - b
+    else:
+        dist_cw, dist_ccw = b - a, 256 + a - b
+    if dist_cw <= dist_ccw:
+        return a + dist_cw * fract
+    answer = a - dist_ccw * fract
+    return answer + 256 if answer < 0 else answer
+
+
+class HeadlessSimulator(object):
+    """The sketch's frame buffers and command processing, without drawing"""
+    def __init__(self, num_pixels=None, num_channels=2):
+        if num_pixels is None:
+            from model import default_tree
+            num_pixels = default_tree().num_pixels
+        self.num_pixels = num_pixels
+        self.num_channels = num_channels
+
+        now = time.time()
+        self.curr = [[BLACK] * num_pixels for _ in range(num_channels)]
+        self.next = [[BLACK] * num_pixels for _ in range(num_channels)]
+        self.morph = [[BLACK] * num_pixels for _ in range(num_channels)]
+        self.interp = [BLACK] * num_pixels
+        self.delay_time = [10000] * num_channels  # milliseconds (dummy initial value)
+        self.start_time = [now] * num_channels
+        self.intensity = [255] + [0] * (num_channels - 1)
+        self.lock = threading.Lock()
+
+        # Statistics
+        self.started = now
+        self.bytes_received = 0
+        self.commands = 0
+        self.pixel_commands = 0
+        self.ignored = 0
+        self.parse_time = 0.0  # seconds spent processing input
+        self.draws = 0
+        self.frames_completed = [0] * num_channels
+        self.morph_lags = []  # ms each morph still needed when the next X cut it off
+
+    #
+    # Input
+    #
+    def process_command(self, cmd):
+        """One ascii command line"""
+        cmd = cmd.strip()
+        if len(cmd) < 2 or not cmd[0].isdigit():
+            self.ignored += 1
+            return  # Discard erroneous stub characters
+        channel = int(cmd[0])
+        if channel >= self.num_channels:
+            self.ignored += 1
+            return
+        self.commands += 1
+        cmd = cmd[1:]
+
+        if cmd[0] == 'X':
+            self.finish_cycle(channel)
+        elif cmd[0] == 'D':
+            self.delay_time[channel] = int(cmd[1:])
+        elif cmd[0] == 'I':
+            self.intensity[channel] = int(cmd[1:])
+        else:
+            self.process_pixel_command(channel, cmd)
+
+    def process_pixel_command(self, channel, cmd):
+        m = pixel_pattern.match(cmd)
+        if not m:
+            self.ignored += 1
+            return
+        i, h, s, v = [int(x) for x in m.groups()]
+        self.set_pixel(channel, i, (h, s, v))
+
+    def set_pixel(self, channel, i, color):
+        if i >= self.num_pixels:
+            self.ignored += 1
+            return
+        self.pixel_commands += 1
+        self.next[channel][i] = color
+
+    def process_frame(self, frame):
+        """One decoded binary frame"""
+        channel = frame.channel
+        if channel >= self.num_channels:
+            self.ignored += 1
+            return
+        self.commands += 1
+        if frame.flags & protocol.FLAG_INTENSITY:
+            self.intensity[channel] = frame.intensity
+        if frame.flags & protocol.FLAG_START:
+            self.finish_cycle(channel)
+        for (i, h, s, v) in frame.pixels:
+            self.set_pixel(channel, i, (h, s, v))
+        if frame.flags & protocol.FLAG_DELAY:
+            self.delay_time[channel] = frame.delay
+
+    def finish_cycle(self, channel, now=None):
+        """Morph to the end and push the frame buffer"""
+        now = now or time.time()
+        if self.frames_completed[channel]:  # The first delay is a dummy value
+            elapsed = (now - self.start_time[channel]) * 1000
+            self.morph_lags.append(max(0.0, self.delay_time[channel] - elapsed))
+            if len(self.morph_lags) > 1000:
+                del self.morph_lags[:500]
+
+        self.morph[channel] = list(self.next[channel])
+        self.curr[channel] = list(self.next[channel])
+        self.start_time[channel] = now
+        self.frames_completed[channel] += 1
+
+    #
+    # Output
+    #
+    def is_channel_active(self, channel):
+        return self.intensity[channel] > 0
+
+    def draw(self, now=None):
+        """update_morph() and interpChannels() of one sketch frame"""
+        now = now or time.time()
+        with self.lock:
+            for channel in range(self.num_channels):
+                fract = (now - self.start_time[channel]) * 1000 / float(max(1, self.delay_time[channel]))
+                if self.is_channel_active(channel) and fract <= 1.0:
+                    curr, nxt = self.curr[channel], self.next[channel]
+                    self.morph[channel] = [interp_color(curr[i], nxt[i], fract) for i in range(self.num_pixels)]
+            self.interp_channels()
+            self.draws += 1
+
+    def interp_channels(self):
+        """Blend the first two channels by intensity"""
+        if self.num_channels < 2 or not self.is_channel_active(0):
+            self.interp = list(self.morph[min(1, self.num_channels - 1)])
+        elif not self.is_channel_active(1):
+            self.interp = list(self.morph[0])
+        else:
+            fract = self.intensity[0] / float(self.intensity[0] + self.intensity[1])
+            self.interp = [interp_color(c1, c0, fract) for (c0, c1) in zip(self.morph[0], self.morph[1])]
+
+    def stats(self):
+        """Throughput, parse time, frames completed and morph lag"""
+        elapsed = max(1e-6, time.time() - self.started)
+        lags = self.morph_lags or [0.0]
+        frames = sum(self.frames_completed)
+        return {
+            'seconds': elapsed,
+            'bytes': self.bytes_received,
+            'bytes_per_second': self.bytes_received / elapsed,
+            'commands': self.commands,
+            'pixel_commands': self.pixel_commands,
+            'ignored': self.ignored,
+            'parse_seconds': self.parse_time,
+            'parse_us_per_frame': 1e6 * self.parse_time / frames if frames else 0.0,
+            'frames_completed': list(self.frames_completed),
+            'frames_per_second': frames / elapsed,
+            'draws': self.draws,
+            'morph_lag_ms_avg': sum(lags) / len(lags),
+            'morph_lag_ms_max': max(lags),
+        }
+
+
+class Connection(object):
+    """Buffers one client's bytes and feeds whole commands to the simulator"""
+    def __init__(self, sock, simulator):
+        self.sock = sock
+        self.simulator = simulator
+        self.buffer = bytearray()
+        self.decoder = None  # FrameDecoder once the client turns out to speak binary
+
+    def receive(self, data):
+        sim = self.simulator
+        start = time.time()
+        with sim.lock:
+            sim.bytes_received += len(data)
+            if self.decoder is None and len(self.buffer) + len(data) >= len(protocol.MAGIC):
+                if bytes((self.buffer + data)[:len(protocol.MAGIC)]) == protocol.MAGIC:
+                    self.decoder = protocol.FrameDecoder()
+
+            if self.decoder:
+                for frame in self.decoder.feed(self.buffer + data):
+                    sim.process_frame(frame)
+                self.buffer = bytearray()
+            else:
+                self.buffer.extend(data)
+                end = self.buffer.rfind(b'\n')
+                if end >= 0:
+                    for line in bytes(self.buffer[:end]).decode('ascii', 'replace').split('\n'):
+                        sim.process_command(line)
+                    del self.buffer[:end + 1]
+            sim.parse_time += time.time() - start
+
+
+class HeadlessServer(object):
+    """Listen on one port per channel, like the sketch, and draw at FRAME_RATE"""
+    def __init__(self, simulator, host='localhost', port=4444, frame_rate=FRAME_RATE):
+        self.simulator = simulator
+        self.frame_rate = frame_rate
+        self.listeners = []
+        for i in range(simulator.num_channels):
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            s.bind((host, port + i if port else 0))  # port 0: any free ports
+            s.listen(4)
+            self.listeners.append(s)
+        self.connections = {}
+        self.running = True
+
+    @property
+    def ports(self):
+        return [s.getsockname()[1] for s in self.listeners]
+
+    def serve_forever(self):
+        next_draw = time.time()
+        while self.running:
+            timeout = max(0.0, next_draw - time.time())
+            readable, _, _ = select.select(self.listeners + list(self.connections), [], [], timeout)
+            for s in readable:
+                if s in self.listeners:
+                    client, _ = s.accept()
+                    self.connections[client] = Connection(client, self.simulator)
+                    continue
+                try:
+                    data = s.recv(65536)
+                except socket.error:
+                    data = None
+                if data:
+                    self.connections[s].receive(data)
+                else:
+                    s.close()
+                    del self.connections[s]
+
+            if time.time() >= next_draw:
+                self.simulator.draw()
+                next_draw += 1.0 / self.frame_rate
+
+        for s in self.listeners + list(self.connections):
+            s.close()
+
+    def start(self):
+        """Serve from a daemon thread. Return the thread"""
+        thread = threading.Thread(target=self.serve_forever, name="HeadlessServer")
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.running = False
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Headless Tree Simulator')
+    parser.add_argument('--port', type=int, default=4444, help='first port (default 4444)')
+    parser.add_argument('--channels', type=int, default=2, help='number of channels (default 2)')
+    parser.add_argument('--report', type=float, default=5.0, help='seconds between reports (default 5)')
+    args = parser.parse_args()
+
+    simulator = HeadlessSimulator(num_channels=args.channels)
+    server = HeadlessServer(simulator, port=args.port)
+    print ("Headless Tree Simulator listening on ports {}".format(server.ports))
+    server.start()
+
+    try:
+        while True:
+            time.sleep(args.report)
+            stats = simulator.stats()
+            print ("{bytes_per_second:.0f} bytes/s, {frames_per_second:.1f} frames/s {frames_completed}, "
+                   "parse {parse_us_per_frame:.0f} us/frame, morph lag avg {morph_lag_ms_avg:.0f} ms "
+                   "max {morph_lag_ms_max:.0f} ms, {ignored} ignored".format(**stats))
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        print ("Exiting on keyboard interrupt")
+        server.stop()
@@ -0,0 +1,5 @@
+
+def default_tree():
+    """The standard Tree, for output models that need its layout before a show's tree exists"""
+    from tree import Tree
+    return Tree(None)
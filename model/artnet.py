@@ -0,0 +1,202 @@
+"""
+Model to drive standard lighting controllers over Art-Net or sACN (E1.31)
+
+Tree pixels are converted to rgb and packed, 3 channels each, into as few
+512-channel DMX universes as possible. A pixel never straddles two
+universes, so a full universe holds 170 pixels. The pixel -> (universe,
+offset) table is worked out once; every go() sends each universe as
+one datagram. set_cells() converts a frame's changed pixels with one
+hsv_to_rgb_array() call and writes them into the universes at once.
+
+pixel.rc: artnet_universe=1, artnet_channel=1 are the first universe and
+first (1-based) DMX channel of the tree.
+"""
+import socket
+import struct
+import uuid
+import numpy as np
+from color import hsv_to_rgb_array
+from HelperFunctions import byte_clamp
+from model import default_tree
+from model.delta import clamp_color
+
+ARTNET = 'artnet'
+SACN = 'sacn'
+PORTS = {ARTNET: 6454, SACN: 5568}
+DMX_CHANNELS = 512
+
+# Art-Net ArtDmx
+ARTNET_ID = b'Art-Net\x00'
+ARTNET_OPDMX = 0x5000
+ARTNET_VERSION = 14
+ARTDMX_HEADER = struct.Struct('<8sH')  # id, opcode (little endian)
+ARTDMX_FIELDS = struct.Struct('!HBBBBH')  # version, sequence, physical, sub-uni, net, length
+
+# sACN E1.31 data packet
+ACN_ID = b'ASC-E1.17\x00\x00\x00'
+SACN_ROOT = struct.Struct('!HH12sHI16s')  # preamble, postamble, id, flags+length, vector, cid
+SACN_FRAMING = struct.Struct('!HI64sBHBBH')  # flags+length, vector, source, priority, sync, seq, options, universe
+SACN_DMP = struct.Struct('!HBBHHHB')  # flags+length, vector, type, first address, increment, count, start code
+SACN_HEADER_SIZE = SACN_ROOT.size + SACN_FRAMING.size + SACN_DMP.size
+
+
+def universe_table(num_pixels, start_channel=1, channels_per_pixel=3):
+    """Return (table, num_universes). table[pixel] = (universe index, byte offset)"""
+    table = []
+    universe = 0
+    offset = start_channel - 1
+    for _ in range(num_pixels):
+        if offset + channels_per_pixel > DMX_CHANNELS:
+            universe += 1
+            offset = 0
+        table.append((universe, offset))
+        offset += channels_per_pixel
+    return table, universe + 1
+
+
+def artdmx_packet(universe, seq, data):
+    """Art-Net ArtDmx packet for one universe. Art-Net asks for an even length"""
+    length = len(data) + (len(data) % 2)
+    packet = bytearray(ARTDMX_HEADER.pack(ARTNET_ID, ARTNET_OPDMX))
+    packet.extend(ARTDMX_FIELDS.pack(ARTNET_VERSION, seq, 0, universe & 0xff, (universe >> 8) & 0x7f, length))
+    packet.extend(data)
+    packet.extend(bytearray(length - len(data)))
+    return packet
+
+
+def sacn_packet(universe, seq, data, cid, source=b'Tree', priority=100):
+    """sACN E1.31 data packet for one universe"""
+    count = len(data) + 1  # plus the start code
+    dmp_length = SACN_DMP.size + len(data)
+    framing_length = SACN_FRAMING.size + dmp_length
+    root_length = SACN_ROOT.size - 16 + framing_length  # flags+length counts from itself
+    packet = bytearray(SACN_ROOT.pack(0x0010, 0, ACN_ID, 0x7000 | root_length, 0x00000004, cid))
+    packet.extend(SACN_FRAMING.pack(0x7000 | framing_length, 0x00000002, source, priority, 0, seq, 0, universe))
+    packet.extend(SACN_DMP.pack(0x7000 | dmp_length, 0x02, 0xa1, 0, 1, count, 0))
+    packet.extend(data)
+    return packet
+
+
+def decode_packet(data):
+    """Reference decoder for stand-in listeners. Return (universe, dmx bytearray)"""
+    data = bytearray(data)
+    if data[:len(ARTNET_ID)] == ARTNET_ID:
+        offset = ARTDMX_HEADER.size
+        version, seq, physical, subuni, net, length = ARTDMX_FIELDS.unpack_from(bytes(data), offset)
+        offset += ARTDMX_FIELDS.size
+        return (net << 8) | subuni, data[offset:offset + length]
+    if data[4:4 + len(ACN_ID)] == ACN_ID:
+        framing = SACN_FRAMING.unpack_from(bytes(data), SACN_ROOT.size)
+        count = SACN_DMP.unpack_from(bytes(data), SACN_ROOT.size + SACN_FRAMING.size)[5]
+        return framing[7], data[SACN_HEADER_SIZE:SACN_HEADER_SIZE + count - 1]
+    raise ValueError("Not an Art-Net or sACN packet")
+
+
+class ArtNetModel(object):
+    def __init__(self, hostname, channel=0, port=None, protocol=ARTNET,
+                 universe=1, start_channel=1, num_pixels=None):
+        if protocol not in PORTS:
+            raise ValueError("Unknown protocol {}. Choose from {}".format(protocol, sorted(PORTS)))
+        self.protocol = protocol
+        self.server = (hostname, port or PORTS[protocol])
+        self.channel = channel
+        self.debug = False
+        self.sock = None
+        self.dirty = {}  # { cell: color } map to be sent on the next call to "go"
+        self.intensity = 255
+        self.delay = 0  # DMX does not morph, so this is informational
+        self.first_universe = universe
+        self.seq = 0
+        self.cid = uuid.uuid4().bytes  # sACN source id
+        self.packets_sent = 0
+        self.bytes_sent = 0
+
+        if num_pixels is None:
+            num_pixels = default_tree().num_pixels
+        self.table, num_universes = universe_table(num_pixels, start_channel)
+        self.universes = np.zeros((num_universes, DMX_CHANNELS), dtype=np.uint8)
+        self.lengths = [0] * num_universes  # channels in use, so a part-full universe sends a short packet
+        for (universe, offset) in self.table:
+            self.lengths[universe] = offset + 3
+        # r, g and b channels of every pixel in the flattened universes
+        self.channels = np.array([universe * DMX_CHANNELS + offset for (universe, offset) in self.table],
+                                 dtype=np.intp)[:, None] + np.arange(3)
+        self.hsv = np.zeros((num_pixels, 3), dtype=np.uint8)  # as last set, to re-apply intensity
+
+        self.connect()
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def __repr__(self):
+        return "{} Model Channel {} ({}, port={}, universes={}-{}, debug={})".format(
+            self.protocol, self.channel, self.server[0], self.server[1],
+            self.first_universe, self.first_universe + len(self.universes) - 1, self.debug)
+
+    def get_channel(self):
+        return self.channel
+
+    # Model basics
+
+    def set_cell(self, cell, color):
+        """Set the model's coord to a color"""
+        self.dirty[cell] = color
+
+    def set_cells(self, ids, colors):
+        """Set an array of cells to an (n, 3) array of uint8 hsv colors, already clamped"""
+        ids = np.asarray(ids, dtype=np.intp)
+        known = (ids >= 0) & (ids < len(self.hsv))
+        self.hsv[ids[known]] = colors[known]
+        self._write_pixels(ids[known])
+
+    def set_rgb_cells(self, ids, rgb):
+        """Set an array of cells to an (n, 3) array of uint8 rgb colors ready for the leds:
+           the output stage adjusted and dimmed them (see OutputStage.apply_rgb)"""
+        ids = np.asarray(ids, dtype=np.intp)
+        known = (ids >= 0) & (ids < len(self.hsv))
+        self.universes.reshape(-1)[self.channels[ids[known]]] = rgb[known]
+
+    def go(self):
+        """Convert the dirty pixels to rgb and send every universe"""
+        if self.dirty:
+            self.set_cells(np.fromiter(self.dirty.keys(), dtype=np.intp, count=len(self.dirty)),
+                           np.array([clamp_color(color) for color in self.dirty.values()], dtype=np.uint8))
+            self.dirty = {}
+        self.send_universes()
+
+    def flush(self):
+        """Datagrams go out on go()"""
+        pass
+
+    def send_delay(self, delay):
+        self.delay = int(delay * 1000)
+
+    def send_intensity(self, intensity):
+        """Scale the brightness of the whole channel (0-255)"""
+        intensity = byte_clamp(intensity)
+        if intensity != self.intensity:
+            self.intensity = intensity
+            self._write_pixels(np.arange(len(self.hsv)))
+
+    def send_universes(self):
+        """One datagram per universe"""
+        self.seq = (self.seq % 255) + 1  # 0 means "no sequencing" in both protocols
+        for (i, data) in enumerate(self.universes):
+            universe = self.first_universe + i
+            data = data[:self.lengths[i]].tobytes()
+            if self.protocol == ARTNET:
+                packet = artdmx_packet(universe, self.seq, data)
+            else:
+                packet = sacn_packet(universe, self.seq, data, self.cid)
+            self.sock.sendto(packet, self.server)
+            self.packets_sent += 1
+            self.bytes_sent += len(packet)
+
+        if self.debug:
+            print ("{}: sent {} universes, sequence {}".format(self.protocol, len(self.universes), self.seq))
+
+    def _write_pixels(self, ids):
+        """Convert the pixels of ids to rgb at the channel intensity and write them into their universes"""
+        hsv = self.hsv[ids]
+        hsv[:, 2] = hsv[:, 2].astype(np.int64) * self.intensity // 255
+        self.universes.reshape(-1)[self.channels[ids]] = hsv_to_rgb_array(hsv)
@@ -0,0 +1,90 @@
+"""
+Run-length delta encoding of a frame's changed pixels
+
+Tree.send_frame() finds the pixels whose color changed since the last
+frame. Shows like Light_One_Up, BackForth, Pulse2 or set_all_cells change
+long stretches of neighboring ids to the same color, so the changes are
+grouped into runs of (start_id, count, color). Ids that fall between two
+runs are "same as previous frame" and cost nothing.
+"""
+from HelperFunctions import byte_clamp
+from model import protocol
+
+
+def clamp_color(color):
+    """The color as the wire sees it: wrapped hue, clamped saturation and value"""
+    return byte_clamp(color[0], wrap=True), byte_clamp(color[1]), byte_clamp(color[2])
+
+
+def encode_runs(changes):
+    """changes is a list of (id, hsv). Return (start, count, hsv) runs of
+       consecutive ids that share one color, in id order"""
+    runs = []
+    start, count, last = None, 0, None
+    for (cell, color) in sorted(changes):
+        color = clamp_color(color)
+        if count and cell == start + count and color == last:
+            count += 1
+            continue
+        if count:
+            runs.append((start, count, last))
+        start, count, last = cell, 1, color
+    if count:
+        runs.append((start, count, last))
+    return runs
+
+
+class DeltaEncoder(object):
+    """Encode changes as runs and keep per-frame size statistics.
+       Sizes are binary body bytes: what was sent against one record per pixel.
+       Runs that the model gets back as single pixels are counted as pixels"""
+    def __init__(self):
+        self.frames = 0
+        self.pixels = 0
+        self.runs = 0
+        self.naive_bytes = 0
+        self.encoded_bytes = 0
+
+        # Last frame
+        self.frame_pixels = 0
+        self.frame_runs = 0
+        self.frame_naive_bytes = 0
+        self.frame_encoded_bytes = 0
+
+    def encode(self, changes, sent_as_runs=True):
+        """changes as runs. sent_as_runs is False if the model will send them pixel by pixel"""
+        runs = encode_runs(changes)
+
+        self.frame_pixels = len(changes)
+        self.frame_runs = len(runs) if sent_as_runs else 0
+        self.frame_naive_bytes = protocol.RECORD.size * len(changes)
+        if sent_as_runs:
+            self.frame_encoded_bytes = protocol.RUN.size * len(runs)
+        else:
+            self.frame_encoded_bytes = self.frame_naive_bytes
+
+        self.frames += 1
+        self.pixels += self.frame_pixels
+        self.runs += self.frame_runs
+        self.naive_bytes += self.frame_naive_bytes
+        self.encoded_bytes += self.frame_encoded_bytes
+        return runs
+
+    def ratio(self):
+        """Encoded size as a fraction of the naive size, over all frames"""
+        return self.encoded_bytes / float(self.naive_bytes) if self.naive_bytes else 1.0
+
+    def stats(self):
+        """Counters as a dictionary"""
+        return {
+            'frames': self.frames,
+            'pixels': self.pixels,
+            'runs': self.runs,
+            'naive_bytes': self.naive_bytes,
+            'encoded_bytes': self.encoded_bytes,
+            'ratio': self.ratio(),
+            'frame_pixels': self.frame_pixels,
+            'frame_runs': self.frame_runs,
+            'frame_naive_bytes': self.frame_naive_bytes,
+            'frame_encoded_bytes': self.frame_encoded_bytes,
+        }
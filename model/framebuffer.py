@@ -0,0 +1,81 @@
+"""
+Whole-frame write coalescing
+
+Every command of a frame (start marker, pixels, delay, intensity) is
+assembled in one preallocated buffer, then sent with a single sendall()
+instead of hundreds of tiny socket writes.
+"""
+
+
+class FrameBuffer(object):
+    """A growable, reusable byte buffer for one frame of commands"""
+    def __init__(self, size=16384):
+        self.buffer = bytearray(size)
+        self.length = 0  # bytes assembled for the current frame
+
+        # Counters
+        self.frames = 0  # frames flushed
+        self.bytes_sent = 0
+        self.syscalls = 0  # socket calls made to send the frames
+        self.frame_bytes = 0  # bytes in the last flushed frame
+        self.frame_syscalls = 0  # socket calls for the last flushed frame
+
+    def __len__(self):
+        return self.length
+
+    def reserve(self, size):
+        """Make room for size more bytes. Return the offset to write them at"""
+        offset = self.length
+        end = offset + size
+        if end > len(self.buffer):
+            self.buffer.extend(bytearray(max(end, 2 * len(self.buffer)) - len(self.buffer)))
+        self.length = end
+        return offset
+
+    def write(self, data):
+        """Append bytes to the frame"""
+        offset = self.reserve(len(data))
+        self.buffer[offset:self.length] = data
+
+    def clear(self):
+        self.length = 0
+
+    def flush(self, sock):
+        """Send the assembled frame with one sendall. Return the number of bytes sent"""
+        if not self.length:
+            return 0
+
+        sent = self.length
+        try:
+            sock.sendall(memoryview(self.buffer)[:sent])
+        finally:
+            self.length = 0
+
+        self.frames += 1
+        self.bytes_sent += sent
+        self.syscalls += 1
+        self.frame_bytes = sent
+        self.frame_syscalls = 1
+        return sent
+
+    def take(self):
+        """Return the assembled frame as bytes and start a new one. The caller sends it"""
+        data = bytes(self.buffer[:self.length])
+        self.length = 0
+        if data:
+            self.frames += 1
+            self.bytes_sent += len(data)
+            self.frame_bytes = len(data)
+            self.frame_syscalls = 0
+        return data
+
+    def stats(self):
+        """Counters as a dictionary"""
+        return {
+            'frames': self.frames,
+            'bytes': self.bytes_sent,
+            'syscalls': self.syscalls,
+            'frame_bytes': self.frame_bytes,
+            'frame_syscalls': self.frame_syscalls,
+            'bytes_per_frame': self.bytes_sent / float(self.frames) if self.frames else 0.0,
+        }
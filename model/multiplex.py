@@ -0,0 +1,201 @@
+"""
+Carry several show channels over one connection
+
+Every command is already channel-tagged: ascii lines start with the
+channel digit and binary frames carry a channel byte, so the sketch (or
+any consumer) can read all channels from one socket.
+
+Each channel gets a ChannelModel that assembles its frames exactly like
+a SimulatorModel, then hands them to the MultiplexConnection. A single
+writer thread waits until every channel has a frame for the tick (or
+max_wait seconds have gone by) and sends them, in channel order, with
+one sendall(). Both channels' frames for a tick arrive together.
+
+While the writer is stuck in sendall() on a slow consumer, each channel
+queues at most max_frames frames, with the policies of FrameSender (see
+model/sender.py): drop the oldest frame or coalesce the queue, then ask
+that channel for a keyframe. With 'block' the channel waits instead.
+"""
+import socket
+import threading
+import time
+import traceback
+from collections import deque
+from model import protocol
+from model.framebuffer import FrameBuffer
+from model.sender import BLOCK, COALESCE, DROP_OLDEST, POLICIES
+from model.simulator import SimulatorModel
+
+
+class MultiplexConnection(object):
+    def __init__(self, hostname, port=4444, num_channels=2, max_wait=0.02, policy=COALESCE, max_frames=4):
+        if policy not in POLICIES:
+            raise ValueError("Unknown sender policy {}. Choose from {}".format(policy, POLICIES))
+        self.server = (hostname, port)
+        self.num_channels = num_channels
+        self.max_wait = max_wait  # seconds to wait for the other channels
+        self.policy = policy
+        self.max_frames = max(1, max_frames)  # queued frames per channel
+        self.sock = None
+        self.buffer = FrameBuffer()
+        self.pending = [deque() for _ in range(num_channels)]  # frames waiting for the next tick
+        self.keyframe_needed = [False] * num_channels
+        self.first_pending = None  # time the oldest waiting frame arrived
+        self.condition = threading.Condition()
+        self.running = True
+
+        # Counters
+        self.ticks = 0
+        self.aligned_ticks = 0  # ticks that carried every channel
+        self.submitted = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.blocked = 0  # times a channel had to wait
+        self.errors = 0
+
+        self.connect()
+        self.writer = threading.Thread(target=self.run, name="MultiplexWriter")
+        self.writer.daemon = True
+        self.writer.start()
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.connect(self.server)
+
+    def __repr__(self):
+        return "Multiplex Connection ({}, port={}, channels={})".format(self.server[0],
+                                                                       self.server[1],
+                                                                       self.num_channels)
+
+    def channel_model(self, channel, protocol=protocol.ASCII):
+        """A model for one channel that writes through this connection"""
+        return ChannelModel(self, channel, protocol)
+
+    def is_full(self, channel):
+        return len(self.pending[channel]) >= self.max_frames
+
+    def wants_keyframe(self, channel):
+        """True if the channel's next frame should carry every pixel"""
+        with self.condition:
+            return self.keyframe_needed[channel] or (self.policy == COALESCE and self.is_full(channel))
+
+    def submit(self, channel, data, keyframe=False):
+        """Queue one channel's frame for the next tick. Only blocks with the 'block' policy"""
+        with self.condition:
+            self.submitted += 1
+            frames = self.pending[channel]
+            if keyframe and self.policy != BLOCK:
+                # A keyframe supersedes every stale delta still in the queue
+                self.coalesced += len(frames)
+                frames.clear()
+                self.keyframe_needed[channel] = False
+            elif self.is_full(channel):
+                if self.policy == BLOCK:
+                    self.blocked += 1
+                    while self.is_full(channel) and self.running:
+                        self.condition.wait()
+                elif self.policy == DROP_OLDEST:
+                    frames.popleft()
+                    self.dropped += 1
+                    self.keyframe_needed[channel] = True
+                else:
+                    self.coalesced += len(frames)
+                    frames.clear()
+                    self.keyframe_needed[channel] = True
+
+            if self.first_pending is None:
+                self.first_pending = time.time()
+            frames.append(data)
+            self.condition.notify_all()
+
+    def _tick_ready(self):
+        if self.first_pending is None:
+            return False
+        if all(self.pending):
+            return True
+        return time.time() - self.first_pending >= self.max_wait
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not self._tick_ready():
+                    if self.first_pending is None:
+                        self.condition.wait()
+                    else:
+                        self.condition.wait(max(0.0, self.first_pending + self.max_wait - time.time()))
+                if self.first_pending is None:
+                    return  # stopped with nothing left to send
+
+                if all(self.pending):
+                    self.aligned_ticks += 1
+                for frames in self.pending:
+                    while frames:
+                        self.buffer.write(frames.popleft())
+                self.first_pending = None
+                self.ticks += 1
+                self.condition.notify_all()  # wake a blocked channel
+
+            try:
+                self.buffer.flush(self.sock)
+            except socket.error:
+                print ("MultiplexConnection: error writing frames")
+                traceback.print_exc()
+                with self.condition:
+                    self.errors += 1
+                    self.keyframe_needed = [True] * self.num_channels
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+    def stats(self):
+        """Counters as a dictionary"""
+        with self.condition:
+            stats = self.buffer.stats()
+            stats.update({
+                'ticks': self.ticks,
+                'aligned_ticks': self.aligned_ticks,
+                'policy': self.policy,
+                'queued': sum(len(frames) for frames in self.pending),
+                'submitted': self.submitted,
+                'dropped': self.dropped,
+                'coalesced': self.coalesced,
+                'blocked': self.blocked,
+                'errors': self.errors,
+            })
+            return stats
+
+
+class ChannelModel(SimulatorModel):
+    """A SimulatorModel whose frames go through a shared MultiplexConnection"""
+    def __init__(self, mux, channel, protocol=protocol.ASCII):
+        self.mux = mux
+        super(ChannelModel, self).__init__(mux.server[0], channel, port=mux.server[1], protocol=protocol)
+
+    def connect(self):
+        """The connection belongs to the multiplexer"""
+        pass
+
+    def __repr__(self):
+        return "Tree Model Channel {} (via {}, protocol={}, debug={})".format(self.channel,
+                                                                             self.mux,
+                                                                             self.protocol,
+                                                                             self.debug)
+
+    def go(self):
+        if self.mux.wants_keyframe(self.channel):
+            self.keyframe = True
+        super(ChannelModel, self).go()
+
+    def flush(self):
+        """Hand the assembled frame to the multiplexer"""
+        keyframe = self.keyframe
+        if self.is_binary():
+            self.assemble_binary_frame()
+        self.keyframe = False
+
+        data = self.buffer.take()
+        if data:
+            self.mux.submit(self.channel, data, keyframe)
@@ -0,0 +1,262 @@
+"""
+Model to drive a PixelPusher directly over UDP, with no Processing sketch
+
+PixelPusher packet:
+    sequence number  uint32, little endian
+    then one or more strips of
+        strip number   byte
+        pixel data     r,g,b bytes for every pixel on the strip
+
+Strip layout follows the Processing sketch (fill_paired_lookup_array):
+every tree pixel is a pair of leds. Each trunk's strand runs out along
+every branch and back again, so a trunk is 2 x 404 = 808 leds, split
+over two 404-pixel strips (pixel.rc: 6 strips of 404 pixels). The way
+out is numbered in walk order; the way back comes from the sketch's
+hand-made reverse_lookup_table, as wired on the tree, overlaps and
+unlit leds included.
+
+Colors are kept as arrays: the hsv of every pixel, and the rgb of every
+led. set_cells() converts a frame's changed pixels with one
+hsv_to_rgb_array() call and copies them to their leds.
+"""
+import socket
+import struct
+import numpy as np
+from color import hsv_to_rgb_array
+from geometry import GENERATION_LENGTHS
+from HelperFunctions import byte_clamp
+from model import default_tree
+from model.delta import clamp_color
+
+PUSHER_PORT = 9897
+MAX_PACKET = 1460  # Keep packets inside one ethernet frame
+PIXELS_PER_STRIP = 404
+SEQUENCE = struct.Struct('<I')
+COLOR_ORDERS = {'rgb': (0, 1, 2), 'rbg': (0, 2, 1), 'grb': (1, 0, 2),
+                'gbr': (1, 2, 0), 'brg': (2, 0, 1), 'bgr': (2, 1, 0)}
+
+
+# The sketch's reverse_lookup_table: forward leds first to last light up again on
+# the way back, counting down from reverse (the last column is not used)
+REVERSE_LOOKUP_TABLE = (
+    # first, last, reverse, (end)
+    (0, 55, 807, 752),
+    (56, 93, 403, 366),
+    (94, 121, 229, 202),
+    (122, 141, 161, 142),
+    (162, 181, 201, 182),
+    (230, 257, 365, 338),
+    (258, 277, 292, 278),
+    (298, 317, 337, 318),
+    (404, 441, 751, 714),
+    (442, 469, 577, 550),
+    (470, 489, 509, 490),
+    (510, 529, 549, 530),
+    (578, 605, 686, 713),
+    (606, 625, 645, 626),
+    (646, 665, 685, 666),
+)
+
+
+def get_reverse_led(forward_led):
+    """The sketch's get_reverse_led(): the led paired with a forward led on the way back"""
+    for (first, last, reverse, _) in REVERSE_LOOKUP_TABLE:
+        if first <= forward_led <= last:
+            return reverse - (forward_led - first)
+    raise ValueError("no reverse led for led {}".format(forward_led))
+
+
+def is_sketch_trunk(tree):
+    """True if the trunks have the shape the sketch's reverse_lookup_table was made for"""
+    lengths = tuple(tree.get_generation_length(gen) for gen in range(tree.num_generations + 1))
+    return tree.num_branches == 2 and lengths == GENERATION_LENGTHS
+
+
+def strand_ids(tree, trunk):
+    """Pixel ids in led order along one trunk's out-and-back strand, None for an unlit led.
+
+       As in fill_paired_lookup_array(), each pixel takes its forward led, then its reverse
+       led from REVERSE_LOOKUP_TABLE; a led the table gives twice goes to the later pixel.
+       Trunks of another shape come back along the same leds in reverse order"""
+    forward = []  # (led, pixel id) on the way out, in walk order
+    reverse = {}  # pixel id: led on the way back, for trunks of another shape
+    counter = [0]
+
+    def walk(prefix, gen):
+        segment = [tree.get_pixel(prefix + (i,)).id for i in range(tree.get_generation_length(gen))]
+        forward.extend(zip(range(counter[0], counter[0] + len(segment)), segment))
+        counter[0] += len(segment)
+        if gen < tree.num_generations:
+            for branch in range(tree.num_branches):
+                walk(prefix + (branch,), gen + 1)
+        for (i, cell) in enumerate(reversed(segment)):
+            reverse[cell] = counter[0] + i
+        counter[0] += len(segment)
+
+    walk((trunk,), 0)
+    sketch = is_sketch_trunk(tree)
+    ids = [None] * counter[0]
+    for (led, cell) in forward:
+        ids[led] = cell
+        ids[get_reverse_led(led) if sketch else reverse[cell]] = cell
+    return ids
+
+
+def tree_strip_layout(tree, pixels_per_strip=PIXELS_PER_STRIP):
+    """List of strips, each a list of pixel ids in led order"""
+    strips = []
+    for trunk in range(tree.num_trunks):
+        ids = strand_ids(tree, trunk)
+        for start in range(0, len(ids), pixels_per_strip):
+            strips.append(ids[start:start + pixels_per_strip])
+    return strips
+
+
+def decode_packet(data, pixels_per_strip=PIXELS_PER_STRIP):
+    """Reference decoder for stand-in pushers. Return (sequence, { strip: bytearray(rgb) })"""
+    seq = SEQUENCE.unpack_from(data, 0)[0]
+    strip_size = 1 + 3 * pixels_per_strip
+    strips = {}
+    for offset in range(SEQUENCE.size, len(data), strip_size):
+        strips[bytearray(data[offset:offset + 1])[0]] = bytearray(data[offset + 1:offset + strip_size])
+    return seq, strips
+
+
+class PixelPusherModel(object):
+    def __init__(self, hostname, channel=0, port=PUSHER_PORT, strips=None,
+                 pixels_per_strip=PIXELS_PER_STRIP, order='rgb'):
+        self.server = (hostname, port)
+        self.channel = channel
+        self.debug = False
+        self.sock = None
+        self.dirty = {}  # { cell: color } map to be sent on the next call to "go"
+        self.pixels_per_strip = pixels_per_strip
+        self.order = COLOR_ORDERS[order]
+        self.intensity = 255
+        self.delay = 0  # The pusher does not morph, so this is informational
+        self.seq = 0
+        self.packets_sent = 0
+        self.bytes_sent = 0
+
+        self.num_strips = 0
+        self.led_ids = None  # pixel id of every led, strip after strip (-1: dark)
+        self.cell_leds = None  # leds of every pixel id, one row each (-1: padding)
+        self.hsv = None  # hsv of every pixel id as last set, to re-apply intensity
+        self.rgb = None  # rgb of every pixel id, dimmed and in the strips' color order
+        self.leds = None  # rgb of every led, in the strips' color order
+        self.dirty_strips = set()
+        self.set_layout(strips if strips is not None else tree_strip_layout(default_tree(), pixels_per_strip))
+
+        self.connect()
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def __repr__(self):
+        return "PixelPusher Model Channel {} ({}, port={}, strips={}, debug={})".format(self.channel,
+                                                                                       self.server[0],
+                                                                                       self.server[1],
+                                                                                       len(self.strip_data),
+                                                                                       self.debug)
+
+    def get_channel(self):
+        return self.channel
+
+    def set_layout(self, strips):
+        """strips is a list of lists of pixel ids in led order (None: the led stays dark)"""
+        self.num_strips = len(strips)
+        self.led_ids = np.full(self.num_strips * self.pixels_per_strip, -1, dtype=np.intp)
+        for (strip, ids) in enumerate(strips):
+            for (led, cell) in enumerate(ids):
+                if cell is not None:
+                    self.led_ids[strip * self.pixels_per_strip + led] = cell
+        lit = np.flatnonzero(self.led_ids >= 0)
+        lit = lit[np.argsort(self.led_ids[lit], kind='stable')]  # by pixel id
+        counts = np.bincount(self.led_ids[lit], minlength=0)
+        self.cell_leds = np.full((len(counts), max(counts.max() if len(counts) else 0, 1)), -1, dtype=np.intp)
+        self.cell_leds[self.led_ids[lit], np.arange(len(lit)) - np.repeat(np.cumsum(counts) - counts, counts)] = lit
+        self.hsv = np.zeros((len(counts), 3), dtype=np.uint8)
+        self.rgb = np.zeros_like(self.hsv)
+        self.leds = np.zeros((len(self.led_ids), 3), dtype=np.uint8)
+        self.dirty_strips = set(range(self.num_strips))
+
+    @property
+    def strips_per_packet(self):
+        return max(1, (MAX_PACKET - SEQUENCE.size) // (1 + 3 * self.pixels_per_strip))
+
+    # Model basics
+
+    def set_cell(self, cell, color):
+        """Set the model's coord to a color"""
+        self.dirty[cell] = color
+
+    def set_cells(self, ids, colors):
+        """Set an array of cells to an (n, 3) array of uint8 hsv colors, already clamped"""
+        ids = np.asarray(ids, dtype=np.intp)
+        known = (ids >= 0) & (ids < len(self.hsv))
+        self.hsv[ids[known]] = colors[known]
+        self._write_pixels(ids[known])
+
+    def set_rgb_cells(self, ids, rgb):
+        """Set an array of cells to an (n, 3) array of uint8 rgb colors ready for the leds:
+           the output stage adjusted and dimmed them (see OutputStage.apply_rgb)"""
+        ids = np.asarray(ids, dtype=np.intp)
+        known = (ids >= 0) & (ids < len(self.hsv))
+        self.rgb[ids[known]] = rgb[known][:, self.order]
+        self._write_leds(ids[known])
+
+    def go(self):
+        """Convert the dirty pixels to rgb and send every changed strip"""
+        if self.dirty:
+            self.set_cells(np.fromiter(self.dirty.keys(), dtype=np.intp, count=len(self.dirty)),
+                           np.array([clamp_color(color) for color in self.dirty.values()], dtype=np.uint8))
+            self.dirty = {}
+        self.send_strips()
+
+    def flush(self):
+        """Datagrams go out on go()"""
+        pass
+
+    def send_delay(self, delay):
+        self.delay = int(delay * 1000)
+
+    def send_intensity(self, intensity):
+        """Scale the brightness of the whole channel (0-255)"""
+        intensity = byte_clamp(intensity)
+        if intensity != self.intensity:
+            self.intensity = intensity
+            self._write_pixels(np.arange(len(self.hsv)))
+
+    def send_strips(self):
+        """Pack the changed strips into as few packets as possible"""
+        strips = sorted(self.dirty_strips)
+        per_packet = self.strips_per_packet
+        for start in range(0, len(strips), per_packet):
+            packet = bytearray(SEQUENCE.pack(self.seq % 2**32))
+            for strip in strips[start:start + per_packet]:
+                packet.append(strip)
+                packet.extend(self.leds[strip * self.pixels_per_strip:(strip + 1) * self.pixels_per_strip].tobytes())
+            self.sock.sendto(packet, self.server)
+            self.seq += 1
+            self.packets_sent += 1
+            self.bytes_sent += len(packet)
+
+            if self.debug:
+                print ("PixelPusher packet {}: strips {}".format(self.seq, strips[start:start + per_packet]))
+        self.dirty_strips = set()
+
+    def _write_pixels(self, ids):
+        """Convert the pixels of ids to rgb at the channel intensity and copy them to their leds"""
+        hsv = self.hsv[ids]
+        hsv[:, 2] = hsv[:, 2].astype(np.int64) * self.intensity // 255
+        self.rgb[ids] = hsv_to_rgb_array(hsv)[:, self.order]
+        self._write_leds(ids)
+
+    def _write_leds(self, ids):
+        """Copy the rgb of the pixels of ids to their leds and mark their strips to be sent"""
+        leds = self.cell_leds[ids].ravel()
+        leds = leds[leds >= 0]
+        self.leds[leds] = self.rgb[self.led_ids[leds]]
+        changed = np.zeros(self.num_strips, dtype=bool)
+        changed[leds // self.pixels_per_strip] = True
+        self.dirty_strips.update(np.flatnonzero(changed).tolist())
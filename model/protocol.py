@@ -0,0 +1,188 @@
+"""
+Compact binary frame format for talking to a Tree simulator or lighter
+
+The ASCII protocol sends one "{channel}{id},{h},{s},{v}" line per pixel.
+A binary frame carries the whole morph cycle in one message:
+
+    header (14 bytes, network byte order)
+        magic      2s  'TF'
+        version    B
+        flags      B   FLAG_* bits below
+        channel    B
+        seq        H   frame sequence number, wraps at 65536
+        delay      I   morph time in milliseconds
+        intensity  B   channel intensity 0-255
+        count      H   number of pixel records (or dense pixels)
+
+    body
+        sparse: count x (id H, h B, s B, v B)
+        dense:  count x (h B, s B, v B) for ids 0 .. count-1
+        runs:   count x (start H, length H, h B, s B, v B), ids start .. start+length-1
+                all set to one color. Ids between runs keep the previous frame's color.
+
+Header-only frames (count = 0, no FLAG_START) update the delay or
+intensity without starting a new morph cycle.
+"""
+import struct
+from collections import namedtuple
+import numpy as np
+
+MAGIC = b'TF'
+VERSION = 1
+
+# Flags
+FLAG_START = 0x01      # Finish the morph cycle, like the ASCII 'X'
+FLAG_DENSE = 0x02      # Body is a dense hsv block, not id records
+FLAG_DELAY = 0x04      # Header delay is valid
+FLAG_INTENSITY = 0x08  # Header intensity is valid
+FLAG_RUNS = 0x10       # Body is (start, length, h, s, v) runs, not id records
+
+# Protocols selectable on a model
+ASCII = 'ascii'
+SPARSE = 'sparse'
+DENSE = 'dense'
+BINARY = 'binary'  # sparse or dense, whichever is smaller for the frame
+PROTOCOLS = (ASCII, SPARSE, DENSE, BINARY)
+
+HEADER = struct.Struct('!2sBBBHIBH')
+RECORD = struct.Struct('!HBBB')
+RUN = struct.Struct('!HHBBB')
+HSV_SIZE = 3
+MAX_ID = 0xffff  # ids and counts are 16 bits: split larger layouts over several channels
+RECORD_DTYPE = np.dtype([('id', '>u2'), ('hsv', 'u1', (HSV_SIZE,))])  # RECORD as a numpy record
+
+Frame = namedtuple('Frame', 'flags channel seq delay intensity pixels')
+
+
+def encode_header(flags, channel, seq, delay, intensity, count):
+    """Pack a frame header. delay is in milliseconds"""
+    return HEADER.pack(MAGIC, VERSION, flags, channel,
+                       seq % 65536, delay, intensity, count)
+
+
+def encode_sparse(flags, channel, seq, delay, intensity, pixels):
+    """Encode a frame of (id, h, s, v) records"""
+    buf = bytearray(sparse_size(len(pixels)))
+    pack_sparse(buf, 0, flags, channel, seq, delay, intensity, pixels)
+    return buf
+
+
+def encode_dense(flags, channel, seq, delay, intensity, hsv_block):
+    """Encode a frame whose body is a dense h,s,v block for every pixel"""
+    buf = bytearray(dense_size(len(hsv_block) // HSV_SIZE))
+    pack_dense(buf, 0, flags, channel, seq, delay, intensity, hsv_block)
+    return buf
+
+
+def pack_sparse(buf, offset, flags, channel, seq, delay, intensity, pixels):
+    """Pack a sparse frame into buf at offset. Return the offset after the frame"""
+    HEADER.pack_into(buf, offset, MAGIC, VERSION, flags & ~FLAG_DENSE, channel,
+                     seq % 65536, delay, intensity, len(pixels))
+    offset += HEADER.size
+    for (i, h, s, v) in pixels:
+        RECORD.pack_into(buf, offset, i, h, s, v)
+        offset += RECORD.size
+    return offset
+
+
+def pack_sparse_arrays(buf, offset, flags, channel, seq, delay, intensity, ids, colors):
+    """pack_sparse() of an id array and an (n, 3) uint8 hsv array, in one copy"""
+    if len(ids) and ids.max() > MAX_ID:
+        raise ValueError("Pixel id {} does not fit in a binary frame (max {})".format(ids.max(), MAX_ID))
+    records = np.empty(len(ids), dtype=RECORD_DTYPE)
+    records['id'] = ids
+    records['hsv'] = colors
+    HEADER.pack_into(buf, offset, MAGIC, VERSION, flags & ~FLAG_DENSE, channel,
+                     seq % 65536, delay, intensity, len(ids))
+    offset += HEADER.size
+    buf[offset:offset + records.nbytes] = records.tobytes()
+    return offset + records.nbytes
+
+
+def pack_dense(buf, offset, flags, channel, seq, delay, intensity, hsv_block):
+    """Pack a dense frame into buf at offset. Return the offset after the frame"""
+    count = len(hsv_block) // HSV_SIZE
+    HEADER.pack_into(buf, offset, MAGIC, VERSION, flags | FLAG_DENSE, channel,
+                     seq % 65536, delay, intensity, count)
+    offset += HEADER.size
+    buf[offset:offset + count * HSV_SIZE] = hsv_block[:count * HSV_SIZE]
+    return offset + count * HSV_SIZE
+
+
+def pack_runs(buf, offset, flags, channel, seq, delay, intensity, runs):
+    """Pack a run-length frame of (start, length, (h, s, v)) into buf at offset.
+       Return the offset after the frame"""
+    HEADER.pack_into(buf, offset, MAGIC, VERSION, (flags | FLAG_RUNS) & ~FLAG_DENSE, channel,
+                     seq % 65536, delay, intensity, len(runs))
+    offset += HEADER.size
+    for (start, length, (h, s, v)) in runs:
+        RUN.pack_into(buf, offset, start, length, h, s, v)
+        offset += RUN.size
+    return offset
+
+
+def runs_size(count):
+    return HEADER.size + RUN.size * count
+
+
+def sparse_size(count):
+    return HEADER.size + RECORD.size * count
+
+
+def dense_size(num_pixels):
+    return HEADER.size + HSV_SIZE * num_pixels
+
+
+def decode_frame(data, offset=0):
+    """Decode one frame at offset. Return (Frame, next_offset),
+       or (None, offset) if the data does not hold a whole frame yet"""
+    if len(data) - offset < HEADER.size:
+        return None, offset
+
+    magic, version, flags, channel, seq, delay, intensity, count = HEADER.unpack_from(data, offset)
+    if magic != MAGIC:
+        raise ValueError("Bad frame magic {!r} at offset {}".format(magic, offset))
+    if version != VERSION:
+        raise ValueError("Unknown frame version {}".format(version))
+
+    body = offset + HEADER.size
+    if flags & FLAG_DENSE:
+        end = body + HSV_SIZE * count
+        if len(data) < end:
+            return None, offset
+        block = bytearray(data[body:end])
+        pixels = [(i, block[i * 3], block[i * 3 + 1], block[i * 3 + 2]) for i in range(count)]
+    elif flags & FLAG_RUNS:
+        end = body + RUN.size * count
+        if len(data) < end:
+            return None, offset
+        pixels = []
+        for n in range(count):
+            start, length, h, s, v = RUN.unpack_from(data, body + n * RUN.size)
+            pixels.extend((i, h, s, v) for i in range(start, start + length))
+    else:
+        end = body + RECORD.size * count
+        if len(data) < end:
+            return None, offset
+        pixels = [RECORD.unpack_from(data, body + n * RECORD.size) for n in range(count)]
+
+    return Frame(flags, channel, seq, delay, intensity, pixels), end
+
+
+class FrameDecoder(object):
+    """Reference stream decoder: feed it socket bytes, get whole frames back"""
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """Append data and return a list of complete Frames"""
+        self.buffer.extend(data)
+        frames = []
+        offset = 0
+        while True:
+            frame, offset = decode_frame(self.buffer, offset)
+            if frame is None:
+                break
+            frames.append(frame)
+        del self.buffer[:offset]
+        return frames
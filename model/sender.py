@@ -0,0 +1,128 @@
+"""
+Asynchronous frame sender
+
+A dedicated writer thread owns the socket. The show runner hands it whole
+encoded frames through a small bounded queue, so rendering never waits
+on a slow consumer (e.g. a Processing sketch stalled in draw()).
+
+Policies when the queue is full:
+    drop_oldest - throw away the oldest queued frame
+    coalesce    - throw away every queued frame; the next frame is a keyframe
+    block       - wait for the writer (the old, synchronous behavior)
+
+After any frame is lost the sender asks for a keyframe: a full frame
+of every pixel, which replaces whatever stale deltas are still queued.
+"""
+import socket
+import threading
+import traceback
+from collections import deque
+
+DROP_OLDEST = 'drop_oldest'
+COALESCE = 'coalesce'
+BLOCK = 'block'
+POLICIES = (DROP_OLDEST, COALESCE, BLOCK)
+
+
+class FrameSender(threading.Thread):
+    def __init__(self, sock, policy=COALESCE, max_frames=4):
+        super(FrameSender, self).__init__(name="FrameSender")
+        if policy not in POLICIES:
+            raise ValueError("Unknown sender policy {}. Choose from {}".format(policy, POLICIES))
+        self.daemon = True
+        self.sock = sock
+        self.policy = policy
+        self.max_frames = max(1, max_frames)
+        self.frames = deque()
+        self.condition = threading.Condition()
+        self.running = True
+        self.keyframe_needed = False
+
+        # Counters
+        self.submitted = 0
+        self.sent = 0
+        self.bytes_sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.blocked = 0  # times the producer had to wait
+        self.errors = 0
+
+    def __repr__(self):
+        return "FrameSender(policy={}, max_frames={}, queued={})".format(self.policy,
+                                                                        self.max_frames,
+                                                                        len(self.frames))
+
+    def is_full(self):
+        return len(self.frames) >= self.max_frames
+
+    def wants_keyframe(self):
+        """True if the next frame should carry every pixel"""
+        with self.condition:
+            return self.keyframe_needed or (self.policy == COALESCE and self.is_full())
+
+    def submit(self, data, keyframe=False):
+        """Queue one encoded frame. Only blocks with the 'block' policy"""
+        with self.condition:
+            self.submitted += 1
+            if keyframe and self.policy != BLOCK:
+                # A keyframe supersedes every stale delta still in the queue
+                self.coalesced += len(self.frames)
+                self.frames.clear()
+                self.keyframe_needed = False
+            elif self.is_full():
+                if self.policy == BLOCK:
+                    self.blocked += 1
+                    while self.is_full() and self.running:
+                        self.condition.wait()
+                elif self.policy == DROP_OLDEST:
+                    self.frames.popleft()
+                    self.dropped += 1
+                    self.keyframe_needed = True
+                else:
+                    self.coalesced += len(self.frames)
+                    self.frames.clear()
+                    self.keyframe_needed = True
+
+            self.frames.append(data)
+            self.condition.notify_all()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.frames:
+                    self.condition.wait()
+                if not self.frames:
+                    return  # stopped and drained
+                data = self.frames.popleft()
+                self.condition.notify_all()  # wake a blocked producer
+
+            try:
+                self.sock.sendall(data)
+                self.sent += 1
+                self.bytes_sent += len(data)
+            except socket.error:
+                print ("FrameSender: error writing frame")
+                traceback.print_exc()
+                with self.condition:
+                    self.errors += 1
+                    self.keyframe_needed = True
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+    def stats(self):
+        """Counters as a dictionary"""
+        with self.condition:
+            return {
+                'policy': self.policy,
+                'queued': len(self.frames),
+                'submitted': self.submitted,
+                'sent': self.sent,
+                'sent_bytes': self.bytes_sent,
+                'dropped': self.dropped,
+                'coalesced': self.coalesced,
+                'blocked': self.blocked,
+                'errors': self.errors,
+            }
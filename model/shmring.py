@@ -0,0 +1,235 @@
+"""
+Model that hands frames to consumers on the same host through shared memory
+
+Frames go into a memory-mapped ring of fixed-size h,s,v frames, with no
+socket and no system call per frame. A preview window, recorder or
+hardware bridge process opens the same file with a RingReader. Each
+channel has its own file (default_path(channel)).
+
+File layout (little endian):
+    header
+        magic      4s  'TRNG'
+        version    I
+        slots      I   frames in the ring
+        pixels     I   pixels per frame
+        published  Q   number of the last published frame (0 = none yet)
+    slots x
+        lock       Q   seqlock: odd while the writer is inside the slot
+        frame      Q   frame number held by the slot
+        channel    B
+        intensity  B
+        delay      I   morph time in milliseconds
+        hsv        pixels x (h, s, v)
+
+Publishing a frame (seqlock): bump the slot lock to odd, write the slot,
+bump the lock back to even, then advance 'published'. A reader copies a
+slot and keeps the copy only if the lock was even and unchanged around it.
+"""
+import mmap
+import os
+import struct
+import tempfile
+import time
+import numpy as np
+from HelperFunctions import byte_clamp
+from model import default_tree
+
+MAGIC = b'TRNG'
+VERSION = 1
+HEADER = struct.Struct('<4sIIIQ')
+PUBLISHED_OFFSET = HEADER.size - 8
+SLOT_HEADER = struct.Struct('<QQBBI')
+LOCK = struct.Struct('<Q')
+FRAME_NUMBER = struct.Struct('<Q')
+HSV_SIZE = 3
+
+
+def default_path(channel=0):
+    """A file per channel in shared memory, if the system has it"""
+    folder = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(folder, 'tree_frames_{}'.format(channel))
+
+
+def slot_size(num_pixels):
+    return SLOT_HEADER.size + HSV_SIZE * num_pixels
+
+
+def ring_size(num_slots, num_pixels):
+    return HEADER.size + num_slots * slot_size(num_pixels)
+
+
+class SharedMemoryModel(object):
+    def __init__(self, path=None, channel=0, num_slots=8, num_pixels=None):
+        self.path = path or default_path(channel)
+        self.channel = channel
+        self.debug = False
+        self.dirty = {}  # { cell: color } map to be published on the next flush
+        self.cells = []  # (ids, colors) arrays from set_cells, for the next go
+        self.num_slots = num_slots
+        self.num_pixels = num_pixels if num_pixels is not None else default_tree().num_pixels
+        self.slot_size = slot_size(self.num_pixels)
+        self.frame = bytearray(HSV_SIZE * self.num_pixels)  # the working frame
+        self.delay = 0
+        self.intensity = 255
+        self.published = 0
+        self.pending = False
+        self.file = None
+        self.map = None
+        self.connect()
+
+    def connect(self):
+        """Map the ring file, creating it if there is none of the right size.
+           A ring of the same shape is reused without truncating it under its readers,
+           and frame numbers carry on from its last published frame"""
+        size = ring_size(self.num_slots, self.num_pixels)
+        if os.path.isfile(self.path) and os.path.getsize(self.path) == size:
+            self.file = open(self.path, 'r+b')
+        else:
+            self.file = open(self.path, 'w+b')
+            self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+        magic, version, slots, pixels, published = HEADER.unpack_from(self.map, 0)
+        if (magic, version, slots, pixels) == (MAGIC, VERSION, self.num_slots, self.num_pixels):
+            self.published = published
+        else:
+            self.map[:size] = bytes(bytearray(size))
+            HEADER.pack_into(self.map, 0, MAGIC, VERSION, self.num_slots, self.num_pixels, 0)
+
+    def close(self):
+        if self.map:
+            self.map.close()
+            self.file.close()
+            self.map = None
+
+    def __repr__(self):
+        return "Shared Memory Model Channel {} ({}, slots={}, debug={})".format(self.channel,
+                                                                               self.path,
+                                                                               self.num_slots,
+                                                                               self.debug)
+
+    def get_channel(self):
+        return self.channel
+
+    # Model basics
+
+    def set_cell(self, cell, color):
+        """Set the model's coord to a color"""
+        self.dirty[cell] = color
+
+    def set_cells(self, ids, colors):
+        """Set an array of cells to an (n, 3) array of uint8 hsv colors, already clamped"""
+        self.cells.append((ids, colors))
+
+    def go(self):
+        """Apply the dirty pixels to the working frame"""
+        frame = self.frame
+        for (cell, color) in self.dirty.items():
+            if 0 <= cell < self.num_pixels:
+                frame[cell * 3] = byte_clamp(color[0], wrap=True)
+                frame[cell * 3 + 1] = byte_clamp(color[1])
+                frame[cell * 3 + 2] = byte_clamp(color[2])
+        hsv = np.frombuffer(frame, dtype=np.uint8).reshape(-1, HSV_SIZE)
+        for (ids, colors) in self.cells:
+            inside = ids < self.num_pixels
+            hsv[ids[inside]] = colors[inside]
+        self.dirty = {}
+        self.cells = []
+        self.pending = True
+
+    def send_delay(self, delay):
+        self.delay = int(delay * 1000)
+        self.pending = True
+
+    def send_intensity(self, intensity):
+        self.intensity = byte_clamp(intensity)
+        self.pending = True
+
+    def flush(self):
+        """Publish the frame into the ring"""
+        if self.pending:
+            self.publish()
+            self.pending = False
+
+    def publish(self):
+        number = self.published + 1
+        offset = HEADER.size + (number % self.num_slots) * self.slot_size
+        lock = LOCK.unpack_from(self.map, offset)[0]
+
+        # odd lock: slot is being written
+        SLOT_HEADER.pack_into(self.map, offset, lock + 1, number, self.channel, self.intensity, self.delay)
+        start = offset + SLOT_HEADER.size
+        self.map[start:start + len(self.frame)] = bytes(self.frame)
+        LOCK.pack_into(self.map, offset, lock + 2)  # even lock: slot is stable
+
+        FRAME_NUMBER.pack_into(self.map, PUBLISHED_OFFSET, number)
+        self.published = number
+
+        if self.debug:
+            print ("published frame {} in slot {}".format(number, number % self.num_slots))
+
+
+class RingReader(object):
+    """Consumer side of a SharedMemoryModel ring"""
+    def __init__(self, path=None, channel=0):
+        self.path = path or default_path(channel)
+        self.file = open(self.path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.num_slots, self.num_pixels, _ = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not a version {} frame ring".format(self.path, VERSION))
+        self.slot_size = slot_size(self.num_pixels)
+        self.last = 0  # last frame number returned by next_frame
+        self.retries = 0  # reads that raced the writer
+        self.missed = 0  # frames overwritten before they were read
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def published(self):
+        """Number of the newest published frame"""
+        return FRAME_NUMBER.unpack_from(self.map, PUBLISHED_OFFSET)[0]
+
+    def read(self, number, tries=100):
+        """Return (number, channel, intensity, delay, hsv bytes) for that frame,
+           or None if the ring has already overwritten it"""
+        offset = HEADER.size + (number % self.num_slots) * self.slot_size
+        start = offset + SLOT_HEADER.size
+        for _ in range(tries):
+            lock, held, channel, intensity, delay = SLOT_HEADER.unpack_from(self.map, offset)
+            if lock % 2:
+                self.retries += 1
+                continue
+            hsv = self.map[start:start + HSV_SIZE * self.num_pixels]
+            if LOCK.unpack_from(self.map, offset)[0] != lock:
+                self.retries += 1
+                continue
+            if held != number:
+                return None
+            return held, channel, intensity, delay, hsv
+        return None
+
+    def latest(self):
+        """The newest frame, or None if nothing is published yet"""
+        number = self.published()
+        return self.read(number) if number else None
+
+    def next_frame(self, timeout=None):
+        """The next frame after the last one returned, skipping ahead if the
+           writer lapped us. Waits up to timeout seconds (None = don't wait)"""
+        deadline = time.time() + timeout if timeout else None
+        while True:
+            newest = self.published()
+            if newest > self.last:
+                number = max(self.last + 1, newest - self.num_slots + 1)
+                self.missed += number - self.last - 1
+                frame = self.read(number)
+                if frame:
+                    self.last = number
+                    return frame
+                self.missed += 1
+                self.last = number  # overwritten while we looked; move on
+                continue
+            if deadline is None or time.time() >= deadline:
+                return None
+            time.sleep(0.001)
@@ -1,80 +1,312 @@
 """
 Model to communicate with a Tree simulator over a TCP socket
 
+Protocols (see model/protocol.py):
+    ascii  - one "{channel}{id},{h},{s},{v}" line per pixel (Processing sketch)
+    sparse - binary frame of (id, h, s, v) records
+    dense  - binary frame with an h,s,v block for every pixel
+    binary - sparse or dense, whichever is smaller for each frame
+
+Pixels set with set_run() go out as binary runs (or ascii lines).
+Pixels handed over with set_cells() are already clamped uint8 arrays and
+are written in bulk, without a tuple per pixel.
+
+Commands are assembled into one FrameBuffer and only hit the socket
+on flush(), once per show frame. With a sender policy, flush() hands the
+frame to a FrameSender thread instead (see model/sender.py).
 """
 import socket
+import numpy as np
 from color import hsv_to_rgb
 from HelperFunctions import byte_clamp
+from model import protocol
+from model.delta import clamp_color
+from model.framebuffer import FrameBuffer
+from model.sender import FrameSender
 
 
 class SimulatorModel(object):
-    def __init__(self, hostname, channel, port=4444):
+    def __init__(self, hostname, channel, port=4444, protocol=protocol.ASCII, sender_policy=None, max_frames=4):
         self.server = (hostname, port)
         self.channel = channel  # Which of 2 channels
         self.debug = False
         self.sock = None
         self.dirty = {}  # { coord: color } map to be sent on the next call to "go"
+        self.buffer = FrameBuffer()
+        self.sender = None  # None = write frames from the calling thread
+        self.keyframe = False  # Send every pixel on the next go()
+
+        # Binary frame state
+        self.set_protocol(protocol)
+        self.seq = 0
+        self.delay = 0  # milliseconds
+        self.intensity = 255
+        self.flags = 0  # FLAG_* commands waiting for the next flush
+        self.pixels = []  # (id, h, s, v) waiting for the next flush
+        self.cells = []  # (ids, colors) arrays from set_cells, waiting for the next go
+        self.pixel_arrays = []  # (ids, colors) arrays waiting for the next flush
+        self.runs = []  # (start, count, (h, s, v)) waiting for the next go
+        self.pending_runs = []  # runs waiting for the next flush
+        self.frame = bytearray()  # h,s,v of every pixel sent so far, for dense frames and keyframes
+
         self.connect()
+        if sender_policy:
+            self.start_sender(sender_policy, max_frames)
 
     def connect(self):
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # Frames are already coalesced
         self.sock.connect(self.server)
 
     def __repr__(self):
-        return "Tree Model Channel {} ({}, port={}, debug={})".format(self.channel,
-                                                                      self.server[0],
-                                                                      self.server[1],
-                                                                      self.debug)
+        return "Tree Model Channel {} ({}, port={}, protocol={}, debug={})".format(self.channel,
+                                                                                   self.server[0],
+                                                                                   self.server[1],
+                                                                                   self.protocol,
+                                                                                   self.debug)
+
+    def start_sender(self, policy, max_frames=4):
+        """Hand frames to a writer thread with a bounded queue"""
+        self.sender = FrameSender(self.sock, policy, max_frames)
+        self.sender.start()
+
+    def stop_sender(self):
+        if self.sender:
+            self.sender.stop()
+            self.sender = None
 
     def get_channel(self):
         return self.channel
 
+    def set_protocol(self, name):
+        """Pick the wire protocol: ascii, sparse, dense or binary"""
+        if name not in protocol.PROTOCOLS:
+            raise ValueError("Unknown protocol {}. Choose from {}".format(name, protocol.PROTOCOLS))
+        self.protocol = name
+
+    def is_binary(self):
+        return self.protocol != protocol.ASCII
+
+    def sends_runs(self):
+        """True if set_run() goes out as one run, not as count pixels"""
+        return self.is_binary()
+
     # Model basics
 
     def set_cell(self, cell, color):
         """Set the model's coord to a color"""
         self.dirty[cell] = color
 
+    def set_cells(self, ids, colors):
+        """Set an array of cells to an (n, 3) array of uint8 hsv colors, already clamped"""
+        self.cells.append((ids, colors))
+
+    def set_run(self, start, count, color):
+        """Set count consecutive cells from start to one color. Binary frames send it as one run"""
+        if self.is_binary():
+            self.runs.append((start, count, color))
+        else:
+            for cell in range(start, start + count):
+                self.dirty[cell] = color
+
     def go(self):
-        """Send all of the buffered commands"""
+        """Buffer the start signal and all of the dirty pixels"""
+        if self.sender and self.sender.wants_keyframe():
+            self.keyframe = True
+
+        if self.is_binary():
+            if self.flags & protocol.FLAG_START:
+                self.assemble_binary_frame()  # Don't merge two morph cycles into one frame
+            self.flags |= protocol.FLAG_START
+            for (cell, color) in self.dirty.items():
+                self.pixels.append((cell, byte_clamp(color[0], wrap=True), byte_clamp(color[1]), byte_clamp(color[2])))
+            for (start, count, color) in self.runs:
+                self.pending_runs.append((start, count, clamp_color(color)))
+            self.pixel_arrays.extend(self.cells)
+            self.dirty = {}  # Restart the dirty dictionary
+            self.runs = []
+            self.cells = []
+            return
+
         self.send_start()
-        for (cell, color) in self.dirty.items():
-            h, s, v = byte_clamp(color[0], wrap=True), byte_clamp(color[1]), byte_clamp(color[2])
-            # r, g, b = hsv_to_rgb((byte_clamp(color[0], wrap=True), byte_clamp(color[1]), byte_clamp(color[2])))
+        pixels = [(cell, byte_clamp(color[0], wrap=True), byte_clamp(color[1]), byte_clamp(color[2]))
+                  for (cell, color) in self.dirty.items()]
+        for (cell, h, s, v) in pixels:
+            self._store_pixel(cell, h, s, v)
+        for (ids, colors) in self.cells:
+            self._store_pixels(ids, colors)
+        if self.keyframe:
+            pixels = self._all_pixels()
+            cells = []
+        else:
+            cells = self.cells
+
+        lines = []
+        for (cell, h, s, v) in pixels:
+            # r, g, b = hsv_to_rgb((h, s, v))
             msg = "{}{},{},{},{}".format(self.channel, cell, h,s,v)
             # msg = "{}{},{},{},{}".format(self.channel, cell, r, g, b)
 
             if self.debug:
                 print (msg)
-            self.sock.send(msg)
-            self.sock.send('\n')
+            lines.append(msg)
+        for (ids, colors) in cells:
+            for (cell, (h, s, v)) in zip(ids.tolist(), colors.tolist()):
+                lines.append("{}{},{},{},{}".format(self.channel, cell, h, s, v))
+
+        if lines:
+            lines.append('')
+            self.buffer.write('\n'.join(lines).encode('ascii'))
 
         self.dirty = {}  # Restart the dirty dictionary
+        self.cells = []
 
     def send_start(self):
         """send a start signal"""
         msg = "{}X".format(self.channel)  # tell processing that commands are coming
-
-        if self.debug:
-            print (msg)
-        self.sock.send(msg)
-        self.sock.send('\n')
+        self.write_command(msg)
 
     def send_delay(self, delay):
         """send a morph amount in milliseconds"""
-        msg = "{}D{}".format(self.channel, str(int(delay * 1000)))
+        self.delay = int(delay * 1000)
+        if self.is_binary():
+            self.flags |= protocol.FLAG_DELAY
+            return
 
-        if self.debug:
-            print (msg)
-        self.sock.send(msg)
-        self.sock.send('\n')
+        msg = "{}D{}".format(self.channel, str(self.delay))
+        self.write_command(msg)
 
     def send_intensity(self, intensity):
         """send an intensity amount (0-255)"""
+        self.intensity = byte_clamp(intensity)
+        if self.is_binary():
+            self.flags |= protocol.FLAG_INTENSITY
+            return
+
         msg = "{}I{}".format(self.channel, str(intensity))
+        self.write_command(msg)
 
+    def write_command(self, msg):
+        """Buffer one ascii command line"""
         if self.debug:
             print (msg)
-        self.sock.send('\n')
-        self.sock.send(msg)
-        self.sock.send('\n')
+        self.buffer.write("{}\n".format(msg).encode('ascii'))
+
+    def flush(self):
+        """Send the whole assembled frame with one socket call, or queue it for the sender"""
+        keyframe = self.keyframe
+        if self.is_binary():
+            self.assemble_binary_frame()
+        self.keyframe = False
+
+        if self.sender:
+            data = self.buffer.take()
+            if data:
+                self.sender.submit(data, keyframe)
+        else:
+            self.buffer.flush(self.sock)
+
+    def stats(self):
+        """Bytes and socket calls per frame, plus the sender's queue counters"""
+        stats = self.buffer.stats()
+        if self.sender:
+            stats.update(self.sender.stats())
+        return stats
+
+    #
+    # Binary frames
+    #
+    def assemble_binary_frame(self):
+        """Pack the waiting commands and pixels as one binary frame in the buffer"""
+        if not self.flags:
+            return
+
+        for (cell, h, s, v) in self.pixels:
+            self._store_pixel(cell, h, s, v)
+        for (start, count, (h, s, v)) in self.pending_runs:
+            for cell in range(start, start + count):
+                self._store_pixel(cell, h, s, v)
+        for (ids, colors) in self.pixel_arrays:
+            self._store_pixels(ids, colors)
+
+        ids = colors = None
+        if self.pixel_arrays:
+            ids = np.concatenate([cell_ids for (cell_ids, _) in self.pixel_arrays] +
+                                 [np.array([pixel[0] for pixel in self.pixels], dtype=np.intp)])
+            colors = np.concatenate([cell_colors for (_, cell_colors) in self.pixel_arrays] +
+                                    [np.array([pixel[1:] for pixel in self.pixels], dtype=np.uint8).reshape(-1, 3)])
+            if self.pending_runs:
+                self.pixels = [(cell, h, s, v) for (cell, (h, s, v)) in zip(ids.tolist(), colors.tolist())]
+                ids = None
+        num_pixels = len(ids) if ids is not None else len(self.pixels)
+
+        runs = None
+        if self.pending_runs:
+            runs = self.pending_runs + [(cell, 1, (h, s, v)) for (cell, h, s, v) in self.pixels]
+
+        if self.flags & protocol.FLAG_START and self.keyframe:
+            use_dense = True
+        elif runs:
+            use_dense = self._use_dense(protocol.runs_size(len(runs)))
+        elif num_pixels:
+            use_dense = self._use_dense(protocol.sparse_size(num_pixels))
+        else:
+            use_dense = False  # Header-only or empty frame
+
+        if use_dense:
+            offset = self.buffer.reserve(protocol.dense_size(len(self.frame) // protocol.HSV_SIZE))
+            protocol.pack_dense(self.buffer.buffer, offset, self.flags, self.channel, self.seq,
+                                self.delay, self.intensity, self.frame)
+        elif runs:
+            offset = self.buffer.reserve(protocol.runs_size(len(runs)))
+            protocol.pack_runs(self.buffer.buffer, offset, self.flags, self.channel, self.seq,
+                               self.delay, self.intensity, runs)
+        elif ids is not None:
+            offset = self.buffer.reserve(protocol.sparse_size(len(ids)))
+            protocol.pack_sparse_arrays(self.buffer.buffer, offset, self.flags, self.channel, self.seq,
+                                        self.delay, self.intensity, ids, colors)
+        else:
+            offset = self.buffer.reserve(protocol.sparse_size(len(self.pixels)))
+            protocol.pack_sparse(self.buffer.buffer, offset, self.flags, self.channel, self.seq,
+                                 self.delay, self.intensity, self.pixels)
+
+        if self.debug:
+            print ("{}: binary frame {}, flags {}, {} pixels".format(self.channel, self.seq,
+                                                                    self.flags, num_pixels))
+        if self.flags & protocol.FLAG_START:
+            self.seq += 1
+        self.flags = 0
+        self.pixels = []
+        self.pixel_arrays = []
+        self.pending_runs = []
+
+    def _use_dense(self, other_size):
+        """Dense block instead of a record or run frame of other_size bytes?"""
+        if self.protocol == protocol.DENSE:
+            return True
+        if self.protocol == protocol.SPARSE:
+            return False
+        return protocol.dense_size(len(self.frame) // protocol.HSV_SIZE) < other_size
+
+    def _all_pixels(self):
+        """Every pixel sent so far as (id, h, s, v), for keyframes"""
+        frame = self.frame
+        return [(i, frame[i * 3], frame[i * 3 + 1], frame[i * 3 + 2]) for i in range(len(frame) // protocol.HSV_SIZE)]
+
+    def _store_pixel(self, cell, h, s, v):
+        """Keep the full frame up to date for dense frames and keyframes"""
+        offset = cell * protocol.HSV_SIZE
+        if offset >= len(self.frame):
+            self.frame.extend(bytearray(offset + protocol.HSV_SIZE - len(self.frame)))
+        self.frame[offset] = h
+        self.frame[offset + 1] = s
+        self.frame[offset + 2] = v
+
+    def _store_pixels(self, ids, colors):
+        """_store_pixel() of id and uint8 hsv arrays"""
+        if not len(ids):
+            return
+        size = (int(ids.max()) + 1) * protocol.HSV_SIZE
+        if size > len(self.frame):
+            self.frame.extend(bytearray(size - len(self.frame)))
+        np.frombuffer(self.frame, dtype=np.uint8).reshape(-1, protocol.HSV_SIZE)[ids] = colors
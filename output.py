@@ -0,0 +1,143 @@
+"""
+Output color stage: the sketch's color adjustments as lookup tables
+
+The Processing sketches adjust every pixel on every draw: colorCorrect()
+remaps the hue into a smaller range for the 7 COLOR_STATEs, adj_brightness()
+scales the value by BRIGHTNESS percent, and the PixelPusher library applies
+its anti-log curve on the way to the LEDs. An OutputStage does the same
+between Tree.send_frame() and the model, as a 256-entry hue table and a
+256-entry value table (or one curve table per rgb channel), rebuilt only
+when a setting changes.
+
+The hue remap follows TreeSimulatorDoubleTrunk_Dual (and AndLighter):
+map_range() wraps start + hue / 255 * range around 256, so every state
+spreads the hues over its whole range. (BetterColors takes % 256 of the
+product only and then clamps, which sends most hues of the wrapping
+states to 255.)
+
+Models that take hsv get apply(). Models that drive LEDs with rgb
+(set_rgb_cells(), e.g. PixelPusher and Art-Net) get apply_rgb(): the
+curve goes on each rgb channel, as the PixelPusher library applies it,
+and the channel intensity is dimmed here rather than in the model.
+
+One stage can be shared by every channel. Changing it bumps its version,
+and each Tree resends its whole frame under the new look.
+"""
+import numpy as np
+from color import hsv_to_rgb_array
+
+# colorCorrect(): COLOR_STATE -> the (start, end) hue range all hues are mapped into
+COLOR_STATES = {
+    0: None,  # all colors
+    1: (40, 200),  # no red
+    2: (120, 45),  # no green
+    3: (200, 120),  # no blue
+    4: (200, 40),  # all red
+    5: (40, 130),  # all green
+    6: (120, 200),  # all blue
+}
+ANTILOG = 'antilog'
+
+
+def map_range(hue, start, end):
+    """The sketch's map_range(): map a hue (0-255) to a smaller range (start-end),
+       wrapping past 255"""
+    hue_range = end - start if end > start else (end + 256 - start) % 256
+    return int(start + ((hue / 255.0) * hue_range)) % 256
+
+
+def hue_table(color_state=0):
+    """colorCorrect() of every hue"""
+    hues = np.arange(256)
+    if COLOR_STATES[color_state] is None:
+        return hues.astype(np.uint8)
+    start, end = COLOR_STATES[color_state]
+    return np.array([map_range(hue, start, end) for hue in hues.tolist()], dtype=np.uint8)
+
+
+def curve_table(curve=None):
+    """A 0-255 -> 0-255 brightness curve: None for straight, ANTILOG, or a gamma exponent"""
+    x = np.arange(256) / 255.0
+    if not curve:
+        return np.arange(256, dtype=np.uint8)
+    if curve == ANTILOG:
+        return np.rint(256.0 ** x - 1).astype(np.uint8)  # exponential, 0 -> 0 and 255 -> 255
+    return np.rint(255 * x ** curve).astype(np.uint8)
+
+
+def parse_curve(text):
+    """A curve from the command line: 'antilog', a gamma exponent, or 'none'"""
+    if text is None or text.lower() == 'none':
+        return None
+    if text.lower() == ANTILOG:
+        return ANTILOG
+    return float(text)
+
+
+class OutputStage(object):
+    """Hue remap, master brightness, brightness curve and channel intensity, as lookups"""
+    def __init__(self, color_state=0, brightness=100, curve=None):
+        self.color_state = color_state
+        self.brightness = brightness  # percent, as the sketch's BRIGHTNESS
+        self.curve = curve
+        self.version = 0  # bumped by every change
+        self.level_tables = {}  # intensity -> value table before the curve
+        self._build()
+
+    def __repr__(self):
+        return "Output Stage (color state {}, brightness {}%, curve {})".format(self.color_state,
+                                                                                self.brightness,
+                                                                                self.curve)
+
+    def _build(self):
+        self.hues = hue_table(self.color_state)
+        self.curve_table = curve_table(self.curve)
+        self.level_tables = {}
+        self.version += 1
+
+    def set_color_state(self, color_state):
+        if color_state not in COLOR_STATES:
+            print ("unknown color state: {}".format(color_state))
+            return
+        self.color_state = color_state
+        self._build()
+
+    def set_brightness(self, brightness):
+        self.brightness = int(max(1, min(100, brightness)))
+        self._build()
+
+    def set_curve(self, curve):
+        self.curve = curve
+        self._build()
+
+    def is_identity(self):
+        return self.color_state == 0 and self.brightness == 100 and not self.curve
+
+    def level_table(self, intensity=255):
+        """adj_brightness(), then channel intensity, of every value"""
+        table = self.level_tables.get(intensity)
+        if table is None:
+            table = self.level_tables[intensity] = (np.arange(256) * self.brightness // 100 * intensity // 255
+                                                    ).astype(np.uint8)
+        return table
+
+    def value_table(self, intensity=255):
+        """level_table(), then the curve, of every value"""
+        return self.curve_table[self.level_table(intensity)]
+
+    def apply(self, hsv, intensity=255):
+        """The (n, 3) uint8 hsv colors as they should be shown, for models that take hsv"""
+        out = np.empty_like(hsv)
+        out[:, 0] = self.hues[hsv[:, 0]]
+        out[:, 1] = hsv[:, 1]
+        out[:, 2] = self.value_table(intensity)[hsv[:, 2]]
+        return out
+
+    def apply_rgb(self, hsv, intensity=255):
+        """The (n, 3) uint8 rgb colors to drive LEDs with directly: the curve goes on each
+           rgb channel, as the PixelPusher library does, instead of on the value"""
+        adjusted = np.empty_like(hsv)
+        adjusted[:, 0] = self.hues[hsv[:, 0]]
+        adjusted[:, 1] = hsv[:, 1]
+        adjusted[:, 2] = self.level_table(intensity)[hsv[:, 2]]
+        return self.curve_table[hsv_to_rgb_array(adjusted)]
@@ -3,40 +3,220 @@ Reworking LED code to use a Pixel class
 
 A LED-contraption object, like a Tree, is composed of Pixel objects
 A Pixel knows its color, state, current frame, and next frame
+
+The frames themselves live in a PixelFrames store: two (num_pixels, 3)
+uint8 arrays in pixel id order. A Pixel is a view of its row, so a whole
+frame can be compared or copied with one array operation.
+
+Writes to single pixels add their ids to a dirty set; whole-frame writes
+mark every pixel dirty. Finding the changed pixels only examines the
+dirty ones.
+
+A tolerance lets changed() skip differences nobody can see through the
+morph. The current frame holds what was last sent, so a slow fade piles
+up its difference until it crosses the tolerance; a pixel held back for
+max_hold frames is sent anyway, so every fade reaches its target.
 """
 
-from math import atan, sqrt, pi
+import numpy as np
+from color import is_packed, pack_hsv, unpack_hsv, unpack_hsv_array
+from geometry import pixel_angle
+
+BLACK = (0,255,0)  # Always make saturation = 255
+FORCED_BLACK = (0,255,1)  # Differs from BLACK so the pixel gets sent
+PACKED_BLACK = pack_hsv(BLACK)
+PACKED_FORCED_BLACK = pack_hsv(FORCED_BLACK)
+
+
+def clamp_color(color):
+    """Color as it can be stored: int hsv, hue wrapped, saturation and value clamped.
+       Packed colors (see color.pack_hsv) are already in range"""
+    if is_packed(color):
+        return unpack_hsv(color)
+    h, s, v = int(color[0]), int(color[1]), int(color[2])
+    return (h % 255,
+            255 if s > 255 else (0 if s < 0 else s),
+            255 if v > 255 else (0 if v < 0 else v))
+
+
+def clamp_colors(hsv):
+    """clamp_color() of an (n, 3) array, or unpack n packed colors. Returns an (n, 3) uint8 array"""
+    if np.ndim(hsv) == 1:
+        return unpack_hsv_array(hsv)
+    hsv = np.trunc(hsv).astype(np.int64)
+    colors = np.empty(hsv.shape, dtype=np.uint8)
+    colors[:, 0] = hsv[:, 0] % 255
+    colors[:, 1:] = np.clip(hsv[:, 1:], 0, 255)
+    return colors
+
+
+class PixelFrames(object):
+    """Current and next hsv frames of all pixels, one uint8 row per pixel id"""
+    def __init__(self, num_pixels):
+        self.curr = np.empty((num_pixels, 3), dtype=np.uint8)
+        self.next = np.empty((num_pixels, 3), dtype=np.uint8)
+        self.curr[:] = BLACK
+        self.next[:] = BLACK
+        self.dirty = set()  # ids written since the last changed()
+        self.all_dirty = False  # a whole-frame write happened since the last changed()
+
+        # Tolerance (see set_tolerance)
+        self.tolerance = None  # largest (h, s, v) difference left unsent
+        self.value_curve = None  # value -> perceived brightness, to compare values
+        self.max_hold = 0
+        self.held = np.zeros(num_pixels, dtype=np.uint16)  # frames each pixel's change has been held back
+        self.forced = set()  # ids set with set_curr, sent whatever their difference
+        self.all_forced = False
+        self.resend = False  # changed() returns every pixel once
+
+        # Counters
+        self.frames = 0
+        self.examined = 0  # pixels compared by changed()
+        self.sent = 0  # pixels that had changed
+        self.suppressed = 0  # changed pixels held back by the tolerance
+        self.max_error = 0  # largest h, s or v difference held back
+
+    def __len__(self):
+        return len(self.next)
+
+    def set_next(self, id, color):
+        self.next[id] = clamp_color(color)
+        self.dirty.add(id)
+
+    def set_curr(self, id, color):
+        self.curr[id] = clamp_color(color)
+        self.dirty.add(id)
+        self.forced.add(id)
+
+    def set_all(self, color):
+        self.next[:] = clamp_color(color)
+        self.all_dirty = True
+
+    def set_frame(self, hsv):
+        """Set the whole next frame from a (num_pixels, 3) array, clamped like clamp_color,
+           or from num_pixels packed colors"""
+        self.next[:] = clamp_colors(hsv)
+        self.all_dirty = True
+
+    def set_ids(self, ids, hsv):
+        """Set the next colors of an array of ids from an (n, 3) array or n packed colors.
+           Give each id once: numpy does not say which color a repeated id gets"""
+        self.next[ids] = clamp_colors(hsv)
+        self.dirty.update(np.asarray(ids).tolist())
+
+    def force_all(self, color):
+        """Set the current frame, so the next frame is sent whatever it holds"""
+        self.curr[:] = clamp_color(color)
+        self.all_dirty = True
+        self.all_forced = True
+
+    def resend_all(self):
+        """Have the next changed() return every pixel, changed or not"""
+        self.resend = True
+
+    def set_tolerance(self, hue=0, sat=0, value=0, max_hold=10, gamma=None):
+        """Hold back changes of at most hue, sat and value counts for up to max_hold frames.
+           With gamma, values are compared as 255 * (v / 255) ** gamma, as the LEDs show them"""
+        if not (hue or sat or value):
+            self.tolerance = self.value_curve = None
+            return
+        self.tolerance = np.array([hue, sat, value], dtype=np.int16)
+        self.max_hold = max(1, max_hold)
+        if gamma:
+            self.value_curve = np.rint(255 * (np.arange(256) / 255.0) ** gamma).astype(np.int16)
+        else:
+            self.value_curve = None
+
+    def changed(self):
+        """Array of the dirty ids whose next color differs from the current one, in id order"""
+        if self.resend:
+            examined = ids = np.arange(len(self.next))
+        elif self.all_dirty:
+            examined = np.arange(len(self.next))
+            ids = np.flatnonzero((self.curr != self.next).any(axis=1))
+        else:
+            examined = np.fromiter(self.dirty, dtype=np.intp, count=len(self.dirty))
+            examined.sort()
+            ids = examined[(self.curr[examined] != self.next[examined]).any(axis=1)]
+        self.dirty = set()
+        self.all_dirty = False
+
+        if self.tolerance is not None:
+            if self.resend:
+                self.held[:] = 0
+            else:
+                ids = self._perceptible(examined, ids)
+        self.forced = set()
+        self.all_forced = False
+        self.resend = False
+
+        self.frames += 1
+        self.examined += len(examined)
+        self.sent += len(ids)
+        return ids
+
+    def _perceptible(self, examined, ids):
+        """The ids whose change is over the tolerance, forced, or held back too long.
+           The rest stay dirty, to be compared again next frame"""
+        curr = self.curr[ids].astype(np.int16)
+        diff = np.abs(self.next[ids].astype(np.int16) - curr)
+        diff[:, 0] = np.minimum(diff[:, 0], 256 - diff[:, 0])  # hues wrap around the 256 step wheel
+        if self.value_curve is not None:
+            diff[:, 2] = np.abs(self.value_curve[self.next[ids, 2]] - self.value_curve[curr[:, 2]])
+
+        held = self.held[ids] + 1
+        send = (diff > self.tolerance).any(axis=1) | (held >= self.max_hold)
+        if self.all_forced:
+            send[:] = True
+        elif self.forced:
+            send |= np.isin(ids, np.fromiter(self.forced, dtype=np.intp, count=len(self.forced)))
+
+        self.held[examined] = 0
+        self.held[ids[~send]] = held[~send]
+        if not send.all():
+            self.dirty.update(ids[~send].tolist())
+            self.suppressed += len(ids) - int(send.sum())
+            self.max_error = max(self.max_error, int(diff[~send].max()))
+        return ids[send]
+
+    def update(self, ids):
+        """Make the next colors of ids current"""
+        self.curr[ids] = self.next[ids]
+
+    def stats(self):
+        """Counters as a dictionary"""
+        return {'frames': self.frames, 'examined': self.examined, 'sent': self.sent,
+                'suppressed': self.suppressed, 'max_error': self.max_error}
+
+    def reset_stats(self):
+        self.frames = self.examined = self.sent = self.suppressed = self.max_error = 0
 
 
 class Pixel(object):
     """Pixel colors are hsv [0-255] triples (very simple)"""
-    def __init__(self, coord, id, number, gen, fract, x, y):
+    def __init__(self, coord, id, number, gen, fract, x, y, d, theta, frames=None):
         self.coord = coord
         self.number = number
         self.id = id
         self.gen = gen
         self.fract = fract  # 0.0 - 1.0
-        self.x = (x - 12250) / 12249.0  # 0.0 - 1.0 from min -12249, max 12157
-        self.y = (y - 10007) / 11438.0  # 0.0 - 1.0 from min -10007, max 11438
-        self.d = sqrt((self.x * self.x) + (self.y * self.y)) / sqrt(2)  # 0.0 - 1.0
-        self.theta = self.get_angle()
-        self.curr_frame = (0,255,0)  # Always make saturation = 255
-        self.next_frame = (0,255,0)  # Always make saturation = 255
+        self.x = x  # -1.0 - 1.0 across the whole layout
+        self.y = y  # -1.0 - 1.0 across the whole layout
+        self.d = d  # 0.0 - 1.0
+        self.theta = theta  # 0 - 2pi
+        self.frames = frames if frames is not None else PixelFrames(id + 1)
 
-    def get_angle(self):
-        """Get the 0-2pi angle from the x,y coordinate. arctans are weird."""
-        if self.y == 0:
-            angle = 0 if self.x > 0 else pi
-        else:
-            angle = atan(self.x / self.y)
+    @property
+    def curr_frame(self):
+        return tuple(self.frames.curr[self.id].tolist())
 
-        if self.y >= 0:
-            if self.x < 0:
-                angle += (2 * pi)
-        else:
-            angle += pi
+    @property
+    def next_frame(self):
+        return tuple(self.frames.next[self.id].tolist())
 
-        return angle
+    def get_angle(self):
+        """Get the 0-2pi angle from the x,y coordinate"""
+        return pixel_angle(self.x, self.y)
 
     def get_coord(self):
         return self.x, self.y
@@ -48,25 +228,23 @@ class Pixel(object):
         return self.next_frame
 
     def has_changed(self):
-        return not (self.curr_frame[0] == self.next_frame[0] and
-                    self.curr_frame[1] == self.next_frame[1] and
-                    self.curr_frame[2] == self.next_frame[2])
+        return (self.frames.curr[self.id] != self.frames.next[self.id]).any()
 
     def set_color(self, color):
-        self.next_frame = color
+        self.frames.set_next(self.id, color)
 
     def set_next_frame(self, color):
-        self.next_frame = color
+        self.frames.set_next(self.id, color)
 
     def set_curr_frame(self, color):
-        self.curr_frame = color
+        self.frames.set_curr(self.id, color)
 
     def set_black(self):
-        self.next_frame = (0,255,0)  # Always make saturation = 255
+        self.frames.set_next(self.id, PACKED_BLACK)
 
     def force_black(self):
-        self.curr_frame = (0,255,1)  # Always make saturation = 255
+        self.frames.set_curr(self.id, PACKED_FORCED_BLACK)
         self.set_black()
 
     def update_frame(self):
-        self.set_curr_frame(color=self.next_frame)
\ No newline at end of file
+        self.frames.curr[self.id] = self.frames.next[self.id]
@@ -0,0 +1,122 @@
+"""
+Random numbers drawn in blocks, from a seeded source per show
+
+The show helpers make one small random draw after another: one_in(),
+plus_or_minus(), rand_dir(), a random cell. A RandomSource draws a block
+of floats with numpy at once and hands them out one by one, so a single
+draw costs a list lookup instead of a trip through the random module.
+Batches (many cells at once) come straight from numpy.
+
+The module functions draw from the source of the current thread (see
+use()). The runners give every show its own source from a logged seed,
+so two channels never share a generator and a show can be replayed:
+the same seed (and a VirtualClock, see clock.py) gives the same frames.
+"""
+import threading
+import numpy as np
+
+BLOCK = 4096  # floats drawn at a time
+MAX_SEED = 2 ** 31  # seeds are 0 to MAX_SEED - 1
+
+
+class RandomSource(object):
+    """Uniform draws from a numpy RandomState, pre-drawn BLOCK at a time"""
+    def __init__(self, seed=None, block=BLOCK):
+        self.state = np.random.RandomState(seed)
+        self.block = block
+        self.values = []
+        self.index = 0
+
+    def seed(self, seed=None):
+        """Start over from seed, dropping the values already drawn"""
+        self.state.seed(seed)
+        self.values = []
+        self.index = 0
+
+    def refill(self):
+        self.values = self.state.random_sample(self.block).tolist()
+        self.index = 0
+
+    def random(self):
+        """Float in [0, 1)"""
+        if self.index >= len(self.values):
+            self.refill()
+        value = self.values[self.index]
+        self.index += 1
+        return value
+
+    def randint(self, a, b):
+        """Integer in [a, b], both included, like random.randint"""
+        return a + int(self.random() * (b - a + 1))
+
+    def randrange(self, start, stop=None):
+        """Integer in [start, stop), or [0, start)"""
+        if stop is None:
+            start, stop = 0, start
+        return start + int(self.random() * (stop - start))
+
+    def choice(self, seq):
+        """Random element of a non-empty sequence"""
+        return seq[int(self.random() * len(seq))]
+
+    def integers(self, low, high, n):
+        """Array of n integers in [low, high)"""
+        return self.state.randint(low, high, n)
+
+    def sample(self, population, n, replace=True):
+        """Array of n integers picked from range(population), or from an array of them.
+           Without replace, none twice (and at most all of them)"""
+        size = population if np.ndim(population) == 0 else len(population)
+        if not replace:
+            n = min(n, size)
+        picks = self.state.choice(size, n, replace=replace)
+        return picks if np.ndim(population) == 0 else np.asarray(population)[picks]
+
+
+def new_seed():
+    """A fresh seed from the system's entropy, for logging and replay"""
+    return int(np.random.RandomState().randint(0, MAX_SEED))
+
+
+_default = RandomSource()
+_local = threading.local()
+
+
+def current():
+    """The source of this thread"""
+    return getattr(_local, 'source', _default)
+
+
+def use(source=None):
+    """Draw from source (default the shared one) in this thread. Returns the previous source"""
+    previous = current()
+    _local.source = source or _default
+    return previous
+
+
+def seed(seed=None):
+    current().seed(seed)
+
+
+def random():
+    return current().random()
+
+
+def randint(a, b):
+    return current().randint(a, b)
+
+
+def randrange(start, stop=None):
+    return current().randrange(start, stop)
+
+
+def choice(seq):
+    return current().choice(seq)
+
+
+def integers(low, high, n):
+    return current().integers(low, high, n)
+
+
+def sample(population, n, replace=True):
+    return current().sample(population, n, replace)
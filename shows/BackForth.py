@@ -1,5 +1,6 @@
-from random import randrange, randint
+from randoms import randrange, randint
 from math import sin, pi
+import numpy as np
 from HelperFunctions import get_bpm_wave, get_reasonable_bpm, change_hue, MIN_DIM
 
 class BackForth(object):
@@ -23,5 +24,15 @@ class BackForth(object):
 
             yield self.speed
 
+    def render(self, now, columns, hsv):
+        wave = get_bpm_wave(self.bpm, now)
+        inverse_distance = np.abs(columns.fract - wave)
+        value = (255 - MIN_DIM) * (1 + np.sin(inverse_distance * pi)) / 2
+        hsv[:] = (self.hue, 255, 0)
+        hsv[:, 2] = 255 - value
+
+        self.hue = change_hue(self.hue)  # Change the colors
+        return hsv
+
 
 
@@ -1,5 +1,6 @@
-from random import randint
-from HelperFunctions import calc_packet, get_bpm_wave, get_reasonable_bpm, change_hue, min_dim
+from randoms import randint
+import numpy as np
+from HelperFunctions import calc_packet, calc_packets, get_bpm_wave, get_reasonable_bpm, change_hue, min_dim, min_dims
 
 
 class Crosshair(object):
@@ -36,3 +37,21 @@ class Crosshair(object):
             self.y_hue = change_hue(self.y_hue, rate=10)
 
             yield self.speed
+
+    def render(self, now, columns, hsv):
+        x_wave = (get_bpm_wave(self.x_bpm, now) * 2) - 1
+        y_wave = (get_bpm_wave(self.y_bpm, now) * 2) - 1
+
+        # Exact packets: the hue goes to the larger one, and a table 1 off would flip it
+        x_value = calc_packets(1.0 - np.abs(columns.x - x_wave), 1.0, fract_x=0.8, smooth=True)
+        y_value = calc_packets(1.0 - np.abs(columns.y - y_wave), 1.0, fract_x=0.8, smooth=True)
+
+        x_wins = x_value > y_value
+        hsv[:, 0] = np.where(x_wins, self.x_hue, self.y_hue)
+        hsv[:, 1] = 255
+        hsv[:, 2] = min_dims(np.where(x_wins, x_value, y_value))
+
+        # Change the colors
+        self.x_hue = change_hue(self.x_hue, rate=5)
+        self.y_hue = change_hue(self.y_hue, rate=10)
+        return hsv
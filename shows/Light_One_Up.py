@@ -1,4 +1,5 @@
-from random import randint
+from randoms import randint
+import numpy as np
 from HelperFunctions import change_hue, MIN_DIM
 
 class Light_One_Up(object):
@@ -26,4 +27,15 @@ class Light_One_Up(object):
 
 			self.count += 1
 
-			yield self.speed
\ No newline at end of file
+			yield self.speed
+
+	def render(self, now, columns, hsv):
+		dist_1 = np.abs((self.count % 20 / 20.0) - columns.fract)
+		dist_2 = np.abs((((self.count + self.size) % 20) / 20.0) - columns.fract)
+		hsv[:] = (self.hue, 255, 0)
+		hsv[:, 2] = np.where((dist_1 < 0.05) | (dist_2 < 0.05), 255, MIN_DIM)
+
+		self.hue = change_hue(self.hue)  # Change the colors
+
+		self.count += 1
+		return hsv
\ No newline at end of file
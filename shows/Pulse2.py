@@ -1,6 +1,7 @@
-from random import randint
-from HelperFunctions import calc_packet, get_bpm_wave, get_reasonable_bpm, get_reasonable_speed, get_true_or_false, \
-    change_hue, min_dim
+from randoms import randint
+import numpy as np
+from HelperFunctions import calc_packet, lut_packets, get_bpm_wave, get_reasonable_bpm, get_reasonable_speed, \
+    get_true_or_false, change_hue, min_dim, lut_min_dims
 
 
 class Pulse2(object):
@@ -30,5 +31,17 @@ class Pulse2(object):
 
             yield self.speed
 
+    def render(self, now, columns, hsv):
+        wave = get_bpm_wave(self.bpm, now) * self.wave_max
+        if self.reverse:
+            wave = self.wave_max - wave
+        inverse_distance = self.wave_max - np.abs((columns.fract + columns.gen) - wave)
+        value = lut_packets(inverse_distance, self.wave_max, fract_x=0.1, smooth=True)
+        hsv[:] = (self.hue, 255, 0)
+        hsv[:, 2] = lut_min_dims(value)
+
+        self.hue = change_hue(self.hue)  # Change the colors
+        return hsv
+
 
 
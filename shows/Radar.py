@@ -1,6 +1,7 @@
-from random import randint
+from randoms import randint
 from math import pi
-from HelperFunctions import one_in, up_or_down, calc_packet, change_hue, min_dim
+import numpy as np
+from HelperFunctions import one_in, up_or_down, calc_packet, lut_packets, change_hue, min_dim, lut_min_dims
 
 
 class Radar(object):
@@ -31,3 +32,18 @@ class Radar(object):
 
             yield self.speed
 
+    def render(self, now, columns, hsv):
+        angle = self.two_pi * (self.count % 360) / 360
+        angle_diff = self.two_pi - np.abs(angle - columns.theta)
+        value = lut_packets(angle_diff, self.two_pi, fract_x=0.5, smooth=True)
+        hsv[:] = (self.hue, 255, 0)
+        hsv[:, 2] = lut_min_dims(value)
+
+        self.hue = change_hue(self.hue)  # Change the colors
+
+        if one_in(50):
+            self.freq = up_or_down(self.freq, 1, 1, 4)
+
+        self.count += self.freq
+        return hsv
+
@@ -1,5 +1,6 @@
-from random import randint
-from HelperFunctions import calc_packet, get_bpm_circle, get_reasonable_bpm, get_reasonable_speed, get_true_or_false, \
+from randoms import randint
+import numpy as np
+from HelperFunctions import calc_packet, lut_packets, get_bpm_circle, get_reasonable_bpm, get_reasonable_speed, get_true_or_false, \
     change_hue
 
 
@@ -29,3 +30,16 @@ class Ring(object):
 
             self.count += 1
             yield self.speed
+
+    def render(self, now, columns, hsv):
+        wave = get_bpm_circle(self.bpm, now)
+        if self.reverse:
+            wave = 1.0 - wave
+        inverse_distance = 1.0 - np.abs(columns.d - wave)
+        hsv[:] = (self.hue, 255, 0)
+        hsv[:, 2] = lut_packets(inverse_distance, 1.0, fract_x=0.6, smooth=True)
+
+        self.hue = change_hue(self.hue)  # Change the colors
+
+        self.count += 1
+        return hsv
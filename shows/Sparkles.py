@@ -9,7 +9,7 @@ class Sparkles(object):
         self.sparkles = Faders(treemodel)
         self.speed = 0.3
         self.color = random_color()
-        self.spark_num = self.tree.num_pixels / 20
+        self.spark_num = self.tree.num_pixels // 20
         self.count = 0
 
     def next_frame(self):
@@ -18,14 +18,14 @@ class Sparkles(object):
 
         while True:
 
-            while self.sparkles.num_faders() < self.spark_num:
+            for pos in self.tree.rand_cells(self.spark_num - self.sparkles.num_faders(), replace=False, unlit=True):
                 self.sparkles.add_fader(color=random_color_range(self.color, 0.05),
-                                        pos=self.tree.rand_cell(),
+                                        pos=pos,
                                         intense=0.01,
                                         growing=True,
                                         change=1.0 / get_reasonable_speed()
                                         )
-            self.sparkles.cycle_faders()
+            self.sparkles.cycle_faders(refresh=False)  # only the dead sparkles go black
 
             # Change the colors
             if one_in(100):
@@ -3,9 +3,17 @@ import importlib
 import inspect
 from operator import itemgetter
 import random
+import numpy as np
+
+import clock
+from HelperFunctions import PACKET_ERROR
 
 from util import memoized
 
+# Largest difference check_render() may find: render() reads the lookup tables (lut_*),
+# next_frame() the exact functions they stand in for
+RENDER_TOLERANCE = PACKET_ERROR
+
 @memoized
 def load_shows(path=None):
     "Return a list of tuples (name, class) describing shows found in the shows directory"
@@ -32,19 +40,77 @@ def load_shows(path=None):
             else:
                 # we have go to rooting around for things that look like shows
                 for (name,t) in inspect.getmembers(mod):
-                    if inspect.isclass(t) and hasattr(t, 'next_frame'):
+                    if inspect.isclass(t) and (hasattr(t, 'next_frame') or hasattr(t, 'render')):
                         # print "likely show:", name, type(t)
 
                         ctor = getattr(mod, name)
                         _shows.append( (name, ctor) )
 
-        except Exception, e:
-            print "exception loading module from %s, skipping" % m
+        except Exception as e:
+            print ("exception loading module from %s, skipping" % m)
             import traceback
             traceback.print_exc()
     # sort show tuples by name before returning them
     return sorted(_shows, key=itemgetter(0))
 
+def frame_generator(show, tree):
+    """
+    Return the show's frames as a generator of delays, whatever style the show uses
+
+    Generator shows have next_frame(): it sets pixels one at a time and yields a delay.
+    Whole-frame shows have render(now, columns, hsv): given the time in seconds and
+    the tree's geometry columns, it fills the (num_pixels, 3) float hsv buffer (or
+    returns a new array) and leaves its delay in show.speed. If a show has both,
+    render() is used.
+    """
+    if not hasattr(show, 'render'):
+        return show.next_frame()
+    return render_frames(show, tree)
+
+def render_frames(show, tree):
+    "Drive a whole-frame show like a generator show"
+    hsv = np.zeros((tree.num_pixels, 3))
+    while True:
+        frame = show.render(clock.time(), tree.columns, hsv)
+        tree.set_frame(hsv if frame is None else frame)
+        yield show.speed
+
+def check_render(ctor, tree, frames=20, seed=0, step=0.1):
+    """
+    Run a show with both next_frame() and render() from the same random seed and
+    a frozen clock. Return the largest difference in any h, s or v of any frame
+    """
+    import randoms
+    virtual = clock.VirtualClock()
+    previous = clock.use(virtual)
+    previous_source = randoms.current()
+    start = previous.time()
+    expected = []
+    try:
+        random.seed(seed)
+        randoms.use(randoms.RandomSource(seed))
+        show = ctor(tree)
+        framegen = show.next_frame()
+        for i in range(frames):
+            virtual.set(start + i * step)
+            next(framegen)
+            expected.append(tree.frames.next.astype(np.int64))
+
+        random.seed(seed)
+        randoms.use(randoms.RandomSource(seed))
+        show = ctor(tree)
+        hsv = np.zeros((tree.num_pixels, 3))
+        worst = 0
+        for i in range(frames):
+            virtual.set(start + i * step)
+            frame = show.render(clock.time(), tree.columns, hsv)
+            tree.set_frame(hsv if frame is None else frame)
+            worst = max(worst, int(np.abs(tree.frames.next - expected[i]).max()))
+    finally:
+        clock.use(previous)
+        randoms.use(previous_source)
+    return worst
+
 def random_shows(path=None, norepeat=None):
     """
     Return an infinite sequence of randomized show constructors
@@ -0,0 +1,36 @@
+import socket
+from contextlib import closing
+
+import numpy as np
+
+from color import hsv_to_rgb
+from model.artnet import ArtNetModel, ARTNET, SACN, DMX_CHANNELS, decode_packet
+
+
+def test_set_cells_matches_set_cell():
+    colors = np.random.RandomState(1).randint(0, 256, (1212, 3)).astype(np.uint8)
+    ids = np.random.RandomState(2).permutation(1212)[:600]
+    models = [ArtNetModel('127.0.0.1') for _ in range(2)]
+    for cell in ids.tolist():
+        models[0].set_cell(cell, tuple(colors[cell].tolist()))
+    models[0].go()
+    models[1].set_cells(ids, colors[ids])
+    models[1].go()
+    assert (models[0].universes == models[1].universes).all()
+
+
+def test_udp_stand_in():
+    for protocol in (ARTNET, SACN):
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        with closing(receiver):
+            receiver.bind(('127.0.0.1', 0))
+            receiver.settimeout(2)
+            model = ArtNetModel('127.0.0.1', port=receiver.getsockname()[1], protocol=protocol)
+            model.set_cells(np.array([0, 171]), np.array([[0, 255, 255], [85, 255, 128]], dtype=np.uint8))
+            model.go()
+            universes = dict(decode_packet(receiver.recvfrom(65536)[0]) for _ in range(len(model.universes)))
+
+        assert sorted(universes) == [1, 2, 3, 4, 5, 6, 7, 8]
+        assert universes[1][:3] == bytearray(hsv_to_rgb((0, 255, 255)))
+        assert universes[2][3:6] == bytearray(hsv_to_rgb((85, 255, 128)))
+        assert len(universes[1]) == DMX_CHANNELS - 2
@@ -0,0 +1,72 @@
+import random
+import threading
+import time
+
+import pytest
+
+import clock
+import randoms
+from shows import frame_generator, load_shows
+from tree import Tree
+
+
+def run_show(name, seed, frames=30, start=1000.0):
+    """Frames of a show run as the ShowRunner does, on a VirtualClock. Returns the frames
+       and the seconds of show time they took"""
+    virtual = clock.VirtualClock(start)
+    previous_clock = clock.use(virtual)
+    previous_source = randoms.use(randoms.RandomSource(seed))
+    random.seed(seed)
+    try:
+        tree = Tree(None)
+        show = dict(load_shows())[name](tree)
+        framegen = frame_generator(show, tree)
+        shown = []
+        for _ in range(frames):
+            delay = next(framegen)
+            shown.append(tree.frames.next.copy())
+            clock.sleep(delay)
+        return shown, virtual.time() - start
+    finally:
+        clock.use(previous_clock)
+        randoms.use(previous_source)
+
+
+@pytest.mark.parametrize('name', ('Pulse2', 'Ring'))
+def test_virtual_clock_replays_a_show(name):
+    started = time.time()
+    first, show_time = run_show(name, seed=3)
+    elapsed = time.time() - started
+    second, _ = run_show(name, seed=3)
+    assert all((a == b).all() for (a, b) in zip(first, second))
+    assert len(set(frame.tobytes() for frame in first)) > 1  # the bpm wave moves
+    assert elapsed < show_time / 2  # no waiting for the delays
+
+
+def test_shows_read_the_injected_clock():
+    early, _ = run_show('Pulse2', seed=3, start=1000.0)
+    late, _ = run_show('Pulse2', seed=3, start=1000.37)
+    assert any((a != b).any() for (a, b) in zip(early, late))
+
+
+def test_scaled_clock():
+    scaled = clock.ScaledClock(speed=50)
+    before, started = scaled.time(), time.time()
+    scaled.sleep(1.0)
+    assert time.time() - started < 0.5
+    assert scaled.time() - before >= 1.0 * 0.9
+
+
+def test_clock_per_thread():
+    virtual = clock.VirtualClock(5.0)
+    previous = clock.use(virtual)
+    seen = []
+    try:
+        thread = threading.Thread(target=lambda: seen.append(clock.current()))
+        thread.start()
+        thread.join()
+        assert clock.time() == 5.0
+    finally:
+        clock.use(previous)
+    assert seen == [clock.REAL]
+    assert clock.current() is previous
@@ -0,0 +1,28 @@
+import numpy as np
+
+from color import hsv_to_rgb, rgb_to_hsv, hsv_to_rgb_array, rgb_to_hsv_array, SATURATED_RGB
+
+RANDOM = np.random.RandomState(0).randint(0, 256, (20000, 3))
+
+
+def test_saturated_table_matches_scalar():
+    for hue in range(256):
+        for value in range(256):
+            assert tuple(SATURATED_RGB[hue, value]) == hsv_to_rgb((hue, 255, value))
+
+
+def test_hsv_to_rgb_array_matches_scalar():
+    hsv = np.concatenate([np.stack([np.repeat(np.arange(256), 256), np.full(256 * 256, 255),
+                                    np.tile(np.arange(256), 256)], axis=1), RANDOM])
+    rgb = hsv_to_rgb_array(hsv)
+    assert rgb.dtype == np.uint8
+    assert [tuple(row) for row in rgb.tolist()] == [hsv_to_rgb(row) for row in hsv.tolist()]
+    assert (hsv_to_rgb_array(hsv.astype(np.uint8)) == rgb).all()
+
+
+def test_rgb_to_hsv_array_matches_scalar():
+    hsv = rgb_to_hsv_array(RANDOM)
+    assert hsv.dtype == np.uint8
+    assert [tuple(row) for row in hsv.tolist()] == [rgb_to_hsv(row) for row in RANDOM.tolist()]
+    greys = np.repeat(np.arange(256), 3).reshape(256, 3)
+    assert [tuple(row) for row in rgb_to_hsv_array(greys).tolist()] == [rgb_to_hsv(row) for row in greys.tolist()]
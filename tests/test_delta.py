@@ -0,0 +1,26 @@
+from model import protocol
+from model.delta import DeltaEncoder, encode_runs
+
+RED = (0, 255, 255)
+
+
+def test_encode_runs():
+    changes = [(3, RED), (1, RED), (2, RED), (5, RED), (6, (0, 0, 0))]
+    assert encode_runs(changes) == [(1, 3, RED), (5, 1, RED), (6, 1, (0, 0, 0))]
+
+
+def test_stats_count_runs_sent():
+    encoder = DeltaEncoder()
+    encoder.encode([(cell, RED) for cell in range(100)])
+    assert encoder.runs == 1
+    assert encoder.encoded_bytes == protocol.RUN.size
+    assert encoder.naive_bytes == 100 * protocol.RECORD.size
+
+
+def test_stats_count_runs_sent_as_pixels():
+    encoder = DeltaEncoder()
+    runs = encoder.encode([(cell, RED) for cell in range(100)], sent_as_runs=False)
+    assert runs == [(0, 100, RED)]
+    assert encoder.runs == 0
+    assert encoder.encoded_bytes == encoder.naive_bytes
+    assert encoder.ratio() == 1.0
@@ -0,0 +1,41 @@
+import numpy as np
+
+from HelperFunctions import Faders
+from tree import Tree
+
+
+def test_brightest_fader_on_a_pixel_wins():
+    tree = Tree(None)
+    faders = Faders(tree)
+    for cell in (10, 11):
+        coord = tree.coords[cell]
+        faders.add_fader((10, 255, 255), coord, 0.3)
+        faders.add_fader((50, 255, 255), coord, 0.9)
+        faders.add_fader((90, 255, 255), coord, 0.5)
+        faders.add_fader((130, 255, 255), coord, 0.9)  # ties with 50: the later one wins
+    faders.cycle_faders()
+    assert tree.pixels[10].next_frame == (130, 255, 229)
+    assert tree.pixels[11].next_frame == (130, 255, 229)
+
+
+def test_each_pixel_drawn_once():
+    tree = Tree(None)
+    faders = Faders(tree)
+    drawn = []
+    set_ids = tree.set_ids
+    tree.set_ids = lambda ids, hsv: (drawn.append(np.asarray(ids)), set_ids(ids, hsv))
+    for i in range(500):
+        faders.add_fader((i % 255, 255, 255), tree.coords[i % 37], (i % 10) / 10.0)
+    faders.cycle_faders()
+    for ids in drawn:
+        assert len(ids) == len(np.unique(ids))
+
+
+def test_fade_all():
+    tree = Tree(None)
+    faders = Faders(tree)
+    faders.add_fader((50, 255, 255), tree.coords[3], 1.0)
+    faders.cycle_faders()
+    faders.fade_all()
+    assert tree.pixels[3].next_frame == (0, 255, 0)
+    assert faders.num_faders() == 0
@@ -0,0 +1,31 @@
+try:
+    import Queue as queue
+except ImportError:  # Python 3
+    import queue
+
+from go import ShowRunner
+from output import OutputStage
+from tree import Tree
+
+
+def runner(output=None):
+    full_tree = Tree(None)
+    if output is not None:
+        full_tree.use_output(output)
+    return ShowRunner(full_tree, None, queue.LifoQueue())
+
+
+def test_buttons_adjust_the_output_stage():
+    output = OutputStage()
+    show_runner = runner(output)
+    show_runner.process_command(('/1/brightness', [40]))
+    assert output.brightness == 40 and show_runner.brightness_x == 40
+    show_runner.process_command(('/2/push3', [1.0]))
+    assert output.color_state == 3
+
+
+def test_buttons_without_an_output_stage():
+    show_runner = runner()
+    show_runner.process_command(('/1/brightness', [40]))
+    show_runner.process_command(('/2/push3', [1.0]))
+    assert show_runner.brightness_x == 40
@@ -0,0 +1,53 @@
+from headless_simulator import BLACK, Connection, HeadlessSimulator
+from model import protocol
+
+
+def feed(connection, data, size=3):
+    """Hand data to the connection a few bytes at a time, as recv() might"""
+    for i in range(0, len(data), size):
+        connection.receive(data[i:i + size])
+
+
+def test_ascii_commands_split_across_reads():
+    sim = HeadlessSimulator(num_pixels=10)
+    connection = Connection(None, sim)
+    feed(connection, b"0X\n0D500\n0I128\n03,10,255,100\n")
+    assert sim.frames_completed == [1, 0]
+    assert (sim.delay_time[0], sim.intensity[0]) == (500, 128)
+    assert sim.next[0][3] == (10, 255, 100)
+    assert sim.curr[0][3] == BLACK
+
+    feed(connection, b"0X\n14,1,2,3\n04,5,6,")  # the last command is not finished
+    assert sim.frames_completed == [2, 0]
+    assert sim.curr[0][3] == (10, 255, 100)
+    assert sim.next[1][4] == (1, 2, 3)
+    assert sim.next[0][4] == BLACK
+    feed(connection, b"7\n")
+    assert sim.next[0][4] == (5, 6, 7)
+    assert sim.ignored == 0
+
+
+def test_ascii_junk_is_ignored():
+    sim = HeadlessSimulator(num_pixels=10)
+    feed(Connection(None, sim), b"x\n9X\n0nonsense\n099,1,2,3\n0X\n")
+    assert sim.ignored == 4
+    assert sim.frames_completed == [1, 0]
+
+
+def test_binary_frames_split_across_reads():
+    sim = HeadlessSimulator(num_pixels=10)
+    start = protocol.FLAG_START | protocol.FLAG_DELAY | protocol.FLAG_INTENSITY
+    data = (protocol.encode_sparse(start, 0, 0, 250, 200, [(2, 10, 20, 30)]) +
+            protocol.encode_sparse(start, 0, 1, 250, 200, [(5, 40, 50, 60)]) +
+            protocol.encode_dense(protocol.FLAG_START, 1, 0, 0, 255, bytearray(range(30))) +
+            protocol.encode_sparse(protocol.FLAG_START, 3, 0, 0, 255, []))  # no channel 3
+    feed(Connection(None, sim), bytes(data), size=7)
+
+    assert sim.frames_completed == [2, 1]
+    assert sim.curr[0][2] == (10, 20, 30)
+    assert sim.next[0][5] == (40, 50, 60)
+    assert sim.curr[0][5] == BLACK
+    assert (sim.delay_time[0], sim.intensity[0]) == (250, 200)
+    assert sim.next[1][9] == (27, 28, 29)
+    assert sim.ignored == 1
+    assert sim.bytes_received == len(data)
@@ -0,0 +1,46 @@
+import socket
+import time
+from contextlib import closing
+
+from model.multiplex import MultiplexConnection
+from model.sender import COALESCE, DROP_OLDEST
+
+FRAME = b'x' * (1 << 20)
+
+
+def stalled_mux(policy):
+    """A connection to a consumer that never reads, and the consumer's listening socket"""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    return MultiplexConnection('127.0.0.1', server.getsockname()[1], num_channels=2, max_wait=0,
+                               policy=policy, max_frames=4), server
+
+
+def flood(mux, frames=64):
+    for _ in range(frames):
+        mux.submit(0, FRAME)
+        time.sleep(0.001)
+
+
+def test_pending_frames_are_bounded_when_the_consumer_stalls():
+    for policy in (DROP_OLDEST, COALESCE):
+        mux, server = stalled_mux(policy)
+        with closing(server):
+            flood(mux)
+            stats = mux.stats()
+            assert stats['queued'] <= mux.max_frames
+            assert stats['dropped'] + stats['coalesced'] > 0
+            assert mux.wants_keyframe(0)
+            assert not mux.wants_keyframe(1)
+            mux.stop()
+
+
+def test_keyframe_replaces_the_queue():
+    mux, server = stalled_mux(DROP_OLDEST)
+    with closing(server):
+        flood(mux)
+        mux.submit(0, FRAME, keyframe=True)
+        assert len(mux.pending[0]) == 1
+        assert not mux.wants_keyframe(0)
+        mux.stop()
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from model.artnet import ArtNetModel
+from model.pixelpusher import PixelPusherModel
+from output import COLOR_STATES, OutputStage, hue_table
+from tree import Tree
+
+
+def test_all_colors_is_the_identity():
+    assert hue_table(0).tolist() == list(range(256))
+
+
+@pytest.mark.parametrize('state', [state for state in COLOR_STATES if COLOR_STATES[state]])
+def test_hue_table_wraps_over_the_range(state):
+    start, end = COLOR_STATES[state]
+    hue_range = (end - start) % 256
+    offsets = (hue_table(state).astype(int) - start) % 256  # distance from start, around the wheel
+    assert offsets[0] == 0 and offsets[255] == hue_range  # t[0] == start, t[255] == end
+    assert (offsets <= hue_range).all()
+    assert (np.diff(offsets) >= 0).all()
+
+
+def frame(tree, seed):
+    tree.set_frame(np.random.RandomState(seed).randint(0, 256, (tree.num_pixels, 3)))
+    return tree.frames.next.copy()  # as clamped
+
+
+def test_rgb_models_get_apply_rgb():
+    stage = OutputStage(color_state=2, brightness=80, curve=2.2)
+    model = PixelPusherModel('127.0.0.1')
+    tree = Tree(model)
+    tree.use_output(stage)
+    hsv = frame(tree, 1)
+    tree.go()
+    assert (model.rgb == stage.apply_rgb(hsv)).all()
+    lit = np.flatnonzero(model.led_ids >= 0)
+    assert (model.leds[lit] == model.rgb[model.led_ids[lit]]).all()
+
+    tree.send_intensity(100)
+    tree.go()
+    assert model.intensity == 255  # dimmed once, by the stage
+    assert (model.rgb == stage.apply_rgb(hsv, 100)).all()
+
+
+def test_artnet_gets_apply_rgb():
+    stage = OutputStage(color_state=5, brightness=50, curve='antilog')
+    model = ArtNetModel('127.0.0.1', num_pixels=1212)
+    tree = Tree(model)
+    tree.use_output(stage)
+    hsv = frame(tree, 2)
+    tree.go()
+    assert (model.universes.reshape(-1)[model.channels] == stage.apply_rgb(hsv)).all()
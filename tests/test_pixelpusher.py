@@ -0,0 +1,66 @@
+import socket
+import numpy as np
+from contextlib import closing
+
+from model.pixelpusher import PixelPusherModel, decode_packet, get_reverse_led, strand_ids, PIXELS_PER_STRIP
+from tree import Tree
+
+RED = (0, 255, 255)
+
+
+def test_strand_pairs_leds_as_the_sketch():
+    tree = Tree(None)
+    for trunk in range(tree.num_trunks):
+        ids = strand_ids(tree, trunk)
+        assert len(ids) == 2 * PIXELS_PER_STRIP
+        assert set(ids) - set([None]) <= set(tree.get_pixel(coord).id for coord in tree.all_cells()
+                                             if coord[0] == trunk)
+        assert ids[258] == ids[292]  # reverse_lookup_table: {258, 277, 292, 278}
+        assert ids[0] == ids[807] and ids[403] == ids[56]
+        assert ids[293:298] == [None] * 5  # the table never lights these
+        assert ids[687:714] == [None] * 27
+
+
+def test_reverse_led():
+    assert get_reverse_led(0) == 807
+    assert get_reverse_led(258) == 292
+    assert get_reverse_led(578) == 686
+
+
+def test_udp_stand_in():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    with closing(receiver):
+        receiver.bind(('127.0.0.1', 0))
+        receiver.settimeout(2)
+        model = PixelPusherModel('127.0.0.1', port=receiver.getsockname()[1])
+        cell = strand_ids(Tree(None), 0)[258]
+        model.set_cell(cell, RED)
+        model.go()
+
+        strips = {}
+        for _ in range(model.packets_sent):
+            seq, decoded = decode_packet(receiver.recvfrom(65536)[0])
+            strips.update(decoded)
+
+    assert sorted(strips) == list(range(6))
+    expected = bytearray(3 * PIXELS_PER_STRIP)
+    for led in (258, 292):
+        expected[3 * led:3 * led + 3] = bytearray([255, 0, 0])
+    assert strips[0] == expected
+    for strip in range(1, 6):
+        assert strips[strip] == bytearray(3 * PIXELS_PER_STRIP)
+
+
+def test_set_cells_matches_set_cell():
+    colors = np.random.RandomState(1).randint(0, 256, (1212, 3)).astype(np.uint8)
+    ids = np.random.RandomState(2).permutation(1212)[:600]
+    models = [PixelPusherModel('127.0.0.1', order='grb') for _ in range(2)]
+    for model in models:
+        model.send_intensity(200)
+    for cell in ids.tolist():
+        models[0].set_cell(cell, tuple(colors[cell].tolist()))
+    models[0].go()
+    models[1].set_cells(ids, colors[ids])
+    models[1].go()
+    assert (models[0].leds == models[1].leds).all()
+    assert models[0].leds.any()
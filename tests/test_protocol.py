@@ -0,0 +1,84 @@
+import socket
+import pytest
+from contextlib import closing
+
+from model import protocol
+from model.protocol import FrameDecoder, decode_frame, encode_dense, encode_header, encode_sparse
+from model.simulator import SimulatorModel
+
+FLAGS = protocol.FLAG_START | protocol.FLAG_DELAY | protocol.FLAG_INTENSITY
+PIXELS = [(0, 10, 255, 100), (7, 200, 128, 0), (1211, 254, 0, 255)]
+
+
+def test_sparse_round_trip():
+    frame, end = decode_frame(encode_sparse(FLAGS, 1, 70000, 250, 128, PIXELS))
+    assert frame == (FLAGS, 1, 70000 % 65536, 250, 128, PIXELS)
+    assert end == protocol.sparse_size(len(PIXELS))
+
+
+def test_dense_round_trip():
+    block = bytearray([1, 2, 3, 4, 5, 6])
+    frame, end = decode_frame(encode_dense(FLAGS, 0, 5, 0, 255, block))
+    assert frame.flags == FLAGS | protocol.FLAG_DENSE
+    assert frame.pixels == [(0, 1, 2, 3), (1, 4, 5, 6)]
+    assert end == protocol.dense_size(2)
+
+
+def test_header_only_frame():
+    frame, _ = decode_frame(encode_header(protocol.FLAG_INTENSITY, 0, 3, 0, 40, 0))
+    assert (frame.flags, frame.intensity, frame.pixels) == (protocol.FLAG_INTENSITY, 40, [])
+
+
+def test_decoder_joins_split_feeds():
+    stream = encode_sparse(FLAGS, 0, 1, 0, 255, PIXELS) + encode_dense(FLAGS, 0, 2, 0, 255, bytearray(30))
+    decoder = FrameDecoder()
+    frames = []
+    for i in range(0, len(stream), 5):  # a few bytes at a time, cutting headers and bodies
+        frames.extend(decoder.feed(stream[i:i + 5]))
+    assert [frame.seq for frame in frames] == [1, 2]
+    assert frames[0].pixels == PIXELS
+    assert len(frames[1].pixels) == 10
+    assert decoder.buffer == bytearray()
+
+
+def test_decoder_keeps_a_partial_frame():
+    data = encode_sparse(FLAGS, 0, 1, 0, 255, PIXELS)
+    decoder = FrameDecoder()
+    assert decoder.feed(data[:-1]) == []
+    assert len(decoder.buffer) == len(data) - 1
+    assert decoder.feed(data[-1:])[0].pixels == PIXELS
+
+
+def test_bad_magic():
+    data = encode_sparse(FLAGS, 0, 1, 0, 255, PIXELS)
+    data[0:2] = b'XX'
+    with pytest.raises(ValueError):
+        FrameDecoder().feed(data)
+
+
+def test_simulator_model_to_a_stand_in_server():
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    with closing(server):
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        model = SimulatorModel('127.0.0.1', 0, port=server.getsockname()[1], protocol=protocol.SPARSE)
+        sock, _ = server.accept()
+        with closing(sock):
+            model.set_cell(5, (10, 255, 100))
+            model.go()
+            model.send_delay(0.1)
+            model.flush()
+            model.sock.close()
+
+            decoder = FrameDecoder()
+            frames = []
+            while True:
+                data = sock.recv(4096)
+                if not data:
+                    break
+                frames.extend(decoder.feed(data))
+
+    assert len(frames) == 1
+    assert frames[0].flags & protocol.FLAG_START
+    assert frames[0].delay == 100
+    assert frames[0].pixels == [(5, 10, 255, 100)]
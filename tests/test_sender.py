@@ -0,0 +1,109 @@
+import threading
+import time
+
+from model import protocol
+from model.protocol import FrameDecoder
+from model.sender import FrameSender, BLOCK, COALESCE, DROP_OLDEST
+from model.simulator import SimulatorModel
+
+
+class StalledSocket(object):
+    """Socket whose sendall() waits until released, like a sketch stuck in draw()"""
+    def __init__(self):
+        self.entered = threading.Event()
+        self.released = threading.Event()
+        self.data = []
+
+    def sendall(self, data):
+        self.entered.set()
+        self.released.wait(5)
+        self.data.append(bytes(data))
+
+
+def stalled_sender(policy, max_frames=2):
+    """A sender whose writer is stuck on frame 0"""
+    sock = StalledSocket()
+    sender = FrameSender(sock, policy, max_frames)
+    sender.start()
+    sender.submit(b'0')
+    assert sock.entered.wait(5)
+    return sender, sock
+
+
+def drain(sender, sock, count):
+    sock.released.set()
+    deadline = time.time() + 5
+    while sender.stats()['sent'] < count and time.time() < deadline:
+        time.sleep(0.001)
+    sender.stop()
+    sender.join(5)
+    return sock.data
+
+
+def test_drop_oldest():
+    sender, sock = stalled_sender(DROP_OLDEST)
+    for n in range(1, 7):
+        sender.submit(str(n).encode())
+    stats = sender.stats()
+    assert (stats['queued'], stats['dropped'], stats['coalesced']) == (2, 4, 0)
+    assert sender.wants_keyframe()
+    assert drain(sender, sock, 3) == [b'0', b'5', b'6']
+
+
+def test_coalesce():
+    sender, sock = stalled_sender(COALESCE)
+    for n in range(1, 7):
+        sender.submit(str(n).encode())
+    stats = sender.stats()
+    assert (stats['queued'], stats['dropped'], stats['coalesced']) == (2, 0, 4)
+    assert sender.wants_keyframe()  # full: the next frame should carry every pixel
+
+    sender.submit(b'key', keyframe=True)
+    assert sender.stats()['coalesced'] == 6
+    assert not sender.wants_keyframe()
+    assert drain(sender, sock, 2) == [b'0', b'key']
+
+
+def test_block():
+    sender, sock = stalled_sender(BLOCK, max_frames=1)
+    sender.submit(b'1')
+    producer = threading.Thread(target=sender.submit, args=(b'2',))
+    producer.start()
+    producer.join(0.1)
+    assert producer.is_alive()  # waiting for the writer
+    assert sender.stats()['blocked'] == 1
+
+    data = drain(sender, sock, 3)
+    producer.join(5)
+    assert data == [b'0', b'1', b'2']
+    assert sender.stats()['dropped'] == sender.stats()['coalesced'] == 0
+    assert not sender.wants_keyframe()
+
+
+class StalledModel(SimulatorModel):
+    """SimulatorModel writing to a StalledSocket"""
+    def connect(self):
+        self.sock = StalledSocket()
+
+
+def test_keyframe_after_the_consumer_recovers():
+    model = StalledModel('localhost', 0, protocol=protocol.SPARSE, sender_policy=DROP_OLDEST, max_frames=1)
+
+    def frame(*cells):
+        for cell in cells:
+            model.set_cell(cell, (cell, 255, 100))
+        model.go()
+        model.flush()
+
+    frame(0, 1, 2)
+    assert model.sock.entered.wait(5)
+    frame(3)  # queued
+    frame(4)  # drops the frame with pixel 3
+    frame(5)  # keyframe: every pixel, replacing the queued frame
+    assert model.sender.stats()['dropped'] == 1
+
+    data = drain(model.sender, model.sock, 2)
+    frames = FrameDecoder().feed(b''.join(data))
+    assert len(frames) == 2
+    assert frames[1].flags & protocol.FLAG_DENSE
+    assert frames[1].pixels == [(cell, cell, 255, 100) for cell in range(6)]
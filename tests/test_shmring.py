@@ -0,0 +1,91 @@
+import os
+
+from model.shmring import SharedMemoryModel, RingReader, HEADER, LOCK, default_path, slot_size
+
+RED = (0, 255, 255)
+
+
+def ring(tmp_path, channel=0, num_slots=4, num_pixels=10):
+    return SharedMemoryModel(str(tmp_path / 'frames'), channel, num_slots=num_slots, num_pixels=num_pixels)
+
+
+def publish(model, cell, color=RED):
+    model.set_cell(cell, color)
+    model.go()
+    model.flush()
+
+
+def test_publish_and_read(tmp_path):
+    model = ring(tmp_path, channel=1)
+    reader = RingReader(model.path)
+    assert reader.latest() is None
+    model.send_intensity(100)
+    model.send_delay(0.25)
+    publish(model, 3)
+    number, channel, intensity, delay, hsv = reader.latest()
+    assert (number, channel, intensity, delay) == (1, 1, 100, 250)
+    assert bytearray(hsv[9:12]) == bytearray(RED)
+    assert bytearray(hsv[:9]) == bytearray(9)
+
+
+def test_nothing_new_is_not_published(tmp_path):
+    model = ring(tmp_path)
+    publish(model, 0)
+    model.flush()
+    assert model.published == 1
+
+
+def test_next_frame_counts_missed_frames(tmp_path):
+    model = ring(tmp_path)
+    reader = RingReader(model.path)
+    publish(model, 0)
+    assert reader.next_frame()[0] == 1
+    assert reader.next_frame() is None
+    for cell in range(1, 7):
+        publish(model, cell)
+    # 6 new frames in a 4 slot ring: frames 2 and 3 were overwritten
+    assert [reader.next_frame()[0] for _ in range(4)] == [4, 5, 6, 7]
+    assert reader.missed == 2
+    assert reader.read(2) is None
+
+
+def test_read_retries_while_the_writer_holds_the_slot(tmp_path):
+    model = ring(tmp_path)
+    reader = RingReader(model.path)
+    publish(model, 0)
+    offset = HEADER.size + (1 % model.num_slots) * slot_size(model.num_pixels)
+    lock = LOCK.unpack_from(model.map, offset)[0]
+    assert lock % 2 == 0
+
+    LOCK.pack_into(model.map, offset, lock + 1)  # the writer is inside the slot
+    assert reader.read(1, tries=5) is None
+    assert reader.retries == 5
+
+    LOCK.pack_into(model.map, offset, lock + 2)
+    assert reader.read(1)[0] == 1
+
+
+def test_channels_get_their_own_ring():
+    assert default_path(0) != default_path(1)
+    assert os.path.dirname(default_path(0)) == os.path.dirname(default_path(1))
+
+
+def test_reopening_keeps_the_ring(tmp_path):
+    model = ring(tmp_path)
+    reader = RingReader(model.path)
+    publish(model, 2)
+    model.close()
+
+    again = ring(tmp_path)
+    assert reader.latest()[0] == 1  # not truncated under the reader
+    publish(again, 4)
+    assert reader.next_frame()[0] == 1
+    assert reader.next_frame()[0] == 2
+
+
+def test_reopening_with_another_shape_starts_over(tmp_path):
+    publish(ring(tmp_path), 2)
+    model = ring(tmp_path, num_pixels=20)
+    reader = RingReader(model.path)
+    assert reader.num_pixels == 20
+    assert reader.latest() is None
@@ -0,0 +1,27 @@
+import pytest
+
+from shows import check_render, load_shows, RENDER_TOLERANCE
+from tree import Tree
+
+RENDER_SHOWS = ('Radar', 'Ring', 'Crosshair', 'Pulse2', 'BackForth', 'Light_One_Up')
+
+
+@pytest.mark.parametrize('name', RENDER_SHOWS)
+def test_render_matches_next_frame(name):
+    ctor = dict(load_shows())[name]
+    assert hasattr(ctor, 'render')
+    for seed in (0, 1, 2):
+        assert check_render(ctor, Tree(None), frames=40, seed=seed) <= RENDER_TOLERANCE
+
+
+def test_sparkles_examine_only_touched_pixels():
+    tree = Tree(None)
+    ctor = dict(load_shows())['Sparkles']
+    frames = ctor(tree).next_frame()
+    next(frames)
+    tree.frames.update(tree.frames.changed())  # the first frame blacks out the whole tree
+    tree.reset_stats()
+    for _ in range(50):
+        next(frames)
+        tree.frames.update(tree.frames.changed())
+    assert tree.stats()['examined'] < 50 * tree.num_pixels // 4
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from HelperFunctions import ShapeTables, calc_packet, calc_packets, smooth_interpolation, min_dim, min_dims, \
+    lut_packet, lut_packets, lut_smooth, lut_smooths, lut_min_dim, lut_min_dims, packet_error, smooth_error, \
+    PACKET_ERROR, SMOOTH_ERROR, MIN_DIM_ERROR
+
+X = np.concatenate([np.linspace(-0.5, 1.5, 20001), np.random.RandomState(0).uniform(0.0, 1.0, 20000)])
+
+
+@pytest.mark.parametrize('fract_x', [0.0, 0.1, 0.5, 0.6, 0.8, 1.0])
+@pytest.mark.parametrize('smooth', [True, False])
+def test_packets_within_bound(fract_x, smooth):
+    exact = calc_packets(X, 1.0, fract_x, smooth)
+    assert np.max(np.abs(lut_packets(X, 1.0, fract_x, smooth) - exact)) <= PACKET_ERROR
+    for (x, value) in zip(X[::50].tolist(), exact[::50].tolist()):
+        assert calc_packet(x, 1.0, fract_x, smooth) == value
+        assert abs(lut_packet(x, 1.0, fract_x, smooth) - value) <= PACKET_ERROR
+
+
+def test_packets_scale_with_max_x():
+    two_pi = 2 * np.pi
+    x = X * two_pi
+    assert np.max(np.abs(lut_packets(x, two_pi, 0.5) - calc_packets(x, two_pi, 0.5))) <= PACKET_ERROR
+
+
+def test_smooth_within_bound():
+    x = X[(X >= 0.0) & (X <= 1.0)]
+    assert np.max(np.abs(lut_smooths(x) - np.sin(x * np.pi * 0.5))) <= SMOOTH_ERROR
+    for value in x[::50].tolist():
+        assert abs(lut_smooth(value) - smooth_interpolation(value)) <= SMOOTH_ERROR
+
+
+def test_min_dim_exact():
+    values = np.arange(256)
+    assert np.max(np.abs(lut_min_dims(values) - min_dims(values))) <= MIN_DIM_ERROR
+    assert all(lut_min_dim(value) == min_dim(value) for value in range(256))
+
+
+@pytest.mark.parametrize('resolution', [402, 1024, 4096])
+def test_error_within_documented_bound(resolution):
+    errors = ShapeTables(resolution).error(samples=20001)
+    assert errors['packet'] <= packet_error(resolution) == 1
+    assert errors['linear_packet'] <= 1
+    assert errors['smooth'] <= smooth_error(resolution)
+    assert errors['min_dim'] == 0
@@ -0,0 +1,86 @@
+import numpy as np
+
+from pixel import PixelFrames
+
+
+def frames_at(color, num_pixels=4, **tolerance):
+    """Frames whose current and next colors are all color, with a tolerance"""
+    frames = PixelFrames(num_pixels)
+    frames.set_all(color)
+    step(frames)
+    frames.set_tolerance(**tolerance)
+    frames.reset_stats()
+    return frames
+
+
+def step(frames):
+    """One send: the ids sent, made current"""
+    ids = frames.changed()
+    frames.update(ids)
+    return ids.tolist()
+
+
+def test_no_tolerance_sends_every_change():
+    frames = frames_at((100, 255, 100), hue=2)
+    frames.set_tolerance()
+    frames.set_next(0, (101, 255, 100))
+    assert step(frames) == [0]
+
+
+def test_hues_wrap_at_256():
+    for tolerance, sent in ((dict(value=5), [0, 1]), (dict(hue=1), [1])):
+        frames = frames_at((0, 255, 100), num_pixels=2, **tolerance)
+        frames.curr[:, 0] = 255  # as packed colors can hold it
+        frames.set_next(0, (0, 255, 100))  # one step around the wheel
+        frames.set_next(1, (1, 255, 100))  # two steps
+        assert step(frames) == sent
+
+
+def test_held_changes_are_sent_within_max_hold():
+    frames = frames_at((100, 255, 100), value=4, max_hold=3)
+    frames.set_next(0, (100, 255, 102))
+    assert step(frames) == []
+    assert step(frames) == []
+    assert step(frames) == [0]
+    assert (frames.curr == frames.next).all()
+    assert step(frames) == []
+
+
+def test_held_change_replaced_by_a_bigger_one():
+    frames = frames_at((100, 255, 100), value=4)
+    frames.set_next(0, (100, 255, 102))
+    assert step(frames) == []
+    frames.set_next(0, (100, 255, 110))
+    assert step(frames) == [0]
+
+
+def test_forced_pixels_are_sent():
+    frames = frames_at((100, 255, 100), value=4)
+    frames.set_curr(0, (100, 255, 101))
+    assert step(frames) == [0]
+    assert frames.curr[0].tolist() == [100, 255, 100]
+
+
+def test_gamma_compares_values_as_shown():
+    dim, bright = (100, 255, 10), (100, 255, 200)
+    for gamma, sent in ((None, [0, 1]), (2.2, [1])):
+        frames = frames_at(dim, num_pixels=2, value=2, gamma=gamma)
+        frames.set_next(0, (100, 255, 14))  # 4 counts, but both nearly off on the LEDs
+        frames.curr[1] = bright
+        frames.set_next(1, (100, 255, 204))
+        assert step(frames) == sent
+
+
+def test_stats_count_held_changes():
+    frames = frames_at((100, 255, 100), num_pixels=4, hue=3, value=4, max_hold=10)
+    frames.set_next(0, (102, 255, 100))
+    frames.set_next(1, (100, 255, 103))
+    frames.set_next(2, (100, 255, 120))
+    assert step(frames) == [2]
+    stats = frames.stats()
+    assert stats['suppressed'] == 2
+    assert stats['max_error'] == 3
+    assert stats['sent'] == 1
+    assert stats['examined'] == 3
+    frames.reset_stats()
+    assert frames.stats() == {'frames': 0, 'examined': 0, 'sent': 0, 'suppressed': 0, 'max_error': 0}
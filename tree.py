@@ -2,10 +2,12 @@
 Model to communicate with a Tree simulator over a TCP socket
 
 """
+import numpy as np
 from color import gradient_wheel
-from random import choice, randint
-from math import sin, cos, pi
-from pixel import Pixel
+import randoms
+from geometry import load_geometry, Columns
+from pixel import Pixel, PixelFrames, BLACK, FORCED_BLACK
+from model.delta import DeltaEncoder
 
 """
 July 2019 Changes
@@ -19,8 +21,8 @@ Parameters for each Tree: (X, Y)
 """
 
 
-def load_tree(model):
-    return Tree(model)
+def load_tree(model, geometry=None):
+    return Tree(model, geometry)
 
 
 class Tree(object):
@@ -37,25 +39,29 @@ class Tree(object):
     Frames are hash tables where keys are (r,p,d) coordinates
     and values are (r,g,b) colors
     """
-    def __init__(self, model):
-        """Most below are pseudo-global variable for one-time Tree coordinate determination"""
-        # Initial starting coordinate
-        self.x = 12250
-        self.y = 10007
-        self.pixel = 0
-        self.angle = 0  # Initial start angle, in radians
-        self.cellmap = {}  # dictionary of { coord: pixel object }
+    def __init__(self, model, geometry=None):
+        """Geometry is shared by every Tree of the same layout; frames belong to this Tree"""
+        self.geometry = geometry or load_geometry()
 
         # Constants
-        self.NUMBER_TRUNKS = 3
-        self.MAX_GENERATIONS = 3
-        self.NUMBER_BRANCHES = 2
-        self.PIXEL_SIZE = 100  # For scaling the coordinate space
-
-        self._grow_tree()
-        # print([(pixel.id, coord) for coord, pixel in self.cellmap.items()])
+        self.NUMBER_TRUNKS = self.geometry.num_trunks  # of all the trees
+        self.MAX_GENERATIONS = self.geometry.constants['max_generations']
+        self.NUMBER_BRANCHES = self.geometry.constants['num_branches']
+        self.PIXEL_SIZE = self.geometry.constants['pixel_size']  # For scaling the coordinate space
+
+        self.columns = self.geometry.columns  # Columns of pixel geometry
+        self.topology = self.geometry.topology  # Topology of pixel connections
+        self.frames = PixelFrames(self.geometry.num_pixels)  # curr + next hsv arrays backing every Pixel
+        self.pixels = self._make_pixels()  # pixel objects in id order
+        self.cellmap = dict((pixel.coord, pixel) for pixel in self.pixels)  # dictionary of { coord: pixel object }
+        self.coords = [pixel.coord for pixel in self.pixels]  # coordinates in id order, for sampling
 
         self.model = model
+        self.encoder = None  # DeltaEncoder when sending runs of pixels
+        self.output = None  # OutputStage between the frames and the model
+        self.output_version = None  # version of the output stage the model has seen
+        self.output_intensity = False  # apply the channel intensity in the output stage
+        self.intensity = 255
 
     def __repr__(self):
         return "Tree: {} pixels".format(self.num_pixels)
@@ -101,8 +107,15 @@ class Tree(object):
 
     def set_all_cells(self, color):
         """Set all cells to color hsv"""
-        for pixel in self.all_pixels():
-            pixel.set_next_frame(color)
+        self.frames.set_all(color)
+
+    def set_frame(self, hsv):
+        """Set every pixel from a (num_pixels, 3) hsv array in pixel id order"""
+        self.frames.set_frame(hsv)
+
+    def set_ids(self, ids, hsv):
+        """Set the pixels of an array of ids, each id once, to an (n, 3) hsv array"""
+        self.frames.set_ids(ids, hsv)
 
     def black_cell(self, coord):
         """Blacken the pixel at coord"""
@@ -111,106 +124,147 @@ class Tree(object):
 
     def black_all_cells(self):
         """Blacken all pixels"""
-        for pixel in self.all_pixels():
-            pixel.set_black()
+        self.frames.set_all(BLACK)
 
     def clear(self):
         """Force all cells to black"""
-        for pixel in self.all_pixels():
-            pixel.force_black()
+        self.frames.force_all(FORCED_BLACK)
+        self.frames.set_all(BLACK)
         self.go()
+        self.flush()
 
     #
     # Sending messages to the model: delay, intensity, frame
+    # Models buffer these until flush() is called at the end of the frame
     #
     def go(self):
         """Push the frame to the model"""
         self.send_frame()
         self.model.go()
 
+    def flush(self):
+        """Send everything buffered for this frame to the model in one write"""
+        self.model.flush()
+
     def send_delay(self, delay):
         """Send the delay signal"""
         self.model.send_delay(delay)
 
     def send_intensity(self, intensity):
-        """Send the intensity signal"""
-        self.model.send_intensity(intensity)
+        """Send the intensity signal. Models sent rgb are dimmed by the output stage instead"""
+        if (self.output_intensity or self.sends_rgb()) and intensity != self.intensity:
+            self.frames.resend_all()
+        self.intensity = intensity
+        if not self.sends_rgb():
+            self.model.send_intensity(intensity)
+
+    def use_output(self, stage, intensity=False):
+        """Adjust every color sent to the model with an OutputStage (None: send colors as they are).
+           With intensity, the stage also dims by the channel intensity, for models that don't.
+           Models with set_rgb_cells() always get the stage's rgb, dimmed by the stage"""
+        self.output = stage
+        self.output_version = None
+        self.output_intensity = intensity
+        if hasattr(self.model, 'set_rgb_cells'):
+            self.model.send_intensity(255 if stage is not None else self.intensity)  # dim in one place only
+        self.frames.resend_all()
+
+    def shown(self, colors):
+        """The (n, 3) uint8 hsv colors as the output stage makes them"""
+        if self.output is None:
+            return colors
+        return self.output.apply(colors, self.intensity if self.output_intensity else 255)
+
+    def sends_rgb(self):
+        """True if the output stage hands the model rgb colors (see OutputStage.apply_rgb)"""
+        return self.output is not None and hasattr(self.model, 'set_rgb_cells')
 
     def send_frame(self):
-        """If a pixel has changed, send its coord + color, then update the pixel's frame"""
-        for pixel in self.all_pixels():
-            if pixel.has_changed():
-                self.model.set_cell(pixel.id, pixel.get_next_color())
-                pixel.update_frame()
+        """If a pixel has changed, send its coord + color, then update the pixel's frame.
+           Colors go through the output stage, if there is one.
+           Models with set_cells() get the ids and uint8 colors as arrays,
+           models with set_rgb_cells() the rgb colors of the output stage"""
+        if self.output is not None and self.output.version != self.output_version:
+            self.output_version = self.output.version
+            self.frames.resend_all()  # the whole tree changes its look
+
+        if self.encoder:
+            self.send_runs()
+            return
+
+        if self.sends_rgb():
+            ids = self.frames.changed()
+            if len(ids):
+                self.model.set_rgb_cells(ids, self.output.apply_rgb(self.frames.next[ids], self.intensity))
+                self.frames.update(ids)
+            return
+
+        set_cells = getattr(self.model, 'set_cells', None)
+        if set_cells:
+            ids = self.frames.changed()
+            if len(ids):
+                set_cells(ids, self.shown(self.frames.next[ids]))
+                self.frames.update(ids)
+            return
+
+        for (cell, color) in self.changes():
+            self.model.set_cell(cell, color)
+
+    def changes(self):
+        """List the changed pixels as (id, hsv) and make their next frame current"""
+        ids = self.frames.changed()
+        colors = self.shown(self.frames.next[ids]).tolist()
+        self.frames.update(ids)
+        return [(cell, tuple(color)) for (cell, color) in zip(ids.tolist(), colors)]
+
+    def set_tolerance(self, hue=0, sat=0, value=0, max_hold=10, gamma=None):
+        """Don't send changes of at most hue, sat and value counts until they add up
+           or have waited max_hold frames (see PixelFrames.set_tolerance). All zero: send every change"""
+        self.frames.set_tolerance(hue, sat, value, max_hold, gamma)
+
+    def stats(self):
+        """Pixels examined for changes against pixels sent, since the last reset_stats()"""
+        return self.frames.stats()
+
+    def reset_stats(self):
+        self.frames.reset_stats()
+
+    def use_runs(self, enable=True):
+        """Send changes as (start, count, color) runs of consecutive pixels"""
+        self.encoder = DeltaEncoder() if enable else None
+
+    def send_runs(self):
+        """Group the changed pixels into runs. Models without set_run get single pixels"""
+        changes = self.changes()
+
+        set_run = getattr(self.model, 'set_run', None)
+        sent_as_runs = set_run is not None and getattr(self.model, 'sends_runs', lambda: True)()
+        for (start, count, color) in self.encoder.encode(changes, sent_as_runs):
+            if set_run:
+                set_run(start, count, color)
+            else:
+                for cell in range(start, start + count):
+                    self.model.set_cell(cell, color)
 
     #
     # Setting up the Tree
     #
-    def _grow_tree(self):
-        """One-time function call to set up tree pixel coordinates"""
-        generation = 0
-        coord = []
-
-        # Rotate and draw each trunk
-        for trunk in range(self.NUMBER_TRUNKS):
-            self.angle += (2 * pi / self.NUMBER_TRUNKS)
-
-            old_x, old_y = self.x, self.y  # push matrix
-            old_angle = self.angle
-
-            self.draw_pixel_line(coord + [trunk], generation)
-            self.draw_branch(coord + [trunk], generation + 1)
-
-            self.x, self.y = old_x, old_y  # pop matrix
-            self.angle = old_angle
-
-    def draw_branch(self, coord, gen):
-        if gen > self.MAX_GENERATIONS:
-            return  # end recursion
-        self.angle += pi + ((2 * pi / self.NUMBER_BRANCHES + 1) / 2)  # Trial and error
-
-        for branch in range(self.NUMBER_BRANCHES):
-            old_x, old_y = self.x, self.y
-            old_angle = self.angle
-
-            self.draw_pixel_line(coord + [branch], gen)  # push matrix
-            self.draw_branch(coord + [branch], gen + 1)  # further recursion
-
-            self.x, self.y = old_x, old_y  # pop matrix
-            self.angle = old_angle
-
-            self.angle += (2 * pi / 3)
+    def _make_pixels(self):
+        """One Pixel object per id: geometry from the shared columns, colors from this Tree's frames"""
+        columns = [column.tolist() for column in self.columns]
+        return [Pixel(coord, id, frames=self.frames, **dict(zip(Columns._fields, values)))
+                for (id, (coord, values)) in enumerate(zip(self.geometry.coords, zip(*columns)))]
 
     def get_branch_length(self, generation):
         return self.get_generation_length(generation) * self.PIXEL_SIZE
 
-    def draw_pixel_line(self, coord, gen):
-        """Draw a line of pixels, length determined by generation"""
-        gen_length = self.get_generation_length(gen)
-        for i in range(gen_length):
-            self.drop_pixel(coord=coord + [i], i=i, gen=gen, fraction=float(i)/gen_length)
-            self.move(self.PIXEL_SIZE)
-
-    @staticmethod
-    def get_generation_length(generation):
-        return [56, 38, 28, 20][generation]
-
-    def move(self, distance):
-        # Move (x,y) distance in the direction of angle
-        self.x += (distance * sin(self.angle))
-        self.y += (distance * cos(self.angle))
-
-    def drop_pixel(self, coord, i, gen, fraction):
-        """Record the current pixel's coordinate as (float x, float y)"""
-        self.cellmap[tuple(coord)] = Pixel(coord=tuple(coord),
-                                           id=len(self.cellmap),
-                                           number=i,
-                                           gen=gen,
-                                           fract=fraction,
-                                           x=self.x,
-                                           y=self.y
-                                      )
-        self.pixel += 1
+    def get_generation_length(self, generation):
+        return self.geometry.generation_lengths[generation]
+
+    @property
+    def topology_lists(self):
+        """The topology as plain lists, for walkers that step one pixel at a time"""
+        return self.geometry.topology_lists
 
     @property
     def num_trunks(self):
@@ -230,4 +284,15 @@ class Tree(object):
 
     def rand_cell(self):
         """Pick a random coordinate"""
-        return choice(self.cellmap.keys())
+        return randoms.choice(self.coords)
+
+    def rand_cells(self, n, replace=True, unlit=False):
+        """Pick n random coordinates. Without replace, no coordinate twice;
+           with unlit, only from pixels that are black in the next frame"""
+        return [self.coords[id] for id in self.rand_ids(n, replace, unlit).tolist()]
+
+    def rand_ids(self, n, replace=True, unlit=False):
+        """Array of n random pixel ids, as rand_cells"""
+        if unlit:
+            return randoms.sample(np.flatnonzero(self.frames.next[:, 2] == 0), n, replace)
+        return randoms.sample(self.num_pixels, n, replace)
@@ -1,5 +1,8 @@
-import collections
 import functools
+try:
+    from collections.abc import Hashable
+except ImportError:  # Python 2
+    from collections import Hashable
 
 # https://wiki.python.org/moin/PythonDecoratorLibrary#Memoize
 class memoized(object):
@@ -13,7 +16,7 @@ class memoized(object):
         self.cache = {}
 
     def __call__(self, *args):
-        if not isinstance(args, collections.Hashable):
+        if not isinstance(args, Hashable):
             # uncacheable. a list, for instance.
             # better to not cache than blow up.
             return self.func(*args)
@@ -54,5 +57,5 @@ def get_hostname(default=None):
         import socket
         name = socket.gethostname()
         return name.split('.')[0]
-    except Exception, e:
+    except Exception:
         return default